@@ -0,0 +1,544 @@
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import proekt
+from proekt import (HORDE_BUDGET, HORDE_LEVEL, NET_PORT, REPLAY_DIR, SCREEN_HEIGHT, SCREEN_WIDTH, TICK, TICK_RATE, Enemy,
+                    NetClient, NetHost, NetLink, ParticleSystem, PhaseTimer, ProjectilePool, Replica, ReplayPlayer, RoomServer,
+                    Simulation, SpatialHash, Wall, WallGrid)
+
+def make_world(n, seed):
+    rng = random.Random(seed)
+    side = int((n * 1200 * 800 / 500) ** 0.5)
+    enemies = [Enemy(rng.uniform(0, side), rng.uniform(0, side), (255,0,0,255), rng.choice(["normal", "shooter"])) for _ in range(n)]
+    bullets = [(rng.uniform(0, side), rng.uniform(0, side)) for _ in range(n)]
+    return enemies, bullets
+
+def bullet_hitbox(x, y, size=16):
+    return (x - size//2, x + size//2, y - size//2, y + size//2)
+
+def brute_hits(enemies, bullets):
+    hits = []
+    for x, y in bullets:
+        for i, enemy in enumerate(enemies):
+            bx1, bx2, by1, by2 = bullet_hitbox(x, y)
+            ex1, ex2, ey1, ey2 = enemy.get_hitbox()
+            if (bx1 < ex2 and bx2 > ex1 and by1 < ey2 and by2 > ey1):
+                hits.append(i)
+                break
+    return hits
+
+def hash_hits(enemies, bullets, grid):
+    hits = []
+    grid.build(enemies)
+    for x, y in bullets:
+        bx1, bx2, by1, by2 = bullet_hitbox(x, y)
+        for i in grid.query(bx1, bx2, by1, by2):
+            ex1, ex2, ey1, ey2 = enemies[i].get_hitbox()
+            if (bx1 < ex2 and bx2 > ex1 and by1 < ey2 and by2 > ey1):
+                hits.append(i)
+                break
+    return hits
+
+def timed(fn, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def bench_broadphase(sizes=(125, 250, 500, 1000), seed=1):
+    print("bullets/enemies   brute ms   hash ms   hash us/bullet")
+    grid = SpatialHash()
+    for n in sizes:
+        enemies, bullets = make_world(n, seed)
+        brute_t, brute = timed(brute_hits, enemies, bullets, repeat=1 if n > 500 else 3)
+        hash_t, hashed = timed(hash_hits, enemies, bullets, grid)
+        assert brute == hashed
+        print(f"{n:>15}   {brute_t*1000:>8.2f}   {hash_t*1000:>7.2f}   {hash_t/n*1e6:>14.2f}")
+
+def make_walls(seed):
+    rng = random.Random(seed)
+    walls = [Wall(600, 30, 1200, 40), Wall(600, 770, 1200, 40), Wall(30, 400, 40, 800), Wall(1170, 400, 40, 800)]
+    for _ in range(14):
+        if rng.random() < 0.5:
+            walls.append(Wall(rng.randint(100, 1100), rng.randint(100, 700), 20, rng.randint(100, 400)))
+        else:
+            walls.append(Wall(rng.randint(100, 1100), rng.randint(100, 700), rng.randint(100, 400), 20))
+    return walls
+
+def random_walls(rng, count, width, height):
+    walls = []
+    for _ in range(count):
+        w, h = rng.choice([(20, rng.uniform(20, 400)), (rng.uniform(20, 400), 20), (rng.uniform(5, 80), rng.uniform(5, 80))])
+        x, y = rng.uniform(0, width), rng.uniform(0, height)
+        walls.append(Wall(x, y, w, h) if rng.random() < 0.5 else Wall(int(x), int(y), int(w), int(h)))
+    return walls
+
+def bench_walls(counts=(18, 64, 65, 400, 1000), points=20000, seed=1):
+    print("walls  points  hits   brute ms  collide ms  collide_many ms")
+    rng = random.Random(seed)
+    for count in counts:
+        width, height = 1200 * max(1, count // 100), 800 * max(1, count // 100)
+        walls = random_walls(rng, count, width, height)
+        grid = WallGrid(walls, 50, width, height)
+        xs = np.array([rng.uniform(-50, width + 50) for _ in range(points)])
+        ys = np.array([rng.uniform(-50, height + 50) for _ in range(points)])
+        sizes = np.array([rng.choice([1, 8, 16, 32, 33, 64, 200]) for _ in range(points)], dtype=np.int64)
+        args = list(zip(xs.tolist(), ys.tolist(), sizes.tolist()))
+        brute_t, brute = timed(lambda: [any(w.check_collide(x, y, s, s) for w in walls) for x, y, s in args], repeat=1)
+        single_t, single = timed(lambda: [grid.collide(x, y, s, s) for x, y, s in args], repeat=1)
+        many_t, many = timed(grid.collide_many, xs, ys, sizes)
+        assert single == brute, f"WallGrid.collide differs from Wall.check_collide with {count} walls"
+        assert many.tolist() == brute, f"WallGrid.collide_many differs from Wall.check_collide with {count} walls"
+        print(f"{count:>5}  {points:>6}  {sum(brute):>5}  {brute_t*1000:>8.0f}  {single_t*1000:>10.1f}  {many_t*1000:>15.2f}")
+
+def spawn_projectiles(pool, rng, count):
+    for _ in range(count):
+        x, y = rng.uniform(60, SCREEN_WIDTH - 60), rng.uniform(60, SCREEN_HEIGHT - 60)
+        if rng.random() < 0.5:
+            pool.fire_player(x, y, x + rng.uniform(-1, 1), y + rng.uniform(-1, 1))
+        else:
+            pool.fire_enemy(x, y, x + rng.uniform(-1, 1), y + rng.uniform(-1, 1))
+
+def bench_projectiles(sizes=(1000, 5000, 20000), ticks=120, seed=1):
+    print("projectiles   ms/tick   60 FPS budget")
+    grid = WallGrid(make_walls(seed))
+    for n in sizes:
+        rng = random.Random(seed)
+        pool = ProjectilePool(capacity=n)
+        spawn_projectiles(pool, rng, n)
+        total = 0
+        for _ in range(ticks):
+            start = time.perf_counter()
+            pool.step(grid)
+            pool.retire()
+            total += time.perf_counter() - start
+            spawn_projectiles(pool, rng, pool.free_count)
+        ms = total / ticks * 1000
+        print(f"{n:>11}   {ms:>7.3f}   {ms / (1000 / 60) * 100:>12.1f}%")
+
+def bench_particles(sizes=(1000, 10000, 50000), ticks=120, seed=1):
+    print("particles   ms/tick   60 FPS budget")
+    for n in sizes:
+        particles = ParticleSystem(capacity=n, seed=seed)
+        burst = max(1, n // 20)
+        total = 0
+        for _ in range(ticks):
+            start = time.perf_counter()
+            particles.emit(600, 400, (0,255,0,255), burst)
+            particles.update()
+            particles.vertices()
+            total += time.perf_counter() - start
+        ms = total / ticks * 1000
+        print(f"{n:>9}   {ms:>7.3f}   {ms / (1000 / 60) * 100:>12.1f}%")
+
+SCENARIOS = [
+    ("level1", 1, 0),
+    ("level2", 2, 0),
+    ("level3", 3, 0),
+    ("level3+50", 3, 50),
+    ("level3+150", 3, 150),
+]
+
+class ScriptedPlayer:
+    def __init__(self, seed, invulnerable=True):
+        self.rng = random.Random(seed)
+        self.invulnerable = invulnerable
+    
+    def drive(self, sim, tick):
+        if self.invulnerable:
+            sim.damage_cooldown = 2
+        if tick % 45 == 0:
+            sim.keys = [self.rng.random() < 0.3 for _ in range(4)]
+        targets = [e for e in sim.enemies if e.alive]
+        if targets:
+            target = min(targets, key=lambda e: (e.x - sim.player.x) ** 2 + (e.y - sim.player.y) ** 2)
+            sim.fire(target.x + self.rng.uniform(-20, 20), target.y + self.rng.uniform(-20, 20))
+
+def populate(sim, extra, rng):
+    attempts = 0
+    added = 0
+    while added < extra and attempts < extra * 50:
+        attempts += 1
+        x, y = rng.randint(60, SCREEN_WIDTH - 60), rng.randint(60, SCREEN_HEIGHT - 60)
+        if sim.try_spawn_enemy(x, y, rng.choice(["normal", "shooter"])):
+            added += 1
+
+def make_sim(level, extra, seed):
+    random.seed(seed)
+    sim = Simulation(level)
+    sim.particles.rng = np.random.default_rng(seed)
+    populate(sim, extra, random.Random(seed))
+    return sim
+
+def enemy_state(sim):
+    if sim.enemy_system and sim.enemy_system.source is sim.enemies:
+        sim.enemy_system.store(sim.enemies)
+    pool = sim.projectiles
+    live = np.flatnonzero(pool.active)
+    return ([(e.x, e.y, e.alive, e.health, e.move_timer, e.attack_timer, e.shoot_timer, e.last_player_pos, e.move_dir,
+              e.current_patrol, e.is_moving) for e in sim.enemies],
+            (sim.player.x, sim.player.y, sim.player.health, sim.kills, sim.game_over, sim.win),
+            (pool.x[live].tolist(), pool.y[live].tolist(), pool.owner[live].tolist()))
+
+def trace(level, extra, batched, ticks, seed):
+    sim = make_sim(level, extra, seed)
+    if not batched:
+        sim.enemy_system = None
+    script = ScriptedPlayer(seed)
+    restarts = 0
+    for tick in range(ticks):
+        if sim.game_over or sim.win:
+            sim.restart()
+            populate(sim, extra, random.Random(seed + restarts))
+            restarts += 1
+        script.drive(sim, tick)
+        sim.step()
+        yield enemy_state(sim)
+
+def bench_equivalence(scenarios=(("level1+40", 1, 40), ("level3+50", 3, 50), ("level3+150", 3, 150), ("level2", 2, 0)),
+                      ticks=600, seed=1):
+    minimum = proekt.BATCHED_AI_MIN
+    proekt.BATCHED_AI_MIN = 0
+    try:
+        for name, level, extra in scenarios:
+            single = list(trace(level, extra, False, ticks, seed))
+            for tick, (a, b) in enumerate(zip(single, trace(level, extra, True, ticks, seed))):
+                assert a == b, f"{name}: EnemySystem diverges from Enemy.update at tick {tick}"
+            print(f"{name:<11} {ticks} ticks, {len(single[-1][0])} enemies: identical")
+    finally:
+        proekt.BATCHED_AI_MIN = minimum
+
+def bench_levels(scenarios=SCENARIOS, ticks=1200, seed=1):
+    for name, level, extra in scenarios:
+        sim = make_sim(level, extra, seed)
+        script = ScriptedPlayer(seed)
+        sim.timer = PhaseTimer()
+        restarts = 0
+        elapsed = 0
+        for tick in range(ticks):
+            if sim.game_over or sim.win:
+                sim.restart()
+                populate(sim, extra, random.Random(seed + restarts))
+                restarts += 1
+            script.drive(sim, tick)
+            start = time.perf_counter()
+            sim.step()
+            elapsed += time.perf_counter() - start
+        phases = "  ".join(f"{phase} {t / ticks * 1e6:.0f}us" for phase, t in sim.timer.totals.items())
+        alive = len([e for e in sim.enemies if e.alive])
+        print(f"{name:<11} alive {alive:>4}  {ticks / elapsed:>8.0f} ticks/s  restarts {restarts:>2}  {phases}")
+
+def make_big_level(path, screens, enemies_per_screen=25, seed=1):
+    rng = random.Random(seed)
+    width, height = SCREEN_WIDTH * screens, SCREEN_HEIGHT * screens
+    walls = [[width // 2, 20, width, 40], [width // 2, height - 20, width, 40],
+             [20, height // 2, 40, height], [width - 20, height // 2, 40, height]]
+    for x in range(200, width - 200, 400):
+        for y in range(200, height - 200, 400):
+            if rng.random() < 0.6:
+                walls.append([x, y, 20, rng.choice([100, 200, 300])] if rng.random() < 0.5 else [x, y, rng.choice([100, 200, 300]), 20])
+    enemies = [[rng.randint(60, width - 60), rng.randint(60, height - 60), rng.choice(["normal", "shooter"])]
+               for _ in range(enemies_per_screen * screens * screens)]
+    with open(path, "w") as f:
+        json.dump({"width": width, "height": height, "background": [20, 20, 40],
+                   "player": [width // 2, height // 2], "walls": walls, "enemies": enemies}, f)
+
+def bench_bigmap(sizes=(1, 4, 8, 16), ticks=600, seed=1):
+    with tempfile.TemporaryDirectory() as directory:
+        for screens in sizes:
+            path = os.path.join(directory, f"big{screens}.json")
+            make_big_level(path, screens, seed=seed)
+            random.seed(seed)
+            start = time.perf_counter()
+            sim = Simulation(path)
+            load = time.perf_counter() - start
+            sim.particles.rng = np.random.default_rng(seed)
+            script = ScriptedPlayer(seed)
+            sim.timer = PhaseTimer()
+            awake = 0
+            ran = 0
+            elapsed = 0
+            for tick in range(ticks):
+                script.drive(sim, tick)
+                start = time.perf_counter()
+                sim.step()
+                elapsed += time.perf_counter() - start
+                awake += len(sim.awake)
+                ran += sim.scheduler.ran
+            phases = "  ".join(f"{phase} {t / ticks * 1e6:.0f}us" for phase, t in sim.timer.totals.items())
+            print(f"{screens:>2}x{screens:<2} screens  enemies {len(sim.enemies):>5}  awake {awake / ticks:>4.0f}  ran {ran / ticks:>4.0f}  "
+                  f"load {load * 1e3:>6.0f}ms  {ticks / elapsed:>6.0f} ticks/s  {phases}")
+
+def bench_replays(directory=REPLAY_DIR):
+    paths = sorted(name for name in os.listdir(directory) if name.endswith(".rpl")) if os.path.isdir(directory) else []
+    if not paths:
+        print(f"no replays in {directory}/ (F7 in a level records one)")
+    for name in paths:
+        replay = ReplayPlayer.load(os.path.join(directory, name))
+        sim = Simulation(replay.level)
+        replay.start(sim)
+        sim.timer = PhaseTimer()
+        start = time.perf_counter()
+        replay.run(sim)
+        elapsed = time.perf_counter() - start
+        phases = "  ".join(f"{phase} {t / replay.tick * 1e6:.0f}us" for phase, t in sim.timer.totals.items())
+        desync = "ok" if replay.desync is None else f"desync at {replay.desync}"
+        print(f"{name:<30} ticks {replay.tick:>6}  {replay.tick / elapsed:>6.0f} ticks/s  {desync}  {phases}")
+
+def bench_coop(scenarios=(("level1", 1, 0), ("level3+150", 3, 150)), seconds=8, rtt=0.1, loss=0.05, seed=1):
+    print(f"loopback, rtt {rtt * 1000:.0f}ms, loss {loss:.0%}")
+    for name, level, extra in scenarios:
+        server = make_sim(level, extra, seed)
+        hub = NetHost(NetLink(host="127.0.0.1", lag=rtt / 2, jitter=0.005, loss=loss, seed=seed))
+        hub.attach(server)
+        client = NetClient(NetLink(host="127.0.0.1", lag=rtt / 2, jitter=0.005, loss=loss, seed=seed + 1), hub.link.address)
+        while client.next is None:
+            client.poll()
+            hub.poll(server)
+            time.sleep(0.001)
+        replica = Replica(level).connect(client)
+        host_script, guest_script = ScriptedPlayer(seed), ScriptedPlayer(seed + 1)
+        restarts = 0
+        ticks = int(seconds / TICK)
+        due = time.perf_counter()
+        for tick in range(ticks):
+            client.poll(replica)
+            if not (replica.game_over or replica.win):
+                guest_script.drive(replica, tick)
+                replica.step()
+            if server.game_over or server.win:
+                server.restart()
+                populate(server, extra, random.Random(seed + restarts))
+                restarts += 1
+            host_script.drive(server, tick)
+            for guest in server.guests:
+                guest.damage_cooldown = 2
+            server.step()
+            hub.poll(server)
+            due += TICK
+            time.sleep(max(0, due - time.perf_counter()))
+        guest = server.guests[0]
+        pairs = [(a, b) for a, b in zip(server.enemies, replica.enemies) if a.alive and b.alive]
+        error = np.mean([((a.x - b.x) ** 2 + (a.y - b.y) ** 2) ** 0.5 for a, b in pairs]) if pairs else 0
+        ahead = ((guest.x - replica.player.x) ** 2 + (guest.y - replica.player.y) ** 2) ** 0.5
+        print(f"{name:<11} enemies {len(server.enemies):>4}  down {hub.link.sent / seconds / 1024:>5.1f} KB/s  "
+              f"up {client.link.sent / seconds / 1024:>4.1f} KB/s  largest {hub.link.largest:>4} B  "
+              f"corrections {client.corrections / ticks:>5.1%}  drift max {client.drift:>5.1f}px  "
+              f"enemy lag {error:>5.1f}px  guest ahead {ahead:>5.1f}px  bullets {len(server.projectiles.live())}/{len(replica.projectiles.live())}")
+        client.close()
+        hub.close()
+
+class LoadBot(asyncio.DatagramProtocol):
+    def __init__(self, room, seed):
+        self.room = room
+        self.rng = random.Random(seed)
+        self.transport = None
+        self.latest = 0
+        self.seq = 0
+        self.keys = 0
+        self.states = 0
+        self.received = 0
+    
+    def connection_made(self, transport):
+        self.transport = transport
+    
+    def datagram_received(self, data, address):
+        self.received += len(data)
+        if data[:1] == bytes([NetHost.STATE]):
+            self.states += 1
+            self.latest = max(self.latest, NetHost.HEADER.unpack_from(data)[1])
+    
+    def error_received(self, exc):
+        pass
+    
+    def send(self, ticks):
+        if not self.states:
+            self.transport.sendto(NetHost.GREETING.pack(NetHost.HELLO, NetHost.VERSION, self.room))
+            return
+        inputs = []
+        for _ in range(ticks):
+            self.seq += 1
+            if self.seq % 45 == 0:
+                self.keys = self.rng.randrange(16)
+            fire = 16 if self.rng.random() < 0.1 else 0
+            inputs.append(NetHost.INPUT_KEYS.pack(self.keys | fire, self.rng.uniform(0, SCREEN_WIDTH), self.rng.uniform(0, SCREEN_HEIGHT)))
+        self.transport.sendto(NetHost.INPUT_HEAD.pack(NetHost.INPUT, self.latest, self.seq, len(inputs)) + b"".join(inputs))
+
+class StatsProbe(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.reply = asyncio.get_running_loop().create_future()
+    
+    def datagram_received(self, data, address):
+        if not self.reply.done():
+            self.reply.set_result(json.loads(data))
+    
+    def error_received(self, exc):
+        pass
+
+async def server_stats(address, timeout=0.5):
+    transport, probe = await asyncio.get_running_loop().create_datagram_endpoint(StatsProbe, remote_addr=address)
+    try:
+        transport.sendto(bytes([RoomServer.STATS]))
+        return await asyncio.wait_for(probe.reply, timeout)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        transport.close()
+
+async def load_rooms(address, rooms, clients, seconds, warmup=2.0, batch=4):
+    while await server_stats(address) is None:
+        await asyncio.sleep(0.2)
+    loop = asyncio.get_running_loop()
+    bots = []
+    for n in range(rooms * clients):
+        transport, bot = await loop.create_datagram_endpoint(lambda n=n: LoadBot(n // clients + 1, n), remote_addr=address)
+        bots.append(bot)
+    marks = [time.perf_counter() + warmup, time.perf_counter() + warmup + seconds]
+    samples = []
+    due = time.perf_counter()
+    while marks:
+        for bot in bots:
+            bot.send(batch)
+        due += batch * TICK
+        await asyncio.sleep(max(0, due - time.perf_counter()))
+        if time.perf_counter() >= marks[0]:
+            marks.pop(0)
+            samples.append(await server_stats(address, timeout=2.0))
+    for bot in bots:
+        bot.transport.close()
+    return samples[0], samples[1], bots
+
+def bench_server(sizes=(25, 50, 100, 200), clients=2, seconds=6, port=NET_PORT + 1):
+    print("rooms  connected  ticks/s  on time  server cpu  us/room-tick  rooms/core  p99 us  late  skipped  down KB/s")
+    for rooms in sizes:
+        server = subprocess.Popen([sys.executable, "proekt.py", "--server", "--rooms", str(rooms), "--port", str(port)],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            first, last, bots = asyncio.run(load_rooms(("127.0.0.1", port), rooms, clients, seconds))
+        finally:
+            server.terminate()
+            server.wait()
+        if first is None or last is None:
+            print(f"{rooms:>5}  server stopped answering stats, overloaded")
+            break
+        wall = last["wall"] - first["wall"]
+        ticks = last["ticks"] - first["ticks"]
+        cpu = last["cpu"] - first["cpu"]
+        connected = len([bot for bot in bots if bot.states])
+        print(f"{rooms:>5}  {connected:>9}  {ticks / wall:>7.0f}  {ticks / (rooms * TICK_RATE * wall):>7.1%}  {cpu / wall:>10.0%}  "
+              f"{cpu / ticks * 1e6:>12.0f}  {ticks / cpu / TICK_RATE:>10.0f}  {last['p99_us']:>6.0f}  {last['late'] - first['late']:>4}  "
+              f"{last['skipped'] - first['skipped']:>7}  {(last['sent'] - first['sent']) / wall / 1024:>9.0f}")
+
+def bench_horde(interval=2 * TICK_RATE, waves=40, cap=8000, seed=1):
+    random.seed(seed)
+    sim = Simulation(HORDE_LEVEL)
+    sim.particles.rng = np.random.default_rng(seed)
+    horde = sim.horde
+    horde.timer, horde.interval, horde.cap = 0, interval, cap
+    script = ScriptedPlayer(seed)
+    sim.timer = PhaseTimer()
+    print(f"survival, wave every {interval / TICK_RATE:.0f}s, budget {HORDE_BUDGET * 1000:.1f}ms/tick")
+    print("wave  alive  awake  ms/tick  budget  spawn us  phases")
+    tick = 0
+    while horde.wave <= waves:
+        wave = horde.wave
+        totals = dict(sim.timer.totals)
+        elapsed = 0
+        ticks = 0
+        awake = 0
+        while horde.wave == wave:
+            script.drive(sim, tick)
+            start = time.perf_counter()
+            sim.step()
+            elapsed += time.perf_counter() - start
+            awake += len(sim.awake)
+            ticks += 1
+            tick += 1
+        if not wave:
+            continue
+        spent = {phase: t - totals.get(phase, 0) for phase, t in sim.timer.totals.items()}
+        top = sorted((phase for phase in spent if phase != "horde"), key=lambda phase: -spent[phase])[:3]
+        phases = "  ".join(f"{phase} {spent[phase] / ticks * 1e6:.0f}us" for phase in top)
+        ms = elapsed / ticks * 1000
+        print(f"{wave:>4}  {sim.alive_count:>5}  {awake / ticks:>5.0f}  {ms:>7.2f}  {ms / (HORDE_BUDGET * 1000):>6.0%}  "
+              f"{spent.get('horde', 0) / ticks * 1e6:>8.0f}  {phases}")
+        if horde.limit is not None:
+            break
+    if horde.limit is None:
+        print(f"tick budget never exceeded, peak {horde.peak} enemies")
+    else:
+        print(f"tick budget first exceeded at {horde.limit} enemies (peak {horde.peak})")
+
+def endpoint_step(pool, grid):
+    idx = np.flatnonzero(pool.active)
+    pool.x[idx] += pool.dx[idx] * pool.speed[idx]
+    pool.y[idx] += pool.dy[idx] * pool.speed[idx]
+    pool.active[idx[grid.collide_many(pool.x[idx], pool.y[idx], pool.size[idx])]] = False
+    return idx
+
+def bench_tunnel(speeds=(15, 30, 60, 120, 480), count=2000, rays=2000, seed=1):
+    grid = WallGrid([Wall(600, 400, 20, 800)] + make_walls(seed)[:4])
+    print(f"{count} projectiles fired at a 20px wall")
+    print("speed  endpoint leaks  swept leaks  endpoint us/tick  swept us/tick")
+    for speed in speeds:
+        row = []
+        for step in (endpoint_step, lambda pool, grid: pool.step(grid)):
+            rng = random.Random(seed)
+            pool = ProjectilePool(count)
+            for _ in range(count):
+                x, y = rng.uniform(100, 500), rng.uniform(80, 720)
+                pool.spawn(x, y, x + 1, y + rng.uniform(-0.5, 0.5), speed, 100, ProjectilePool.PLAYER)
+            leaked = np.zeros(count, dtype=bool)
+            elapsed, ticks = 0, 0
+            while pool.active.any():
+                start = time.perf_counter()
+                step(pool, grid)
+                elapsed += time.perf_counter() - start
+                ticks += 1
+                leaked |= pool.active & (pool.x > 610)
+                pool.active &= pool.x < 1100
+            row += [int(leaked.sum()), elapsed / ticks * 1e6]
+        print(f"{speed:>5}  {row[0]:>14}  {row[2]:>11}  {row[1]:>16.0f}  {row[3]:>13.0f}")
+    random.seed(seed)
+    sim = Simulation(3)
+    rng = random.Random(seed)
+    kills = sim.kills
+    start = time.perf_counter()
+    for _ in range(rays):
+        sim.rail(sim.player, rng.uniform(0, sim.world_width), rng.uniform(0, sim.world_height))
+    elapsed = time.perf_counter() - start
+    print(f"hitscan: {elapsed / rays * 1e6:.0f}us per ray on level 3, {sim.kills - kills} kills from {rays} rays")
+
+SUITES = {
+    "broadphase": bench_broadphase,
+    "projectiles": bench_projectiles,
+    "particles": bench_particles,
+    "equivalence": bench_equivalence,
+    "levels": bench_levels,
+    "bigmap": bench_bigmap,
+    "replays": bench_replays,
+    "coop": bench_coop,
+    "server": bench_server,
+    "horde": bench_horde,
+    "tunnel": bench_tunnel,
+    "walls": bench_walls,
+}
+
+def main():
+    names = sys.argv[1:] or list(SUITES)
+    for name in names:
+        SUITES[name]()
+
+if __name__ == "__main__":
+    main()
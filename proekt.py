@@ -1,20 +1,161 @@
 import arcade
+import pyglet
 import math
+import json
+import struct
+import hashlib
+import atexit
+import zlib
 import random
 import os
+import threading
+import time
+import socket
+import heapq
+import argparse
+import asyncio
+from collections import deque
+import numpy as np
 
 SCREEN_WIDTH = 1200
 SCREEN_HEIGHT = 800
 SCREEN_TITLE = "PYLINE MIAMI"
 COLORS = [(255,105,180,255),(255,0,77,255),(0,255,64,255),(0,149,255,255),(191,0,255,255)]
+LEVEL_DIR = "levels"
+BATCHED_RENDER = True
+BATCHED_AI = True
+BATCHED_AI_MIN = 32
+TICK_RATE = 60
+TICK = 1 / TICK_RATE
+MAX_TICKS_PER_FRAME = 5
+RENDER_RATE = 60
+CHUNK_SIZE = 600
+AWAKE_RADIUS = 1
+LOADED_RADIUS = 2
+NAV_RADIUS = 640
+NAV_FIELDS = 256
+AI_LOD = True
+AI_TIERS = [(500, 1), (800, 2), (math.inf, 4)]
+AI_BUDGET = 0.004
+PROFILE_HISTORY = 240
+PROFILE_EVENTS = 200000
+REPLAY_DIR = "replays"
+REPLAY_CHECK = 60
+SAVE_DIR = "saves"
+QUICK_SAVE = os.path.join(SAVE_DIR, "quick.snap")
+NET_PORT = 27015
+NET_PLAYERS = 2
+NET_RATE = 30
+NET_BUDGET = 1200
+NET_REDUNDANCY = 8
+NET_INPUT_BUFFER = 6
+NET_HISTORY = 64
+NET_TIMEOUT = 5.0
+ROOM_COUNT = 100
+ROOM_AI_BUDGET = 0.0005
+ROOM_RESTART = 3 * TICK_RATE
+ROOM_SLACK = 0.25
+ROOM_YIELD = 0.002
+ROOM_EARLY = 0.002
+ROOM_NAV_EVERY = 12
+ROOM_WINDOW = 600
+ROOM_REPORT = 5.0
+HORDE_LEVEL = os.path.join(LEVEL_DIR, "survival.json")
+HORDE_BATCH = 48
+HORDE_SPACING = 72
+HORDE_GAP = 50
+HORDE_CLEARANCE = 320
+HORDE_SPREAD = 600
+HORDE_BACKOFF = 30
+HORDE_WINDOW = 30
+HORDE_BUDGET = TICK
+RAIL_RANGE = 1600
+RAIL_DAMAGE = 200
+RAIL_DELAY = 40
+RAIL_WIDTH = 4
+RAIL_TRACE = 12
+WEAPON_NAMES = ("БЛАСТЕР", "РЕЛЬСОТРОН")
+ASSET_MANIFEST = {
+    "player": [f"glav/personaje{i}.png" for i in range(1, 13)],
+    "normal": [f"vragi/Golem_02_Walking_{i:03d}.png" for i in range(0, 18)],
+    "shooter": [f"shooter/Wraith_02_Moving Forward_{i:03d}.png" for i in range(0, 12)],
+    "blood": [f"png/{i}.png" for i in range(0, 28)],
+    "bullet": ["bullet.png"],
+    "bullet2": ["bullet2.png"],
+    "lobby": ["lobby1.jpg"],
+}
+
+class Assets:
+    textures = {}
+    loaded = False
+    
+    def __init__(self, manifest=ASSET_MANIFEST):
+        self.paths = [(name, path) for name, paths in manifest.items() for path in paths if os.path.exists(path)]
+        self.names = list(manifest)
+        self.decoded = []
+        self.uploaded = 0
+        self.error = None
+        self.thread = None
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.decode, daemon=True)
+        self.thread.start()
+    
+    def decode(self):
+        try:
+            for name, path in self.paths:
+                self.decoded.append((name, arcade.load_texture(path)))
+        except Exception as e:
+            self.error = e
+    
+    def upload(self, ctx, budget=16):
+        end = min(len(self.decoded), self.uploaded + budget)
+        for name, texture in self.decoded[self.uploaded:end]:
+            ctx.default_atlas.add(texture)
+        self.uploaded = end
+        if self.done():
+            self.install()
+    
+    def progress(self):
+        return (len(self.decoded) + self.uploaded) / (2 * len(self.paths)) if self.paths else 1
+    
+    def done(self):
+        return self.error is None and self.uploaded == len(self.paths)
+    
+    def install(self):
+        Assets.textures = {name: [] for name in self.names}
+        for name, texture in self.decoded:
+            Assets.textures[name].append(texture)
+        Assets.loaded = True
+        Player.player_textures = Assets.get("player")
+        Enemy.enemy_textures = {"normal": Assets.get("normal"), "shooter": Assets.get("shooter")}
+        BloodEffect.blood_textures = Assets.get("blood")
+        ProjectilePool.textures = [Assets.first("bullet"), Assets.first("bullet2")]
+    
+    def load_all(self):
+        self.decode()
+        if self.error:
+            raise self.error
+        self.uploaded = len(self.paths)
+        self.install()
+    
+    @classmethod
+    def get(cls, name):
+        return cls.textures.get(name, [])
+    
+    @classmethod
+    def first(cls, name):
+        textures = cls.get(name)
+        return textures[0] if textures else None
 
 class Player:
     player_textures = []
-    textures_loaded = False
     
     def __init__(self, x, y):
         self.x = x
         self.y = y
+        self.prev_x = x
+        self.prev_y = y
         self.speed = 5
         self.health = 100
         self.max_health = 100
@@ -25,34 +166,22 @@ class Player:
         self.is_moving = False
         self.size = 64
         self.hitbox_size = 32
-        
-        if not Player.textures_loaded:
-            for i in range(1, 13):
-                if os.path.exists(f"glav/personaje{i}.png"):
-                    Player.player_textures.append(arcade.load_texture(f"glav/personaje{i}.png"))
-            Player.textures_loaded = True
     
-    def move(self, dx, dy, walls):
+    def move(self, dx, dy, grid):
         old_x, old_y = self.x, self.y
         new_x = self.x + dx * self.speed
         new_y = self.y + dy * self.speed
         
-        can_move_x = True
-        can_move_y = True
-        
-        for wall in walls:
-            if wall.check_collide(new_x, self.y, self.hitbox_size, self.hitbox_size):
-                can_move_x = False
-            if wall.check_collide(self.x, new_y, self.hitbox_size, self.hitbox_size):
-                can_move_y = False
+        can_move_x = not grid.collide(new_x, self.y, self.hitbox_size, self.hitbox_size)
+        can_move_y = not grid.collide(self.x, new_y, self.hitbox_size, self.hitbox_size)
         
         if can_move_x:
             self.x = new_x
         if can_move_y:
             self.y = new_y
             
-        self.x = max(self.hitbox_size//2, min(SCREEN_WIDTH - self.hitbox_size//2, self.x))
-        self.y = max(self.hitbox_size//2, min(SCREEN_HEIGHT - self.hitbox_size//2, self.y))
+        self.x = max(self.hitbox_size//2, min(grid.width - self.hitbox_size//2, self.x))
+        self.y = max(self.hitbox_size//2, min(grid.height - self.hitbox_size//2, self.y))
         
         if dx > 0:
             self.direction = 3
@@ -78,75 +207,36 @@ class Player:
         else:
             self.current_texture = 0
     
-    def draw(self):
+    def draw(self, alpha=1.0):
+        x, y = self.lerp(alpha)
         if Player.player_textures and len(Player.player_textures) > 0:
             texture = Player.player_textures[self.current_texture]
-            arcade.draw_texture_rect(texture, arcade.LBWH(self.x - self.size//2, self.y - self.size//2, self.size, self.size))
+            arcade.draw_texture_rect(texture, arcade.LBWH(x - self.size//2, y - self.size//2, self.size, self.size))
         else:
             colors = [(255,0,0), (0,255,0), (0,0,255), (255,255,0)]
-            arcade.draw_lrbt_rectangle_filled(self.x - self.hitbox_size//2, self.x + self.hitbox_size//2, 
-                                            self.y - self.hitbox_size//2, self.y + self.hitbox_size//2, colors[self.direction])
+            arcade.draw_lrbt_rectangle_filled(x - self.hitbox_size//2, x + self.hitbox_size//2, 
+                                            y - self.hitbox_size//2, y + self.hitbox_size//2, colors[self.direction])
         
         health_width = (self.health / self.max_health) * self.hitbox_size
-        arcade.draw_lrbt_rectangle_filled(self.x - self.hitbox_size//2, self.x - self.hitbox_size//2 + health_width, 
-                                        self.y - self.hitbox_size//2 - 5, self.y - self.hitbox_size//2 - 2, (0, 255, 0, 255))
+        arcade.draw_lrbt_rectangle_filled(x - self.hitbox_size//2, x - self.hitbox_size//2 + health_width, 
+                                        y - self.hitbox_size//2 - 5, y - self.hitbox_size//2 - 2, (0, 255, 0, 255))
+    
+    def lerp(self, alpha):
+        return (self.prev_x + (self.x - self.prev_x) * alpha,
+                self.prev_y + (self.y - self.prev_y) * alpha)
     
     def get_hitbox(self):
         return (self.x - self.hitbox_size//2, self.x + self.hitbox_size//2, 
                 self.y - self.hitbox_size//2, self.y + self.hitbox_size//2)
 
-class EnemyBullet:
-    bullet_texture = None
-    texture_loaded = False
-    
-    def __init__(self, x, y, target_x, target_y, damage=100):
-        self.x = x
-        self.y = y
-        dx = target_x - x
-        dy = target_y - y
-        dist = math.sqrt(dx*dx + dy*dy) or 1
-        self.dx = dx / dist
-        self.dy = dy / dist
-        self.speed = 8
-        self.active = True
-        self.damage = damage
-        self.size = 16
-        
-        if not EnemyBullet.texture_loaded:
-            if os.path.exists("bullet2.png"):
-                EnemyBullet.bullet_texture = arcade.load_texture("bullet2.png")
-            EnemyBullet.texture_loaded = True
-    
-    def update(self, walls):
-        self.x += self.dx * self.speed
-        self.y += self.dy * self.speed
-        
-        for wall in walls:
-            if wall.check_collide(self.x, self.y, self.size, self.size):
-                self.active = False
-                return
-        
-        if self.x < 0 or self.x > SCREEN_WIDTH or self.y < 0 or self.y > SCREEN_HEIGHT:
-            self.active = False
-    
-    def draw(self):
-        if self.active:
-            if EnemyBullet.bullet_texture:
-                arcade.draw_texture_rect(EnemyBullet.bullet_texture, arcade.LBWH(self.x - self.size//2, self.y - self.size//2, self.size, self.size))
-            else:
-                arcade.draw_circle_filled(self.x, self.y, 4, (255, 50, 50, 255))
-    
-    def get_hitbox(self):
-        return (self.x - self.size//2, self.x + self.size//2,
-                self.y - self.size//2, self.y + self.size//2)
-
 class Enemy:
     enemy_textures = {"normal": [], "shooter": []}
-    textures_loaded = False
     
     def __init__(self, x, y, color, etype="normal"):
         self.x = x
         self.y = y
+        self.prev_x = x
+        self.prev_y = y
         self.speed = 2
         self.color = color
         self.alive = True
@@ -169,6 +259,8 @@ class Enemy:
         self.patrol_points = []
         self.current_patrol = 0
         self.is_moving = False
+        self.span = 1
+        self.age = 0
         
         if etype == "shooter":
             self.health = 200
@@ -180,15 +272,6 @@ class Enemy:
             self.max_health = 200
             self.speed = 4
             self.has_gun = False
-        
-        if not Enemy.textures_loaded:
-            for i in range(0, 18):
-                if os.path.exists(f"vragi/Golem_02_Walking_0{i}.png"):
-                    Enemy.enemy_textures["normal"].append(arcade.load_texture(f"vragi/Golem_02_Walking_0{i}.png"))
-            for i in range(0, 12):
-                if os.path.exists(f"shooter/Wraith_02_Moving Forward_0{i}.png"):
-                    Enemy.enemy_textures["shooter"].append(arcade.load_texture(f"shooter/Wraith_02_Moving Forward_0{i}.png"))
-            Enemy.textures_loaded = True
     
     def update_animation(self, delta_time):
         if self.is_moving and len(Enemy.enemy_textures[self.etype]) > 0:
@@ -199,13 +282,26 @@ class Enemy:
         else:
             self.current_texture = 0
     
-    def update(self, player_x, player_y, walls, enemy_bullets):
+    def try_move(self, dx, dy, grid):
+        size = self.hitbox_size
+        if not grid.collide(self.x + dx, self.y + dy, size, size):
+            self.x += dx
+            self.y += dy
+        elif dx and not grid.collide(self.x + dx, self.y, size, size):
+            self.x += dx
+        elif dy and not grid.collide(self.x, self.y + dy, size, size):
+            self.y += dy
+        else:
+            return False
+        return True
+    
+    def update(self, player_x, player_y, grid, projectiles, nav=None, los=None, scale=1):
         if not self.alive:
             return 0
             
-        self.move_timer += 1
-        self.attack_timer += 1
-        self.shoot_timer += 1
+        self.move_timer += scale
+        self.attack_timer += scale
+        self.shoot_timer += scale
         
         dx = player_x - self.x
         dy = player_y - self.y
@@ -216,14 +312,14 @@ class Enemy:
         
         old_x, old_y = self.x, self.y
         
-        if self.has_gun and self.shoot_timer > 30 and dist < 500:
+        if self.has_gun and self.shoot_timer > 30 and dist < 500 and (los is None or los.visible(self.x, self.y, player_x, player_y)):
             if random.random() < 0.6:
                 bullet_dx = player_x - self.x
                 bullet_dy = player_y - self.y
-                enemy_bullets.append(EnemyBullet(self.x, self.y, 
-                                                player_x + bullet_dx * 0.5, 
-                                                player_y + bullet_dy * 0.5, 
-                                                100))
+                projectiles.fire_enemy(self.x, self.y, 
+                                       player_x + bullet_dx * 0.5, 
+                                       player_y + bullet_dy * 0.5, 
+                                       100)
                 self.shoot_timer = 0
         
         if dist < 300:
@@ -232,32 +328,27 @@ class Enemy:
                     dx = -(dx / dist) * self.speed * 1.5
                     dy = -(dy / dist) * self.speed * 1.5
                 else:
-                    angle = math.atan2(dy, dx) + math.pi/2
-                    dx = math.cos(angle) * self.speed
-                    dy = math.sin(angle) * self.speed
+                    dx, dy = -(dy / dist) * self.speed, (dx / dist) * self.speed
             else:
                 if dist > 50:
-                    dx = (dx / dist) * self.speed * 1.5
-                    dy = (dy / dist) * self.speed * 1.5
+                    step = nav.direction(self.x, self.y) if nav else None
+                    if step:
+                        dx = step[0] * self.speed * 1.5
+                        dy = step[1] * self.speed * 1.5
+                    else:
+                        dx = (dx / dist) * self.speed * 1.5
+                        dy = (dy / dist) * self.speed * 1.5
                 else:
                     if self.attack_timer > 20:
                         self.attack_timer = 0
                         return 100
             
-            new_x = self.x + dx
-            new_y = self.y + dy
-            
-            can_move = True
-            for wall in walls:
-                if wall.check_collide(new_x, new_y, self.hitbox_size, self.hitbox_size):
-                    can_move = False
-                    break
-            
-            if can_move:
-                self.x = new_x
-                self.y = new_y
+            self.try_move(dx * scale, dy * scale, grid)
         else:
-            if self.move_timer > 60:
+            step = nav.direction(self.x, self.y) if nav and dist < 500 else None
+            if step:
+                self.move_dir = step
+            elif self.move_timer > 60:
                 self.move_timer = 0
                 if dist < 500:
                     target_x, target_y = self.last_player_pos
@@ -277,21 +368,11 @@ class Enemy:
                 if patrol_dist > 10:
                     self.move_dir = (dx / patrol_dist, dy / patrol_dist)
             
-            new_x = self.x + self.move_dir[0] * self.speed
-            new_y = self.y + self.move_dir[1] * self.speed
-            
-            can_move = True
-            for wall in walls:
-                if wall.check_collide(new_x, new_y, self.hitbox_size, self.hitbox_size):
-                    can_move = False
-                    break
-            
-            if can_move:
-                self.x = new_x
-                self.y = new_y
+            if not self.try_move(self.move_dir[0] * self.speed * scale, self.move_dir[1] * self.speed * scale, grid):
+                self.move_timer = 61
         
-        self.x = max(self.hitbox_size//2, min(SCREEN_WIDTH - self.hitbox_size//2, self.x))
-        self.y = max(self.hitbox_size//2, min(SCREEN_HEIGHT - self.hitbox_size//2, self.y))
+        self.x = max(self.hitbox_size//2, min(grid.width - self.hitbox_size//2, self.x))
+        self.y = max(self.hitbox_size//2, min(grid.height - self.hitbox_size//2, self.y))
         
         self.is_moving = (old_x != self.x or old_y != self.y)
         
@@ -304,69 +385,397 @@ class Enemy:
             return True
         return False
     
-    def draw(self):
+    def draw(self, alpha=1.0):
+        x, y = self.lerp(alpha)
         if self.alive:
             textures = Enemy.enemy_textures.get(self.etype, [])
             if textures and len(textures) > 0:
                 texture = textures[self.current_texture]
-                arcade.draw_texture_rect(texture, arcade.LBWH(self.x - self.size//2, self.y - self.size//2, self.size, self.size))
+                arcade.draw_texture_rect(texture, arcade.LBWH(x - self.size//2, y - self.size//2, self.size, self.size))
             else:
-                arcade.draw_lrbt_rectangle_filled(self.x - self.hitbox_size//2, self.x + self.hitbox_size//2, 
-                                                self.y - self.hitbox_size//2, self.y + self.hitbox_size//2, self.color)
+                arcade.draw_lrbt_rectangle_filled(x - self.hitbox_size//2, x + self.hitbox_size//2, 
+                                                y - self.hitbox_size//2, y + self.hitbox_size//2, self.color)
             
             health_width = (self.health / self.max_health) * self.hitbox_size
-            arcade.draw_lrbt_rectangle_filled(self.x - self.hitbox_size//2, self.x - self.hitbox_size//2 + health_width, 
-                                            self.y - self.hitbox_size//2 - 5, self.y - self.hitbox_size//2 - 2, (255, 0, 0, 255))
+            arcade.draw_lrbt_rectangle_filled(x - self.hitbox_size//2, x - self.hitbox_size//2 + health_width, 
+                                            y - self.hitbox_size//2 - 5, y - self.hitbox_size//2 - 2, (255, 0, 0, 255))
+    
+    def lerp(self, alpha):
+        t = min(1.0, (self.age + alpha) / self.span)
+        return (self.prev_x + (self.x - self.prev_x) * t,
+                self.prev_y + (self.y - self.prev_y) * t)
     
     def get_hitbox(self):
         return (self.x - self.hitbox_size//2, self.x + self.hitbox_size//2, 
                 self.y - self.hitbox_size//2, self.y + self.hitbox_size//2)
 
-class Bullet:
-    bullet_texture = None
-    texture_loaded = False
+class AIScheduler:
+    def __init__(self, tiers=AI_TIERS, budget=AI_BUDGET, max_scale=8):
+        self.tiers = tiers if AI_LOD else [(math.inf, 1)]
+        self.budget = budget
+        self.max_scale = max_scale
+        self.tick = 0
+        self.last = {}
+        self.cost = 0.0
+        self.deferred = 0
+        self.ran = 0
     
-    def __init__(self, x, y, target_x, target_y):
-        self.x = x
-        self.y = y
+    def forget(self, i):
+        self.last.pop(i, None)
+    
+    def plan(self, enemies, awake, player_x, player_y, others=()):
+        self.tick += 1
+        tick = self.tick
+        tiers = [(limit * limit, period) for limit, period in self.tiers]
+        last = self.last
+        must = []
+        optional = []
+        for i in awake:
+            enemy = enemies[i]
+            if not enemy.alive:
+                continue
+            elapsed = tick - last.get(i, tick - 1)
+            dx, dy = player_x - enemy.x, player_y - enemy.y
+            d2 = dx*dx + dy*dy
+            for ox, oy in others:
+                d2 = min(d2, (ox - enemy.x) ** 2 + (oy - enemy.y) ** 2)
+            for limit, period in tiers:
+                if d2 < limit:
+                    break
+            if period == 1:
+                must.append((i, elapsed))
+            elif elapsed >= period and ((tick + i) % period == 0 or elapsed > period):
+                optional.append((i, elapsed))
+        self.deferred = 0
+        if self.budget is not None and self.cost > 0 and optional:
+            room = max(0, int((self.budget - self.cost * len(must)) / self.cost))
+            if room < len(optional):
+                optional.sort(key=lambda item: (-item[1], item[0]))
+                self.deferred = len(optional) - room
+                optional = optional[:room]
+        chosen = sorted(must + optional)
+        self.ran = len(chosen)
+        for i, elapsed in chosen:
+            self.last[i] = tick
+        return [i for i, elapsed in chosen], [min(elapsed, self.max_scale) for i, elapsed in chosen]
+    
+    def record(self, count, elapsed):
+        if count:
+            self.cost = 0.9 * self.cost + 0.1 * (elapsed / count) if self.cost else elapsed / count
+
+class EnemySystem:
+    def __init__(self):
+        self.source = None
+        self.count = 0
+    
+    def load(self, enemies):
+        self.source = enemies
+        self.count = len(enemies)
+        for name, column in self.columns(enemies).items():
+            setattr(self, name, column)
+    
+    def grow(self, enemies):
+        for name, column in self.columns(enemies[self.count:]).items():
+            setattr(self, name, np.concatenate([getattr(self, name), column]))
+        self.count = len(enemies)
+    
+    def refresh(self, enemies, rows):
+        rows = [i for i in rows if i < self.count]
+        if enemies is self.source and rows:
+            for name, column in self.columns([enemies[i] for i in rows]).items():
+                getattr(self, name)[rows] = column
+    
+    def columns(self, enemies):
+        n = len(enemies)
+        patrol = np.zeros((n, 4, 2))
+        patrol_count = np.zeros(n, dtype=np.int64)
+        for i, e in enumerate(enemies):
+            if e.patrol_points:
+                patrol[i, :len(e.patrol_points)] = e.patrol_points
+                patrol_count[i] = len(e.patrol_points)
+        return {
+            "x": np.array([e.x for e in enemies], dtype=float),
+            "y": np.array([e.y for e in enemies], dtype=float),
+            "speed": np.array([e.speed for e in enemies], dtype=float),
+            "size": np.array([e.hitbox_size for e in enemies], dtype=np.int64),
+            "has_gun": np.array([e.has_gun for e in enemies], dtype=bool),
+            "move_timer": np.array([e.move_timer for e in enemies], dtype=np.int64),
+            "attack_timer": np.array([e.attack_timer for e in enemies], dtype=np.int64),
+            "shoot_timer": np.array([e.shoot_timer for e in enemies], dtype=np.int64),
+            "last_x": np.array([e.last_player_pos[0] for e in enemies], dtype=float),
+            "last_y": np.array([e.last_player_pos[1] for e in enemies], dtype=float),
+            "dir_x": np.array([e.move_dir[0] for e in enemies], dtype=float),
+            "dir_y": np.array([e.move_dir[1] for e in enemies], dtype=float),
+            "spawn_x": np.array([e.spawn_x for e in enemies], dtype=float),
+            "spawn_y": np.array([e.spawn_y for e in enemies], dtype=float),
+            "patrol": patrol,
+            "patrol_count": patrol_count,
+            "current_patrol": np.array([e.current_patrol for e in enemies], dtype=np.int64),
+            "is_moving": np.array([e.is_moving for e in enemies], dtype=bool),
+        }
+    
+    def store(self, enemies):
+        for i, e in enumerate(enemies[:self.count]):
+            e.x, e.y = float(self.x[i]), float(self.y[i])
+            e.move_timer = int(self.move_timer[i])
+            e.attack_timer = int(self.attack_timer[i])
+            e.shoot_timer = int(self.shoot_timer[i])
+            e.last_player_pos = (float(self.last_x[i]), float(self.last_y[i]))
+            e.move_dir = (float(self.dir_x[i]), float(self.dir_y[i]))
+            e.patrol_points = [tuple(p) for p in self.patrol[i, :self.patrol_count[i]].tolist()]
+            e.current_patrol = int(self.current_patrol[i])
+            e.is_moving = bool(self.is_moving[i])
+    
+    def ensure(self, enemies):
+        if enemies is not self.source:
+            self.load(enemies)
+        elif len(enemies) > self.count:
+            self.grow(enemies)
+        elif len(enemies) != self.count:
+            self.store(enemies)
+            self.load(enemies)
+    
+    def publish(self, enemies, awake=None):
+        if awake is None:
+            awake = range(self.count)
+        xs, ys, moving = self.x[awake].tolist(), self.y[awake].tolist(), self.is_moving[awake].tolist()
+        for i, x, y, m in zip(awake.tolist() if isinstance(awake, np.ndarray) else awake, xs, ys, moving):
+            e = enemies[i]
+            e.x, e.y, e.is_moving = x, y, m
+    
+    def try_move(self, x, y, size, dx, dy, grid):
+        nx, ny = x + dx, y + dy
+        both = ~grid.collide_many(nx, ny, size)
+        only_x = ~both & (dx != 0) & ~grid.collide_many(nx, y, size)
+        only_y = ~both & ~only_x & (dy != 0) & ~grid.collide_many(x, ny, size)
+        return np.where(both | only_x, nx, x), np.where(both | only_y, ny, y), both | only_x | only_y
+    
+    def update(self, enemies, player_x, player_y, grid, projectiles, nav=None, los=None, awake=None, scales=None):
+        self.ensure(enemies)
+        if awake is None:
+            awake = range(self.count)
+        if scales is None:
+            scales = [1] * len(awake)
+        live = [(k, i, scale) for k, (i, scale) in enumerate(zip(awake, scales)) if enemies[i].alive]
+        idx = np.array([i for k, i, scale in live], dtype=np.int64)
+        scale = np.array([scale for k, i, scale in live], dtype=np.int64)
+        if np.ndim(player_x):
+            rows = [k for k, i, scale in live]
+            player_x, player_y = np.asarray(player_x, dtype=float)[rows], np.asarray(player_y, dtype=float)[rows]
+        goal_x, goal_y = np.broadcast_to(player_x, idx.shape), np.broadcast_to(player_y, idx.shape)
+        self.move_timer[idx] += scale
+        self.attack_timer[idx] += scale
+        self.shoot_timer[idx] += scale
+        
+        x, y, speed, gun, size = self.x[idx], self.y[idx], self.speed[idx], self.has_gun[idx], self.size[idx]
+        move_timer, attack_timer, shoot_timer = self.move_timer[idx], self.attack_timer[idx], self.shoot_timer[idx]
+        dx = player_x - x
+        dy = player_y - y
+        dist = np.sqrt(dx*dx + dy*dy)
+        
+        seen = idx[dist < 400]
+        self.last_x[seen] = goal_x[dist < 400]
+        self.last_y[seen] = goal_y[dist < 400]
+        
+        close = dist < 300
+        far = ~close
+        if nav:
+            step_x, step_y, step_ok = nav.directions(x, y)
+        else:
+            step_x, step_y, step_ok = np.zeros(len(idx)), np.zeros(len(idx)), np.zeros(len(idx), dtype=bool)
+        far_step = far & (dist < 500) & step_ok
+        retarget = far & ~far_step & (move_timer > 60)
+        patrolling = retarget & (dist >= 500)
+        
+        shooting = gun & (shoot_timer > 30) & (dist < 500)
+        first_patrol = patrolling & (self.patrol_count[idx] == 0)
+        for k in np.flatnonzero(shooting | first_patrol).tolist():
+            i = int(idx[k])
+            px, py = float(goal_x[k]), float(goal_y[k])
+            if shooting[k] and (los is None or los.visible(x[k], y[k], px, py)):
+                if random.random() < 0.6:
+                    ex, ey = float(x[k]), float(y[k])
+                    projectiles.fire_enemy(ex, ey,
+                                           px + (px - ex) * 0.5,
+                                           py + (py - ey) * 0.5,
+                                           100)
+                    self.shoot_timer[i] = 0
+            if first_patrol[k]:
+                for n in range(4):
+                    self.patrol[i, n] = (self.spawn_x[i] + random.randint(-150, 150),
+                                         self.spawn_y[i] + random.randint(-150, 150))
+                self.patrol_count[i] = 4
         
+        safe = np.where(dist > 0, dist, 1.0)
+        move_x, move_y = dx.copy(), dy.copy()
+        flee = close & gun & (dist < 150)
+        strafe = close & gun & (dist >= 150)
+        chase = close & ~gun & (dist > 50)
+        chase_nav = chase & step_ok
+        chase_direct = chase & ~step_ok
+        attack = close & ~gun & (dist <= 50) & (attack_timer > 20)
+        move_x[flee] = -(dx / safe)[flee] * speed[flee] * 1.5
+        move_y[flee] = -(dy / safe)[flee] * speed[flee] * 1.5
+        move_x[strafe] = -(dy / safe)[strafe] * speed[strafe]
+        move_y[strafe] = (dx / safe)[strafe] * speed[strafe]
+        move_x[chase_nav] = step_x[chase_nav] * speed[chase_nav] * 1.5
+        move_y[chase_nav] = step_y[chase_nav] * speed[chase_nav] * 1.5
+        move_x[chase_direct] = (dx / safe)[chase_direct] * speed[chase_direct] * 1.5
+        move_y[chase_direct] = (dy / safe)[chase_direct] * speed[chase_direct] * 1.5
+        self.attack_timer[idx[attack]] = 0
+        
+        self.dir_x[idx[far_step]] = step_x[far_step]
+        self.dir_y[idx[far_step]] = step_y[far_step]
+        self.move_timer[idx[retarget]] = 0
+        target_x, target_y = self.last_x[idx], self.last_y[idx]
+        patrol = idx[patrolling]
+        current = self.current_patrol[patrol]
+        target_x[patrolling] = self.patrol[patrol, current, 0]
+        target_y[patrolling] = self.patrol[patrol, current, 1]
+        self.current_patrol[patrol] = (current + 1) % self.patrol_count[patrol]
+        tdx = target_x - x
+        tdy = target_y - y
+        patrol_dist = np.sqrt(tdx*tdx + tdy*tdy)
+        turn = retarget & (patrol_dist > 10)
+        self.dir_x[idx[turn]] = tdx[turn] / patrol_dist[turn]
+        self.dir_y[idx[turn]] = tdy[turn] / patrol_dist[turn]
+        move_x[far] = self.dir_x[idx[far]] * speed[far]
+        move_y[far] = self.dir_y[idx[far]] * speed[far]
+        move_x *= scale
+        move_y *= scale
+        
+        moving = ~attack
+        nx, ny, moved = self.try_move(x[moving], y[moving], size[moving], move_x[moving], move_y[moving], grid)
+        self.move_timer[idx[moving][far[moving] & ~moved]] = 61
+        
+        half = size[moving] // 2
+        nx = np.clip(nx, half, grid.width - half)
+        ny = np.clip(ny, half, grid.height - half)
+        mine = idx[moving]
+        self.is_moving[mine] = (x[moving] != nx) | (y[moving] != ny)
+        self.x[mine] = nx
+        self.y[mine] = ny
+        
+        self.publish(enemies, idx)
+        return idx[attack].tolist()
+
+class ProjectilePool:
+    PLAYER = 0
+    ENEMY = 1
+    textures = [None, None]
+    colors = [(255,255,0,255), (255,50,50,255)]
+    
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.px = np.zeros(capacity)
+        self.py = np.zeros(capacity)
+        self.dx = np.zeros(capacity)
+        self.dy = np.zeros(capacity)
+        self.speed = np.zeros(capacity)
+        self.damage = np.zeros(capacity, dtype=np.int32)
+        self.size = np.zeros(capacity, dtype=np.int32)
+        self.owner = np.zeros(capacity, dtype=np.int8)
+        self.seq = np.zeros(capacity, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.used = np.zeros(capacity, dtype=bool)
+        self.free = np.arange(capacity - 1, -1, -1, dtype=np.int32)
+        self.free_count = capacity
+        self.next_seq = 0
+    
+    def spawn(self, x, y, target_x, target_y, speed, damage, owner, size=16):
+        if self.free_count == 0:
+            return -1
+        self.free_count -= 1
+        i = self.free[self.free_count]
         dx = target_x - x
         dy = target_y - y
         dist = math.sqrt(dx*dx + dy*dy) or 1
-        self.dx = dx / dist
-        self.dy = dy / dist
-        self.speed = 15
-        self.active = True
-        self.damage = 100
-        self.size = 16
-        
-        if not Bullet.texture_loaded:
-            if os.path.exists("bullet.png"):
-                Bullet.bullet_texture = arcade.load_texture("bullet.png")
-            Bullet.texture_loaded = True
+        self.x[i] = x
+        self.y[i] = y
+        self.px[i] = x
+        self.py[i] = y
+        self.dx[i] = dx / dist
+        self.dy[i] = dy / dist
+        self.speed[i] = speed
+        self.damage[i] = damage
+        self.size[i] = size
+        self.owner[i] = owner
+        self.seq[i] = self.next_seq
+        self.next_seq += 1
+        self.active[i] = True
+        self.used[i] = True
+        return i
     
-    def update(self, walls):
-        self.x += self.dx * self.speed
-        self.y += self.dy * self.speed
-        
-        for wall in walls:
-            if wall.check_collide(self.x, self.y, self.size, self.size):
-                self.active = False
-                return
-        
-        if self.x < 0 or self.x > SCREEN_WIDTH or self.y < 0 or self.y > SCREEN_HEIGHT:
-            self.active = False
+    def fire_player(self, x, y, target_x, target_y):
+        return self.spawn(x, y, target_x, target_y, 15, 100, ProjectilePool.PLAYER)
     
-    def draw(self):
-        if self.active:
-            if Bullet.bullet_texture:
-                arcade.draw_texture_rect(Bullet.bullet_texture, arcade.LBWH(self.x - self.size//2, self.y - self.size//2, self.size, self.size))
-            else:
-                arcade.draw_circle_filled(self.x, self.y, 4, (255, 255, 0, 255))
+    def fire_enemy(self, x, y, target_x, target_y, damage=100):
+        return self.spawn(x, y, target_x, target_y, 8, damage, ProjectilePool.ENEMY)
     
-    def get_hitbox(self):
-        return (self.x - self.size//2, self.x + self.size//2,
-                self.y - self.size//2, self.y + self.size//2)
+    def live(self, owner=None):
+        mask = self.active if owner is None else self.active & (self.owner == owner)
+        idx = np.flatnonzero(mask)
+        return idx[np.argsort(self.seq[idx], kind="stable")]
+    
+    def step(self, grid, region=None):
+        idx = np.flatnonzero(self.active)
+        if len(idx) == 0:
+            return idx
+        x0, y0 = self.x[idx], self.y[idx]
+        self.px[idx] = x0
+        self.py[idx] = y0
+        dx = self.dx[idx] * self.speed[idx]
+        dy = self.dy[idx] * self.speed[idx]
+        t = grid.sweep_many(x0, y0, dx, dy, self.size[idx])
+        dead = t <= 1
+        t = np.minimum(t, 1)
+        x = x0 + dx * t
+        y = y0 + dy * t
+        self.x[idx] = x
+        self.y[idx] = y
+        left, right, bottom, top = region or (0, grid.width, 0, grid.height)
+        dead |= (x < left) | (x > right) | (y < bottom) | (y > top)
+        self.active[idx[dead]] = False
+        return idx[np.argsort(self.seq[idx], kind="stable")]
+    
+    def crossing(self, idx, x1, x2, y1, y2):
+        half = self.size[idx] // 2
+        x, y = self.px[idx], self.py[idx]
+        t = WallGrid.entry(x, y, self.x[idx] - x, self.y[idx] - y, x1 - half, x2 + half, y1 - half, y2 + half)
+        return idx[t <= 1]
+    
+    def retire(self, owner=None):
+        if owner is not None:
+            self.active[self.owner == owner] = False
+        idx = np.flatnonzero(self.used & ~self.active)
+        self.used[idx] = False
+        self.free[self.free_count:self.free_count + len(idx)] = idx
+        self.free_count += len(idx)
+    
+    def visible(self, idx, view=None):
+        if view is None:
+            return idx
+        left, right, bottom, top = view
+        x, y = self.x[idx], self.y[idx]
+        return idx[(x > left) & (x < right) & (y > bottom) & (y < top)]
+    
+    def lerp(self, idx, alpha):
+        return (self.px[idx] + (self.x[idx] - self.px[idx]) * alpha,
+                self.py[idx] + (self.y[idx] - self.py[idx]) * alpha)
+    
+    def draw(self, alpha=1.0, view=None):
+        for owner in (ProjectilePool.ENEMY, ProjectilePool.PLAYER):
+            texture = ProjectilePool.textures[owner]
+            live = self.visible(self.live(owner), view)
+            xs, ys = self.lerp(live, alpha)
+            for i, x, y in zip(live, xs.tolist(), ys.tolist()):
+                if texture:
+                    size = int(self.size[i])
+                    arcade.draw_texture_rect(texture, arcade.LBWH(x - size//2, y - size//2, size, size))
+                else:
+                    arcade.draw_circle_filled(x, y, 4, ProjectilePool.colors[owner])
 
 class Wall:
     def __init__(self, x, y, w, h):
@@ -384,32 +793,808 @@ class Wall:
     def draw(self):
         arcade.draw_lrbt_rectangle_filled(self.x - self.w//2, self.x + self.w//2, self.y - self.h//2, self.y + self.h//2, (80, 80, 80, 255))
         arcade.draw_lrbt_rectangle_outline(self.x - self.w//2, self.x + self.w//2, self.y - self.h//2, self.y + self.h//2, (180, 180, 180, 255), 2)
+    
+    def shapes(self):
+        return [arcade.shape_list.create_rectangle_filled(self.x, self.y, self.w//2*2, self.h//2*2, (80, 80, 80, 255)),
+                arcade.shape_list.create_rectangle_outline(self.x, self.y, self.w//2*2, self.h//2*2, (180, 180, 180, 255), 2)]
 
-class Particle:
-    def __init__(self, x, y, color):
-        self.x = x
-        self.y = y
-        self.vx = random.uniform(-3, 3)
-        self.vy = random.uniform(-3, 3)
-        self.size = random.uniform(2, 5)
-        self.color = color
-        self.life = 20
+class WallGrid:
+    def __init__(self, walls, cell_size=50, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, tile_size=200, tile_reach=64):
+        self.walls = walls
+        self.cell_size = cell_size
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.tile_reach = tile_reach
+        self.tiles = None
+        self.cells = {}
+        self.bounds = np.array([(wall.x - wall.w//2, wall.x + wall.w//2, wall.y - wall.h//2, wall.y + wall.h//2)
+                                for wall in walls], dtype=float).reshape(-1, 4)
+        for wall in walls:
+            for cx in range(int((wall.x - wall.w//2) // cell_size), int((wall.x + wall.w//2) // cell_size) + 1):
+                for cy in range(int((wall.y - wall.h//2) // cell_size), int((wall.y + wall.h//2) // cell_size) + 1):
+                    self.cells.setdefault((cx, cy), []).append(wall)
+    
+    def collide(self, x, y, w, h):
+        cs = self.cell_size
+        for cx in range(int((x - w//2) // cs), int((x + w//2) // cs) + 1):
+            for cy in range(int((y - h//2) // cs), int((y + h//2) // cs) + 1):
+                for wall in self.cells.get((cx, cy), ()):
+                    if wall.check_collide(x, y, w, h):
+                        return True
+        return False
+    
+    def collide_many(self, xs, ys, sizes):
+        if len(self.bounds) <= 64 or len(xs) == 0 or (sizes // 2).max() > self.tile_reach:
+            return self.collide_block(xs, ys, sizes, self.bounds)
+        owner, found = self.gather(xs, ys)
+        left, right, bottom, top = self.bounds[found].T
+        half = (sizes // 2)[owner]
+        px, py = xs[owner], ys[owner]
+        hit = (px - half < right) & (px + half > left) & (py - half < top) & (py + half > bottom)
+        out = np.zeros(len(xs), dtype=bool)
+        out[owner[hit]] = True
+        return out
+    
+    def sweep_many(self, xs, ys, dxs, dys, sizes):
+        out = np.full(len(xs), np.inf)
+        if len(self.bounds) == 0 or len(xs) == 0:
+            return out
+        half = sizes // 2
+        x1, x2 = np.minimum(xs, xs + dxs) - half, np.maximum(xs, xs + dxs) + half
+        y1, y2 = np.minimum(ys, ys + dys) - half, np.maximum(ys, ys + dys) + half
+        if len(self.bounds) <= 64 or (np.maximum(np.abs(dxs), np.abs(dys)) / 2 + half).max() > self.tile_reach:
+            left, right, bottom, top = self.bounds.T
+            owner, found = np.nonzero((x1[:, None] < right) & (x2[:, None] > left) & (y1[:, None] < top) & (y2[:, None] > bottom))
+        else:
+            owner, found = self.gather(xs + dxs / 2, ys + dys / 2)
+            left, right, bottom, top = self.bounds[found].T
+            near = (x1[owner] < right) & (x2[owner] > left) & (y1[owner] < top) & (y2[owner] > bottom)
+            owner, found = owner[near], found[near]
+        if len(owner) == 0:
+            return out
+        left, right, bottom, top = self.bounds[found].T
+        h = half[owner]
+        t = WallGrid.entry(xs[owner], ys[owner], dxs[owner], dys[owner], left - h, right + h, bottom - h, top + h)
+        hit, first = np.unique(owner, return_index=True)
+        out[hit] = np.minimum.reduceat(t, first)
+        return out
+    
+    @staticmethod
+    def entry(x, y, dx, dy, left, right, bottom, top):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x1, x2 = (left - x) / dx, (right - x) / dx
+            y1, y2 = (bottom - y) / dy, (top - y) / dy
+        inside_x = (x > left) & (x < right)
+        inside_y = (y > bottom) & (y < top)
+        near = np.maximum(np.where(dx == 0, np.where(inside_x, -np.inf, np.inf), np.minimum(x1, x2)),
+                          np.where(dy == 0, np.where(inside_y, -np.inf, np.inf), np.minimum(y1, y2)))
+        far = np.minimum(np.where(dx == 0, np.where(inside_x, np.inf, -np.inf), np.maximum(x1, x2)),
+                         np.where(dy == 0, np.where(inside_y, np.inf, -np.inf), np.maximum(y1, y2)))
+        near = np.maximum(near, 0)
+        return np.where(near < np.minimum(far, 1), near, np.inf)
+    
+    def gather(self, xs, ys):
+        if self.tiles is None:
+            self.build_tiles()
+        keys, start, members = self.tiles
+        ts = self.tile_size
+        query = (xs // ts).astype(np.int64) * 1000003 + (ys // ts).astype(np.int64)
+        pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        found = keys[pos] == query
+        first = np.where(found, start[pos], 0)
+        count = np.where(found, start[pos + 1] - start[pos], 0)
+        owner = np.repeat(np.arange(len(xs)), count)
+        offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        return owner, members[np.repeat(first, count) + offset]
+    
+    def collide_block(self, xs, ys, sizes, bounds):
+        half = (sizes // 2)[:, None]
+        left, right, bottom, top = bounds.T
+        return ((xs[:, None] - half < right) & (xs[:, None] + half > left) &
+                (ys[:, None] - half < top) & (ys[:, None] + half > bottom)).any(axis=1)
+    
+    def build_tiles(self):
+        ts, reach = self.tile_size, self.tile_reach
+        members = {}
+        for i, (left, right, bottom, top) in enumerate(self.bounds.tolist()):
+            for tx in range(int((left - reach) // ts), int((right + reach) // ts) + 1):
+                for ty in range(int((bottom - reach) // ts), int((top + reach) // ts) + 1):
+                    members.setdefault(tx * 1000003 + ty, []).append(i)
+        keys = sorted(members)
+        start = np.cumsum([0] + [len(members[k]) for k in keys])
+        self.tiles = (np.array(keys, dtype=np.int64), start, np.array([i for k in keys for i in members[k]], dtype=np.int64))
+    
+    def in_region(self, left, right, bottom, top):
+        l, r, b, t = self.bounds.T
+        return [self.walls[i] for i in np.flatnonzero((l < right) & (r > left) & (b < top) & (t > bottom)).tolist()]
+
+class LineOfSight:
+    def __init__(self, grid, cell_size=25, max_entries=200000):
+        self.grid = grid
+        self.cell_size = cell_size
+        self.max_entries = max_entries
+        self.cache = {}
+    
+    def visible(self, ax, ay, bx, by):
+        cs = self.cell_size
+        a = (int(ax // cs), int(ay // cs))
+        b = (int(bx // cs), int(by // cs))
+        key = (a, b) if a <= b else (b, a)
+        seen = self.cache.get(key)
+        if seen is None:
+            if len(self.cache) >= self.max_entries:
+                self.cache.clear()
+            seen = not self.blocked((key[0][0] + 0.5) * cs, (key[0][1] + 0.5) * cs,
+                                    (key[1][0] + 0.5) * cs, (key[1][1] + 0.5) * cs)
+            self.cache[key] = seen
+        return seen
+    
+    def blocked(self, x1, y1, x2, y2):
+        if len(self.grid.bounds) == 0:
+            return False
+        left, right, bottom, top = self.grid.bounds.T
+        hit = ~(((left < x1) & (x1 < right) & (bottom < y1) & (y1 < top)) |
+                ((left < x2) & (x2 < right) & (bottom < y2) & (y2 < top)))
+        t0 = np.zeros(len(left))
+        t1 = np.ones(len(left))
+        for start, delta, lo, hi in ((x1, x2 - x1, left, right), (y1, y2 - y1, bottom, top)):
+            if delta == 0:
+                hit &= (lo < start) & (start < hi)
+            else:
+                ta = (lo - start) / delta
+                tb = (hi - start) / delta
+                t0 = np.maximum(t0, np.minimum(ta, tb))
+                t1 = np.minimum(t1, np.maximum(ta, tb))
+        return bool((hit & (t0 < t1)).any())
+
+class NavGrid:
+    neighbours = [(1,0), (-1,0), (0,1), (0,-1), (1,1), (1,-1), (-1,1), (-1,-1)]
+    
+    def __init__(self, grid, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, cell_size=20, agent_size=32, blocked=None, links=None, fields=None):
+        self.cell_size = cell_size
+        self.cols = int(width // cell_size)
+        self.rows = int(height // cell_size)
+        if blocked is None:
+            cx = (np.arange(self.cols) + 0.5) * cell_size
+            cy = (np.arange(self.rows) + 0.5) * cell_size
+            xs, ys = np.meshgrid(cx, cy)
+            blocked = grid.collide_many(xs.ravel(), ys.ravel(), np.full(xs.size, agent_size)).reshape(self.rows, self.cols)
+        self.blocked = blocked
+        self.link_start, self.link_to = self.connect() if links is None else links
+        self.open = ~np.asarray(self.blocked).ravel()
+        self.box = (0, self.rows, 0, self.cols)
+        self.dist = np.full((self.rows, self.cols), -1, dtype=np.int32)
+        self.next_x = np.zeros((self.rows, self.cols))
+        self.next_y = np.zeros((self.rows, self.cols))
+        self.has_next = np.zeros((self.rows, self.cols), dtype=bool)
+        self.target = None
+        self.fields = {} if fields is None else fields
+    
+    def connect(self):
+        rows, cols = self.rows, self.cols
+        free = np.pad(~np.asarray(self.blocked), 1, constant_values=False)
+        r, c = np.indices((rows, cols))
+        ok = []
+        to = []
+        for dc, dr in NavGrid.neighbours:
+            step = free[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+            if dr and dc:
+                step = step & free[1 + dr:1 + dr + rows, 1:1 + cols] & free[1:1 + rows, 1 + dc:1 + dc + cols]
+            ok.append(step)
+            to.append((r + dr) * cols + c + dc)
+        ok = np.stack(ok, axis=-1).reshape(-1, len(ok))
+        to = np.stack(to, axis=-1).reshape(-1, len(to))
+        return np.concatenate([[0], np.cumsum(ok.sum(axis=1))]).astype(np.int64), to[ok].astype(np.int64)
+    
+    def cell(self, x, y):
+        return (min(self.rows - 1, max(0, int(y // self.cell_size))),
+                min(self.cols - 1, max(0, int(x // self.cell_size))))
+    
+    def box_for(self, left, right, bottom, top):
+        cs = self.cell_size
+        return (max(0, int(bottom // cs)), min(self.rows, int(-(-top // cs))),
+                max(0, int(left // cs)), min(self.cols, int(-(-right // cs))))
+    
+    def update(self, x, y, region=None, others=()):
+        target = self.cell(x, y)
+        if others:
+            target = tuple(sorted({target, *(self.cell(ox, oy) for ox, oy in others)}))
+            if len(target) == 1:
+                target = target[0]
+        box = self.box_for(*region) if region else (0, self.rows, 0, self.cols)
+        if target == self.target and box == self.box:
+            return False
+        self.target = target
+        self.box = box
+        self.build(list(target) if isinstance(target[0], tuple) else [target])
+        return True
+    
+    def field(self, target):
+        key = (target, self.box)
+        dist = self.fields.pop(key, None)
+        if dist is None:
+            dist = self.search(target)
+            if len(self.fields) >= NAV_FIELDS:
+                del self.fields[next(iter(self.fields))]
+        self.fields[key] = dist
+        return dist
+    
+    def search(self, target):
+        rows, cols = self.rows, self.cols
+        r1, r2, c1, c2 = self.box
+        start, to, is_open = self.link_start, self.link_to, self.open
+        whole = self.box == (0, rows, 0, cols)
+        dist = np.full(rows * cols, -1, dtype=np.int32)
+        stamp = np.zeros(rows * cols, dtype=np.int64)
+        frontier = np.array([target[0] * cols + target[1]], dtype=np.int64)
+        dist[frontier] = 0
+        d = 0
+        while len(frontier):
+            d += 1
+            first = start[frontier]
+            count = start[frontier + 1] - first
+            found = to[np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum())]
+            found = found[dist[found] < 0]
+            if not whole:
+                r, c = found // cols, found % cols
+                found = found[(r >= r1) & (r < r2) & (c >= c1) & (c < c2)]
+            order = np.arange(len(found))
+            stamp[found] = order
+            found = found[stamp[found] == order]
+            dist[found] = d
+            frontier = found[is_open[found]]
+        return dist.reshape(rows, cols)[r1:r2, c1:c2].copy()
+    
+    def build(self, targets):
+        r1, r2, c1, c2 = self.box
+        rows, width = r2 - r1, c2 - c1
+        fields = [self.field(target) for target in targets]
+        if len(fields) == 1:
+            self.dist = fields[0]
+        else:
+            unreached = np.iinfo(np.int32).max
+            dist = np.minimum.reduce([np.where(field < 0, unreached, field) for field in fields])
+            self.dist = np.where(dist == unreached, -1, dist)
+        
+        far = self.rows * self.cols
+        cost = np.where(self.dist < 0, far, self.dist)
+        padded = np.pad(cost, 1, constant_values=far)
+        free = np.pad(~self.blocked[r1:r2, c1:c2], 1, constant_values=False)
+        best = np.full(cost.shape, far)
+        best_dr = np.zeros(cost.shape, dtype=np.int32)
+        best_dc = np.zeros(cost.shape, dtype=np.int32)
+        for dc, dr in NavGrid.neighbours:
+            cand = padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + width].copy()
+            cand[~free[1 + dr:1 + dr + rows, 1 + dc:1 + dc + width]] = far
+            if dr and dc:
+                side = free[1 + dr:1 + dr + rows, 1:1 + width] & free[1:1 + rows, 1 + dc:1 + dc + width]
+                cand[~side] = far
+            better = cand < best
+            best[better] = cand[better]
+            best_dr[better] = dr
+            best_dc[better] = dc
+        rr, cc = np.indices(cost.shape)
+        self.next_x = (cc + c1 + best_dc + 0.5) * self.cell_size
+        self.next_y = (rr + r1 + best_dr + 0.5) * self.cell_size
+        self.has_next = (self.dist > 0) & (best < self.dist)
+    
+    def direction(self, x, y):
+        r, c = self.cell(x, y)
+        r1, r2, c1, c2 = self.box
+        if self.target is None or not (r1 <= r < r2 and c1 <= c < c2):
+            return None
+        r, c = r - r1, c - c1
+        if not self.has_next[r, c]:
+            return None
+        dx = self.next_x[r, c] - x
+        dy = self.next_y[r, c] - y
+        d = math.sqrt(dx*dx + dy*dy)
+        if d < 1e-6:
+            return None
+        return (dx / d, dy / d)
+    
+    def directions(self, xs, ys):
+        count = len(xs)
+        if self.target is None:
+            return np.zeros(count), np.zeros(count), np.zeros(count, dtype=bool)
+        r1, r2, c1, c2 = self.box
+        r = np.clip((ys // self.cell_size).astype(np.int64), 0, self.rows - 1)
+        c = np.clip((xs // self.cell_size).astype(np.int64), 0, self.cols - 1)
+        inside = (r >= r1) & (r < r2) & (c >= c1) & (c < c2)
+        r = np.clip(r - r1, 0, r2 - r1 - 1)
+        c = np.clip(c - c1, 0, c2 - c1 - 1)
+        dx = self.next_x[r, c] - xs
+        dy = self.next_y[r, c] - ys
+        d = np.sqrt(dx*dx + dy*dy)
+        ok = inside & self.has_next[r, c] & (d >= 1e-6)
+        d = np.where(ok, d, 1.0)
+        return dx / d, dy / d, ok
+
+class LevelData:
+    def __init__(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.width = data.get("width", SCREEN_WIDTH)
+        self.height = data.get("height", SCREEN_HEIGHT)
+        self.background = tuple(data.get("background", (0, 0, 0)))
+        self.player = tuple(data["player"])
+        self.walls = [Wall(*wall) for wall in data["walls"]]
+        self.enemies = [tuple(enemy) for enemy in data.get("enemies", [])]
+        self.horde = data.get("horde")
+        self.spawns = None
+        self.grid = None
+        self.blocked = None
+        self.links = None
+        self.los = None
+        self.fields = None
+    
+    @staticmethod
+    def path_for(level_num):
+        if isinstance(level_num, str):
+            return level_num
+        return os.path.join(LEVEL_DIR, f"level{level_num}.json")
+    
+    def collision_params(self):
+        return {"version": LevelCache.version, "width": self.width, "height": self.height,
+                "grid_cell": LevelCache.grid_cell, "nav_cell": LevelCache.nav_cell, "agent": LevelCache.agent}
+    
+    def collision_key(self):
+        content = dict(self.collision_params(), walls=[(w.x, w.y, w.w, w.h) for w in self.walls])
+        return hashlib.sha1(json.dumps(content).encode()).hexdigest()
+
+class LevelCache:
+    version = 2
+    magic = b"LVLC"
+    grid_cell = 50
+    nav_cell = 20
+    agent = 32
+    sources = {}
+    compiled = {}
+    fields = {}
+    lock = threading.Lock()
+    damaged = (OSError, ValueError, KeyError, struct.error)
+    
+    @classmethod
+    def load(cls, level_num, directory=None):
+        with cls.lock:
+            return cls.load_locked(level_num, directory)
+    
+    @classmethod
+    def load_locked(cls, level_num, directory=None):
+        path = LevelData.path_for(level_num)
+        directory = directory or os.path.join(os.path.dirname(path), ".cache")
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = cls.sources.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        level = LevelData(path)
+        key = level.collision_key()
+        if key not in cls.compiled:
+            cls.compiled[key] = cls.read_or_build(level, key, directory)
+        level.grid, level.blocked, level.links, level.los = cls.compiled[key]
+        level.fields = cls.fields.setdefault(key, {})
+        level.walls = level.grid.walls
+        cls.sources[path] = (stamp, level)
+        return level
+    
+    @classmethod
+    def file_for(cls, directory, name, key):
+        return os.path.join(directory, f"{name}-{key[:16]}.bin")
+    
+    @classmethod
+    def read_or_build(cls, level, key, directory):
+        path = cls.file_for(directory, level.name, key)
+        try:
+            if os.path.exists(path) and cls.header(path)[0].get("key") == key:
+                return cls.restore(level, cls.read(path)[1])
+        except cls.damaged:
+            pass
+        previous = None
+        if os.path.isdir(directory):
+            for fname in sorted(os.listdir(directory)):
+                stale = os.path.join(directory, fname)
+                if fname.startswith(level.name + "-") and fname.endswith(".bin"):
+                    try:
+                        if cls.header(stale)[0].get("params") == level.collision_params():
+                            previous = cls.read(stale, mapped=False)[1]
+                    except cls.damaged:
+                        pass
+        grid = WallGrid(level.walls, cls.grid_cell, level.width, level.height)
+        nav = None
+        if previous is not None:
+            try:
+                nav = cls.patch(level, grid, previous)
+            except cls.damaged:
+                pass
+        if nav is None:
+            nav = NavGrid(grid, level.width, level.height, cls.nav_cell, cls.agent)
+        try:
+            cls.write(directory, level, key, grid, nav)
+        except OSError:
+            pass
+        return grid, nav.blocked, (nav.link_start, nav.link_to), LineOfSight(grid)
+    
+    @classmethod
+    def restore(cls, level, arrays):
+        blocked, link_start = arrays["blocked"], arrays["link_start"]
+        if blocked.shape != (int(level.height // cls.nav_cell), int(level.width // cls.nav_cell)) or len(link_start) != blocked.size + 1:
+            raise ValueError("level cache does not match the level")
+        grid = WallGrid(level.walls, cls.grid_cell, level.width, level.height)
+        return grid, blocked, (link_start, arrays["link_to"]), LineOfSight(grid)
+    
+    @classmethod
+    def patch(cls, level, grid, previous):
+        old = {tuple(w) for w in previous["walls"].tolist()}
+        new = {(w.x, w.y, w.w, w.h) for w in level.walls}
+        blocked = np.array(previous["blocked"])
+        rows, cols = blocked.shape
+        cs, reach = cls.nav_cell, cls.agent // 2
+        dirty = np.zeros(blocked.shape, dtype=bool)
+        for x, y, w, h in old ^ new:
+            c1 = max(0, int((x - w//2 - reach) // cs) - 1)
+            c2 = min(cols, int((x + w//2 + reach) // cs) + 2)
+            r1 = max(0, int((y - h//2 - reach) // cs) - 1)
+            r2 = min(rows, int((y + h//2 + reach) // cs) + 2)
+            dirty[r1:r2, c1:c2] = True
+        r, c = np.nonzero(dirty)
+        blocked[r, c] = grid.collide_many((c + 0.5) * cs, (r + 0.5) * cs, np.full(len(r), cls.agent))
+        return NavGrid(grid, level.width, level.height, cs, cls.agent, blocked)
+    
+    @classmethod
+    def write(cls, directory, level, key, grid, nav):
+        arrays = {
+            "walls": np.array([(w.x, w.y, w.w, w.h) for w in level.walls], dtype=float).reshape(-1, 4),
+            "blocked": np.asarray(nav.blocked, dtype=bool),
+            "link_start": nav.link_start,
+            "link_to": nav.link_to,
+        }
+        meta = {}
+        offset = 0
+        for name, arr in arrays.items():
+            offset = (offset + 63) // 64 * 64
+            meta[name] = [arr.dtype.str, list(arr.shape), offset]
+            offset += arr.nbytes
+        head = json.dumps({"key": key, "params": level.collision_params(), "arrays": meta}).encode()
+        base = (12 + len(head) + 63) // 64 * 64
+        os.makedirs(directory, exist_ok=True)
+        path = cls.file_for(directory, level.name, key)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(cls.magic + struct.pack("<II", len(head), base) + head)
+            for name, arr in arrays.items():
+                f.seek(base + meta[name][2])
+                f.write(np.ascontiguousarray(arr).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        cls.release(path)
+        os.replace(tmp, path)
+        for fname in os.listdir(directory):
+            stale = os.path.join(directory, fname)
+            if fname.startswith(level.name + "-") and fname.endswith(".bin") and stale != path:
+                cls.release(stale)
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+    
+    @classmethod
+    def release(cls, path):
+        path = os.path.abspath(path)
+        def unmap(arr):
+            return np.array(arr) if isinstance(arr, np.memmap) and arr.filename == path else arr
+        for key, (grid, blocked, links, los) in cls.compiled.items():
+            cls.compiled[key] = (grid, unmap(blocked), tuple(unmap(arr) for arr in links), los)
+        for stamp, level in cls.sources.values():
+            level.blocked = unmap(level.blocked)
+            level.links = tuple(unmap(arr) for arr in level.links)
+    
+    @classmethod
+    def header(cls, path):
+        with open(path, "rb") as f:
+            if f.read(4) != cls.magic:
+                return {}, 0
+            size, base = struct.unpack("<II", f.read(8))
+            return json.loads(f.read(size)), base
+    
+    @classmethod
+    def read(cls, path, mapped=True):
+        header, base = cls.header(path)
+        arrays = {}
+        for name, (dtype, shape, offset) in header.get("arrays", {}).items():
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            elif mapped:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=base + offset, shape=tuple(shape))
+            else:
+                arrays[name] = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=base + offset).reshape(shape)
+        return header, arrays
+
+class SpatialHash:
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.reach = 0
+    
+    def build(self, items):
+        cs = self.cell_size
+        self.cells = {}
+        self.reach = 0
+        for i, item in enumerate(items):
+            self.cells.setdefault((int(item.x // cs), int(item.y // cs)), []).append(i)
+            self.reach = max(self.reach, item.hitbox_size//2)
+    
+    def query(self, x1, x2, y1, y2):
+        cs = self.cell_size
+        found = []
+        for cx in range(int((x1 - self.reach) // cs), int((x2 + self.reach) // cs) + 1):
+            for cy in range(int((y1 - self.reach) // cs), int((y2 + self.reach) // cs) + 1):
+                found.extend(self.cells.get((cx, cy), ()))
+        found.sort()
+        return found
+
+class ChunkMap:
+    def __init__(self, width, height, size=CHUNK_SIZE):
+        self.size = size
+        self.width = width
+        self.height = height
+        self.cols = max(1, int(-(-width // size)))
+        self.rows = max(1, int(-(-height // size)))
+        self.members = {}
+        self.where = {}
+    
+    def key(self, x, y):
+        return (min(self.cols - 1, max(0, int(x // self.size))),
+                min(self.rows - 1, max(0, int(y // self.size))))
+    
+    def add(self, i, x, y):
+        key = self.key(x, y)
+        self.where[i] = key
+        self.members.setdefault(key, set()).add(i)
+    
+    def move(self, i, x, y):
+        key = self.key(x, y)
+        old = self.where.get(i)
+        if key != old:
+            if old is not None:
+                self.members[old].discard(i)
+            self.where[i] = key
+            self.members.setdefault(key, set()).add(i)
+    
+    def remove(self, i):
+        key = self.where.pop(i, None)
+        if key is not None:
+            self.members[key].discard(i)
+    
+    def around(self, x, y, radius):
+        cx, cy = self.key(x, y)
+        return [(i, j) for i in range(max(0, cx - radius), min(self.cols, cx + radius + 1))
+                for j in range(max(0, cy - radius), min(self.rows, cy + radius + 1))]
+    
+    def region(self, x, y, radius):
+        cx, cy = self.key(x, y)
+        size = self.size
+        return (max(0, cx - radius) * size, min(self.width, (cx + radius + 1) * size),
+                max(0, cy - radius) * size, min(self.height, (cy + radius + 1) * size))
+    
+    def covering(self, left, right, bottom, top):
+        cx1, cy1 = self.key(left, bottom)
+        cx2, cy2 = self.key(right, top)
+        return [(i, j) for i in range(cx1, cx2 + 1) for j in range(cy1, cy2 + 1)]
+    
+    def awake(self, x, y, radius=AWAKE_RADIUS):
+        found = []
+        for key in self.around(x, y, radius):
+            found.extend(self.members.get(key, ()))
+        found.sort()
+        return found
+
+class Horde:
+    def __init__(self, config, level, grid, seed):
+        self.delay = config.get("delay", 2 * TICK_RATE)
+        self.interval = config.get("interval", 15 * TICK_RATE)
+        self.first = config.get("first", 10)
+        self.growth = config.get("growth", 1.5)
+        self.shooters = config.get("shooters", 0.2)
+        self.shooters_step = config.get("shooters_step", 0.0)
+        self.shooters_max = config.get("shooters_max", 0.5)
+        self.cap = config.get("cap", 5000)
+        self.batch = config.get("batch", HORDE_BATCH)
+        self.clearance = config.get("clearance", HORDE_CLEARANCE)
+        self.px, self.py = Horde.points(level, grid)
+        self.cols = int(-(-level.width // HORDE_GAP)) + 2
+        self.rows = int(-(-level.height // HORDE_GAP)) + 2
+        self.cells = (self.py // HORDE_GAP).astype(np.int64) * self.cols + (self.px // HORDE_GAP).astype(np.int64)
+        self.rng = np.random.default_rng(seed)
+        self.wave = 0
+        self.timer = self.delay
+        self.pending = []
+        self.wait = 0
+        self.times = deque(maxlen=HORDE_WINDOW)
+        self.limit = None
+        self.peak = 0
+    
+    @staticmethod
+    def points(level, grid, spacing=HORDE_SPACING, tries=30):
+        if level.spawns is not None:
+            return level.spawns
+        rng = random.Random(level.name)
+        cs = spacing / math.sqrt(2)
+        cols, rows = int(level.width // cs) + 1, int(level.height // cs) + 1
+        cells = {}
+        px, py = [], []
+        active = []
+        
+        def accept(x, y):
+            if grid.collide(x, y, 32, 32):
+                return False
+            cx, cy = int(x // cs), int(y // cs)
+            for i in range(max(0, cx - 2), min(cols, cx + 3)):
+                for j in range(max(0, cy - 2), min(rows, cy + 3)):
+                    k = cells.get((i, j))
+                    if k is not None and (px[k] - x) ** 2 + (py[k] - y) ** 2 < spacing * spacing:
+                        return False
+            cells[(cx, cy)] = len(px)
+            active.append(len(px))
+            px.append(x)
+            py.append(y)
+            return True
+        
+        margin = 40
+        for _ in range(tries):
+            if accept(rng.uniform(margin, level.width - margin), rng.uniform(margin, level.height - margin)):
+                break
+        while active:
+            n = rng.randrange(len(active))
+            k = active[n]
+            for _ in range(tries):
+                angle = rng.uniform(0, 2 * math.pi)
+                r = rng.uniform(spacing, 2 * spacing)
+                x, y = px[k] + r * math.cos(angle), py[k] + r * math.sin(angle)
+                if margin <= x <= level.width - margin and margin <= y <= level.height - margin and accept(x, y):
+                    break
+            else:
+                active[n] = active[-1]
+                active.pop()
+        level.spawns = (np.array(px), np.array(py))
+        return level.spawns
+    
+    def state(self):
+        return {"wave": self.wave, "timer": self.timer, "wait": self.wait, "pending": list(self.pending), "rng": self.rng.bit_generator.state}
+    
+    def load(self, state):
+        self.wave = state["wave"]
+        self.timer = state["timer"]
+        self.wait = state["wait"]
+        self.pending = list(state["pending"])
+        self.rng.bit_generator.state = state["rng"]
+    
+    def update(self, sim):
+        if not self.pending and (self.timer <= 0 or (self.wave and sim.alive_count == 0)):
+            self.wave += 1
+            self.timer = self.interval
+            size = min(self.cap - sim.alive_count, round(self.first * self.growth ** (self.wave - 1)))
+            share = min(self.shooters_max, self.shooters + self.shooters_step * (self.wave - 1))
+            self.pending = ["shooter" if roll < share else "normal" for roll in self.rng.random(max(0, size)).tolist()]
+        self.timer -= 1
+        self.wait -= 1
+        if self.pending and self.wait <= 0:
+            wanted = self.pending[:self.batch]
+            if self.spawn(sim, wanted) < len(wanted):
+                self.wait = HORDE_BACKOFF
+    
+    def spawn(self, sim, etypes):
+        team = sim.team()
+        near = np.full(len(self.px), np.inf)
+        for player in team:
+            near = np.minimum(near, (self.px - player.x) ** 2 + (self.py - player.y) ** 2)
+        near = np.sqrt(near)
+        taken = np.zeros(self.rows * self.cols, dtype=bool)
+        live = [e for e in sim.enemies if e.alive]
+        if live:
+            cx = (np.array([e.x for e in live]) // HORDE_GAP).astype(np.int64)
+            cy = (np.array([e.y for e in live]) // HORDE_GAP).astype(np.int64)
+            cells = np.clip(cy, 0, self.rows - 1) * self.cols + np.clip(cx, 0, self.cols - 1)
+            for offset in (0, -1, 1, -self.cols, self.cols, -self.cols - 1, -self.cols + 1, self.cols - 1, self.cols + 1):
+                taken[np.clip(cells + offset, 0, len(taken) - 1)] = True
+        free = np.flatnonzero(~taken[self.cells] & (near >= self.clearance))
+        if len(free) == 0:
+            return 0
+        order = near[free] + self.rng.uniform(0, HORDE_SPREAD, len(free))
+        count = min(len(etypes), len(free))
+        chosen = free[np.argsort(order, kind="stable")[:count]]
+        spots = []
+        for k, etype in zip(chosen.tolist(), etypes):
+            x, y = float(self.px[k]), float(self.py[k])
+            home = min(team, key=lambda player: (player.x - x) ** 2 + (player.y - y) ** 2)
+            spots.append((x, y, etype, home.x, home.y))
+        sim.spawn_enemies(spots)
+        del self.pending[:count]
+        self.peak = max(self.peak, sim.alive_count)
+        return count
+    
+    def measure(self, elapsed, alive):
+        self.times.append(elapsed)
+        if self.limit is None and len(self.times) == HORDE_WINDOW and sum(self.times) / HORDE_WINDOW > HORDE_BUDGET:
+            self.limit = alive
+        return self.limit
+
+class ParticleSystem:
+    def __init__(self, capacity=65536, seed=None):
+        self.capacity = capacity
+        self.rng = np.random.default_rng(seed)
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.size = np.zeros(capacity)
+        self.color = np.zeros((capacity, 4), dtype=np.uint8)
+        self.life = np.zeros(capacity, dtype=np.int32)
+        self.max_life = 20
+        self.head = 0
+        self.count = 0
+    
+    def __len__(self):
+        return self.count
+    
+    def emit(self, x, y, color, count):
+        count = min(count, self.capacity)
+        idx = (self.head + np.arange(count)) % self.capacity
+        self.head = (self.head + count) % self.capacity
+        self.x[idx] = x
+        self.y[idx] = y
+        self.vx[idx] = self.rng.uniform(-3, 3, count)
+        self.vy[idx] = self.rng.uniform(-3, 3, count)
+        self.size[idx] = self.rng.uniform(2, 5, count)
+        self.color[idx] = color
+        self.life[idx] = self.max_life
+        self.count = min(self.capacity, self.count + count)
+    
+    def spans(self):
+        start = self.head - self.count
+        if start >= 0:
+            return [slice(start, self.head)]
+        return [slice(start + self.capacity, self.capacity), slice(0, self.head)]
     
     def update(self):
-        self.x += self.vx
-        self.y += self.vy
-        self.life -= 1
-        return self.life > 0
+        if self.count == 0:
+            return
+        dead = 0
+        for part in self.spans():
+            self.x[part] += self.vx[part]
+            self.y[part] += self.vy[part]
+            self.life[part] -= 1
+            dead += int(np.count_nonzero(self.life[part] == 0))
+        self.count -= dead
+    
+    def clear(self):
+        self.life[:] = 0
+        self.count = 0
+    
+    def live(self):
+        return np.concatenate([np.arange(part.start, part.stop) for part in self.spans()])
+    
+    def vertices(self):
+        idx = self.live()
+        data = np.empty((len(idx), 7), dtype=np.float32)
+        data[:, 0] = self.x[idx]
+        data[:, 1] = self.y[idx]
+        data[:, 2] = self.size[idx]
+        data[:, 3:6] = self.color[idx, :3] / 255
+        data[:, 6] = (self.life[idx] * 255 // self.max_life) / 255
+        return data
     
     def draw(self):
-        alpha = int((self.life / 20) * 255)
-        color = list(self.color)
-        color[3] = alpha
-        arcade.draw_circle_filled(self.x, self.y, self.size, color)
+        for i in self.live():
+            color = self.color[i].tolist()
+            color[3] = int((self.life[i] / self.max_life) * 255)
+            arcade.draw_circle_filled(self.x[i], self.y[i], self.size[i], color)
 
 class BloodEffect:
     blood_textures = []
-    textures_loaded = False
     
     def __init__(self, x, y):
         self.x = x
@@ -420,12 +1605,6 @@ class BloodEffect:
         self.active = True
         self.lifetime = 0.5
         self.timer = 0
-        
-        if not BloodEffect.textures_loaded:
-            for i in range(0, 28):
-                if os.path.exists(f"png/{i}.png"):
-                    BloodEffect.blood_textures.append(arcade.load_texture(f"png/{i}.png"))
-            BloodEffect.textures_loaded = True
     
     def update(self, delta_time):
         if not self.active:
@@ -437,7 +1616,7 @@ class BloodEffect:
             return
             
         self.animation_timer += delta_time
-        if self.animation_timer >= self.animation_speed:
+        if self.animation_timer >= self.animation_speed and BloodEffect.blood_textures:
             self.animation_timer = 0
             self.current_texture = (self.current_texture + 1) % len(BloodEffect.blood_textures)
     
@@ -447,283 +1626,2257 @@ class BloodEffect:
             size = 128
             arcade.draw_texture_rect(texture, arcade.LBWH(self.x - size//2, self.y - size//2, size, size))
 
-class Level(arcade.View):
-    def __init__(self, level_num, menu):
-        super().__init__()
-        self.level = level_num
-        self.menu = menu
-        self.player = None
-        self.enemies = []
-        self.bullets = []
-        self.enemy_bullets = []
-        self.walls = []
-        self.particles = []
-        self.blood_effects = []
-        self.score = 0
-        self.kills = 0
-        self.game_over = False
-        self.win = False
-        self.keys = [False, False, False, False]
-        self.mouse_x = 0
-        self.mouse_y = 0
-        self.shoot_timer = 0
-        self.shoot_delay = 10
-        self.damage_cooldown = 0
-        self.show_message = False
-        self.message_timer = 0
-        
-        self.setup_level()
+class SoundBank:
+    paths = {"shot": ":resources:sounds/laser1.wav", "hit": ":resources:sounds/hit3.wav"}
+    sounds = {}
+    loaded = False
     
-    def is_valid_spawn(self, x, y, w, h, walls, check_enemies=True):
-        for wall in walls:
-            if wall.check_collide(x, y, w, h):
-                return False
-        
-        if check_enemies:
-            for enemy in self.enemies:
-                if abs(enemy.x - x) < 50 and abs(enemy.y - y) < 50:
-                    return False
-        
-        return True
+    def __init__(self, max_voices=4):
+        self.max_voices = max_voices
+        self.voices = {name: deque() for name in SoundBank.paths}
+        SoundBank.load()
     
-    def try_spawn_enemy(self, x, y, etype):
-        if self.is_valid_spawn(x, y, 32, 32, self.walls, True):
-            self.enemies.append(Enemy(x, y, COLORS[len(self.enemies)%len(COLORS)], etype))
-            return True
-        return False
+    @classmethod
+    def load(cls):
+        if cls.loaded:
+            return
+        for name, path in cls.paths.items():
+            try:
+                cls.sounds[name] = arcade.load_sound(path)
+            except Exception:
+                cls.sounds[name] = None
+        cls.loaded = True
     
-    def setup_level(self):
-        self.enemies = []
-        self.walls = []
-        self.game_over = False
-        self.win = False
-        self.show_message = False
-        
-        base_walls = [
-            Wall(600, 30, 1200, 40),
-            Wall(600, 770, 1200, 40),
-            Wall(30, 400, 40, 800),
-            Wall(1170, 400, 40, 800),
-        ]
-        self.walls.extend(base_walls)
-        
-        if self.level == 1:
-            self.walls.extend([
-                Wall(200, 650, 20, 200),
-                Wall(460, 650, 20, 200),
-                Wall(200, 300, 20, 300),
-                Wall(460, 300, 20, 300),
-                Wall(130, 450, 160, 25),
-                Wall(800, 450, 700, 25),
-                Wall(800, 650, 20, 200),
-            ])
-            
-            self.player = Player(350, 100)
-            
-            enemy_positions = [
-                (100, 400, "normal"), (500, 400, "normal"), (800, 400, "normal"),
-                (800, 100, "shooter"), (100, 700, "shooter"), (500, 700, "normal"),
-                (1000, 700, "shooter"), (1000, 600, "normal"), (300, 500, "shooter"),
-                (700, 300, "normal"),
-            ]
-            
-        elif self.level == 2:
-            self.walls.extend([
-                Wall(400, 500, 200, 20), Wall(400, 300, 200, 20),
-                Wall(800, 500, 200, 20), Wall(800, 300, 200, 20),
-                Wall(200, 400, 20, 300), Wall(1000, 400, 20, 300),
-                Wall(600, 150, 400, 20), Wall(600, 650, 400, 20),
-                Wall(300, 200, 20, 150), Wall(900, 200, 20, 150),
-                Wall(300, 600, 20, 150), Wall(900, 600, 20, 150),
-            ])
-            
-            self.player = Player(100, 400)
-            
-            enemy_positions = [
-                (400, 400, "shooter"), (800, 400, "shooter"), (300, 250, "normal"),
-                (900, 250, "normal"), (300, 550, "normal"), (900, 550, "normal"),
-                (200, 150, "shooter"), (1000, 150, "shooter"), (200, 650, "shooter"),
-                (1000, 650, "shooter"), (500, 200, "normal"), (700, 600, "normal"),
-            ]
-            
-        elif self.level == 3:
-            self.walls.extend([
-                Wall(300, 500, 20, 400), Wall(500, 500, 20, 400),
-                Wall(700, 500, 20, 400), Wall(900, 500, 20, 400),
-                Wall(200, 300, 400, 20), Wall(600, 300, 400, 20),
-                Wall(400, 200, 20, 200), Wall(800, 200, 20, 200),
-                Wall(400, 600, 20, 200), Wall(800, 600, 20, 200),
-                Wall(150, 150, 200, 20), Wall(1050, 150, 200, 20),
-                Wall(150, 650, 200, 20), Wall(1050, 650, 200, 20),
-            ])
-            
-            self.player = Player(600, 400)
-            
-            enemy_positions = [
-                (200, 200, "shooter"), (400, 200, "shooter"), (600, 200, "shooter"),
-                (800, 200, "shooter"), (1000, 200, "shooter"), (200, 600, "shooter"),
-                (400, 600, "shooter"), (600, 600, "shooter"), (800, 600, "shooter"),
-                (1000, 600, "shooter"), (300, 400, "normal"), (500, 400, "normal"),
-                (700, 400, "normal"), (900, 400, "normal"),
-            ]
-        
-        for x, y, etype in enemy_positions:
-            self.try_spawn_enemy(x, y, etype)
+    def play(self, name, volume=0.1):
+        sound = SoundBank.sounds.get(name)
+        if sound is None:
+            return None
+        voices = self.voices[name]
+        try:
+            for _ in range(len(voices)):
+                player = voices.popleft()
+                if sound.is_playing(player):
+                    voices.append(player)
+            if len(voices) >= self.max_voices:
+                sound.stop(voices.popleft())
+            player = sound.play(volume=volume)
+        except Exception:
+            return None
+        voices.append(player)
+        return player
+
+PARTICLE_VS = """
+#version 330
+in vec2 in_pos;
+in float in_size;
+in vec4 in_color;
+out float v_size;
+out vec4 v_color;
+void main() {
+    gl_Position = vec4(in_pos, 0.0, 1.0);
+    v_size = in_size;
+    v_color = in_color;
+}
+"""
+
+PARTICLE_GS = """
+#version 330
+layout (points) in;
+layout (triangle_strip, max_vertices = 4) out;
+uniform WindowBlock {
+    mat4 projection;
+    mat4 view;
+} window;
+in float v_size[];
+in vec4 v_color[];
+out vec2 g_uv;
+out vec4 g_color;
+void main() {
+    mat4 mvp = window.projection * window.view;
+    vec2 center = gl_in[0].gl_Position.xy;
+    vec2 corners[4] = vec2[4](vec2(-1.0, -1.0), vec2(1.0, -1.0), vec2(-1.0, 1.0), vec2(1.0, 1.0));
+    for (int i = 0; i < 4; i++) {
+        g_uv = corners[i];
+        g_color = v_color[0];
+        gl_Position = mvp * vec4(center + corners[i] * v_size[0], 0.0, 1.0);
+        EmitVertex();
+    }
+    EndPrimitive();
+}
+"""
+
+PARTICLE_FS = """
+#version 330
+in vec2 g_uv;
+in vec4 g_color;
+out vec4 f_color;
+void main() {
+    if (dot(g_uv, g_uv) > 1.0) discard;
+    f_color = g_color;
+}
+"""
+
+PROJECTILE_VS = """
+#version 330
+in vec2 in_pos;
+in float in_size;
+out float v_size;
+void main() {
+    gl_Position = vec4(in_pos, 0.0, 1.0);
+    v_size = in_size;
+}
+"""
+
+PROJECTILE_GS = """
+#version 330
+layout (points) in;
+layout (triangle_strip, max_vertices = 4) out;
+uniform WindowBlock {
+    mat4 projection;
+    mat4 view;
+} window;
+in float v_size[];
+out vec2 g_uv;
+void main() {
+    mat4 mvp = window.projection * window.view;
+    vec2 center = gl_in[0].gl_Position.xy;
+    vec2 corners[4] = vec2[4](vec2(-1.0, -1.0), vec2(1.0, -1.0), vec2(-1.0, 1.0), vec2(1.0, 1.0));
+    for (int i = 0; i < 4; i++) {
+        g_uv = corners[i];
+        gl_Position = mvp * vec4(center + corners[i] * v_size[0] * 0.5, 0.0, 1.0);
+        EmitVertex();
+    }
+    EndPrimitive();
+}
+"""
+
+PROJECTILE_FS = """
+#version 330
+uniform sampler2D tex;
+uniform int textured;
+uniform vec4 color;
+in vec2 g_uv;
+out vec4 f_color;
+void main() {
+    if (textured == 1) {
+        f_color = texture(tex, vec2(g_uv.x, -g_uv.y) * 0.5 + 0.5);
+    } else {
+        if (dot(g_uv, g_uv) > 1.0) discard;
+        f_color = color;
+    }
+}
+"""
+
+class TextLayer:
+    def __init__(self):
+        self.batch = pyglet.graphics.Batch()
+        self.texts = {}
+        self.state = {}
+        self.shown = set()
     
-    def on_show(self):
-        self.window.background_color = (0,0,0)
-        self.game_over = False
-        self.win = False
-        self.show_message = False
+    def text(self, key, value, x, y, color, size, **style):
+        value = str(value)
+        item = self.texts.get(key)
+        old = self.state.get(key)
+        if item is None or old[5] != style:
+            if item is not None:
+                item.label.delete()
+            item = self.texts[key] = arcade.Text(value, x, y, color, size, batch=self.batch, **style)
+        else:
+            if value != old[0]:
+                item.text = value
+            if x != old[1] or y != old[2]:
+                item.position = (x, y)
+            if color != old[3]:
+                item.color = color
+            if size != old[4]:
+                item.font_size = size
+        self.state[key] = (value, x, y, color, size, style)
+        self.shown.add(key)
     
-    def on_mouse_motion(self, x, y, dx, dy):
-        self.mouse_x = x
-        self.mouse_y = y
+    def draw(self):
+        for key, item in self.texts.items():
+            visible = key in self.shown
+            if item.visible != visible:
+                item.visible = visible
+        self.shown = set()
+        self.batch.draw()
+
+class EntityRenderer:
+    def __init__(self):
+        self.blood = arcade.SpriteList()
+        self.enemies = arcade.SpriteList()
+        self.player = arcade.SpriteList()
+        self.bars = arcade.SpriteList()
+        self.solid = arcade.SpriteSolidColor(32, 32).texture
+        self.particle_program = None
+        self.particle_buffer = None
+        self.particle_geometry = None
+        self.projectile_program = None
+        self.projectile_buffer = None
+        self.projectile_geometry = None
+        self.projectile_textures = {}
+        self.projectile_data = np.zeros((0, 3), dtype=np.float32)
+        self.projectile_counts = (0, 0)
     
-    def on_draw(self):
-        self.clear()
-        w, h = self.window.width, self.window.height
-        
-        bg = [(20,20,40), (40,20,20), (20,40,20)]
-        arcade.draw_lrbt_rectangle_filled(0, w, 0, h, bg[self.level-1])
+    def fit(self, sprites, count):
+        while len(sprites) < count:
+            sprites.append(arcade.Sprite(self.solid))
+        while len(sprites) > count:
+            sprites.pop()
+    
+    def put(self, sprite, texture, x, y, size, color=(255,255,255,255)):
+        if sprite.texture is not texture:
+            sprite.texture = texture
+        if sprite.width != size or sprite.height != size:
+            sprite.size = (size, size)
+        sprite.position = (x, y)
+        sprite.color = color
+    
+    def put_bar(self, sprite, x, y, hitbox_size, health, max_health, color):
+        width = max(0, (health / max_health) * hitbox_size)
+        if sprite.texture is not self.solid:
+            sprite.texture = self.solid
+        sprite.size = (width, 3)
+        sprite.position = (x - hitbox_size//2 + width/2, y - hitbox_size//2 - 3.5)
+        sprite.color = color
+    
+    def sync(self, level, view=None):
+        left, right, bottom, top = view or (-math.inf, math.inf, -math.inf, math.inf)
+        blood = [b for b in level.blood_effects if b.active and left < b.x < right and bottom < b.y < top] if BloodEffect.blood_textures else []
+        self.fit(self.blood, len(blood))
+        for sprite, b in zip(self.blood, blood):
+            self.put(sprite, BloodEffect.blood_textures[b.current_texture], b.x, b.y, 128)
         
-        for i in range(0, w, 50):
-            for j in range(0, h, 50):
-                arcade.draw_lrbt_rectangle_outline(i - 25, i + 25, j - 25, j + 25, (255,255,255,20), 1)
+        alpha = level.alpha
+        enemies = level.enemies_in(left, right, bottom, top) if view else [e for e in level.enemies if e.alive]
+        positions = [e.lerp(alpha) for e in enemies]
+        self.fit(self.enemies, len(enemies))
+        for sprite, e, (x, y) in zip(self.enemies, enemies, positions):
+            textures = Enemy.enemy_textures.get(e.etype, [])
+            if textures:
+                self.put(sprite, textures[e.current_texture], x, y, e.size)
+            else:
+                self.put(sprite, self.solid, x, y, e.hitbox_size, e.color)
         
-        for wall in self.walls:
-            wall.draw()
+        pool = level.projectiles
+        parts = []
+        for owner in (ProjectilePool.ENEMY, ProjectilePool.PLAYER):
+            live = pool.visible(pool.live(owner), view)
+            data = np.empty((len(live), 3), dtype=np.float32)
+            data[:, 0], data[:, 1] = pool.lerp(live, alpha)
+            data[:, 2] = pool.size[live] if ProjectilePool.textures[owner] else 8
+            parts.append(data)
+        self.projectile_data = np.concatenate(parts)
+        self.projectile_counts = (len(parts[0]), len(parts[1]))
         
-        for blood in self.blood_effects:
-            blood.draw()
+        players = level.team()
+        spots = [player.lerp(alpha) for player in players]
+        self.fit(self.player, len(players))
+        for sprite, player, (px, py) in zip(self.player, players, spots):
+            if Player.player_textures:
+                self.put(sprite, Player.player_textures[player.current_texture], px, py, player.size)
+            else:
+                colors = [(255,0,0,255), (0,255,0,255), (0,0,255,255), (255,255,0,255)]
+                self.put(sprite, self.solid, px, py, player.hitbox_size, colors[player.direction])
         
-        for particle in self.particles:
-            particle.draw()
+        self.fit(self.bars, len(enemies) + len(players))
+        for sprite, e, (x, y) in zip(self.bars, enemies, positions):
+            self.put_bar(sprite, x, y, e.hitbox_size, e.health, e.max_health, (255,0,0,255))
+        for sprite, player, (px, py) in zip(self.bars[len(enemies):], players, spots):
+            self.put_bar(sprite, px, py, player.hitbox_size, player.health, player.max_health, (0,255,0,255))
+    
+    def draw_particles(self, particles):
+        if particles.count == 0:
+            return
+        ctx = arcade.get_window().ctx
+        if self.particle_program is None:
+            self.particle_program = ctx.program(vertex_shader=PARTICLE_VS, geometry_shader=PARTICLE_GS, fragment_shader=PARTICLE_FS)
+        if self.particle_buffer is None or self.particle_buffer.size < particles.capacity * 28:
+            self.particle_buffer = ctx.buffer(reserve=particles.capacity * 28, usage="stream")
+            self.particle_geometry = ctx.geometry([arcade.gl.BufferDescription(self.particle_buffer, "2f 1f 4f", ["in_pos", "in_size", "in_color"])],
+                                                  mode=ctx.POINTS)
+        data = particles.vertices()
+        self.particle_buffer.write(data.tobytes())
+        ctx.enable(ctx.BLEND)
+        self.particle_geometry.render(self.particle_program, vertices=len(data))
+    
+    def draw_projectiles(self):
+        data = self.projectile_data
+        if len(data) == 0:
+            return
+        ctx = arcade.get_window().ctx
+        if self.projectile_program is None:
+            self.projectile_program = ctx.program(vertex_shader=PROJECTILE_VS, geometry_shader=PROJECTILE_GS, fragment_shader=PROJECTILE_FS)
+        if self.projectile_buffer is None or self.projectile_buffer.size < data.nbytes:
+            self.projectile_buffer = ctx.buffer(reserve=max(data.nbytes, 1024 * 12) * 2, usage="stream")
+            self.projectile_geometry = ctx.geometry([arcade.gl.BufferDescription(self.projectile_buffer, "2f 1f", ["in_pos", "in_size"])],
+                                                    mode=ctx.POINTS)
+        self.projectile_buffer.write(data.tobytes())
+        ctx.enable(ctx.BLEND)
+        program = self.projectile_program
+        first = 0
+        for owner, count in zip((ProjectilePool.ENEMY, ProjectilePool.PLAYER), self.projectile_counts):
+            if count:
+                texture = ProjectilePool.textures[owner]
+                if texture:
+                    cached = self.projectile_textures.get(owner)
+                    if cached is None or cached[0] is not texture:
+                        image = texture.image.convert("RGBA")
+                        cached = self.projectile_textures[owner] = (texture, ctx.texture(image.size, components=4, data=image.tobytes()))
+                    cached[1].use(0)
+                    program["tex"] = 0
+                    program["textured"] = 1
+                else:
+                    program["textured"] = 0
+                    program["color"] = tuple(c / 255 for c in ProjectilePool.colors[owner])
+                self.projectile_geometry.render(program, first=first, vertices=count)
+            first += count
+    
+    def draw(self):
+        self.enemies.draw()
+        self.draw_projectiles()
+        self.player.draw()
+        self.bars.draw()
+
+class SaveWriter:
+    pending = {}
+    active = set()
+    errors = {}
+    failed = []
+    thread = None
+    cond = threading.Condition()
+
+    @classmethod
+    def write(cls, path, data):
+        with cls.cond:
+            cls.pending[path] = data
+            if cls.thread is None:
+                cls.thread = threading.Thread(target=cls.run, daemon=True)
+                cls.thread.start()
+                atexit.register(cls.shutdown)
+            cls.cond.notify_all()
+
+    @classmethod
+    def run(cls):
+        while True:
+            with cls.cond:
+                while not cls.pending:
+                    cls.cond.wait()
+                path = next(iter(cls.pending))
+                data = cls.pending.pop(path)
+                cls.active.add(path)
+            error = None
+            try:
+                cls.save(path, data() if callable(data) else data)
+            except Exception as e:
+                error = e
+            with cls.cond:
+                cls.active.discard(path)
+                if error is None:
+                    cls.errors.pop(path, None)
+                else:
+                    cls.errors[path] = error
+                    cls.failed.append((path, error))
+                cls.cond.notify_all()
+
+    @staticmethod
+    def save(path, data):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @classmethod
+    def flush(cls, directory=None):
+        prefix = None if directory is None else os.path.join(directory, "")
+        with cls.cond:
+            while any(prefix is None or path.startswith(prefix) for path in [*cls.pending, *cls.active]):
+                cls.cond.wait()
+
+    @classmethod
+    def report(cls):
+        with cls.cond:
+            failed, cls.failed = cls.failed, []
+        return failed
+
+    @classmethod
+    def shutdown(cls):
+        cls.flush()
+        for path, error in cls.errors.items():
+            print(f"не удалось сохранить {path}: {error}")
+
+class PhaseTimer:
+    def __init__(self):
+        self.totals = {}
+        self.last = 0
+    
+    def start(self):
+        self.last = time.perf_counter()
+    
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.totals[phase] = self.totals.get(phase, 0) + now - self.last
+        self.last = now
+
+class FrameProfiler(PhaseTimer):
+    TRACKS = ["frame", "update", "draw"]
+
+    def __init__(self, history=PROFILE_HISTORY, events=PROFILE_EVENTS):
+        super().__init__()
+        self.track = 1
+        self.current = {}
+        self.frames = deque(maxlen=history)
+        self.events = deque(maxlen=events)
+        self.order = []
+        self.frame_start = None
+        self.stats = []
+        self.text = None
+        self.count = 0
+
+    def start(self, track=1):
+        self.track = track
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        spent = now - self.last
+        self.totals[phase] = self.totals.get(phase, 0) + spent
+        self.current[phase] = self.current.get(phase, 0) + spent
+        track = FrameProfiler.TRACKS[self.track]
+        self.current[track] = self.current.get(track, 0) + spent
+        self.events.append((phase, self.track, self.last, now))
+        self.last = now
+
+    def frame(self):
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.current["frame"] = now - self.frame_start
+            self.events.append(("frame", 0, self.frame_start, now))
+            for phase in self.current:
+                if phase not in self.order:
+                    self.order.append(phase)
+            self.frames.append(self.current)
+        self.current = {}
+        self.frame_start = now
+        self.count += 1
+        if self.count % 15 == 0:
+            self.stats = self.percentiles()
+
+    def percentiles(self):
+        rows = []
+        for phase in sorted(self.order, key=lambda p: (p not in FrameProfiler.TRACKS, self.order.index(p))):
+            samples = np.array([f.get(phase, 0) for f in self.frames])
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1e3
+            rows.append((phase, p50, p95, p99))
+        return rows
+
+    def export(self, path):
+        SaveWriter.write(path, lambda events=list(self.events): FrameProfiler.trace(events))
+        return path
+
+    @staticmethod
+    def trace(events):
+        names = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+                 for tid, name in enumerate(FrameProfiler.TRACKS)]
+        origin = events[0][2] if events else 0
+        spans = [{"name": name, "ph": "X", "pid": 1, "tid": tid,
+                  "ts": round((begin - origin) * 1e6, 1), "dur": round((end - begin) * 1e6, 1)}
+                 for name, tid, begin, end in events]
+        return json.dumps({"traceEvents": names + spans, "displayTimeUnit": "ms"}).encode()
+
+    def draw(self, w, h):
+        x0, y0, scale = w - 500, h - 130, 100 / 0.0333
+        arcade.draw_lrbt_rectangle_filled(x0 - 10, w - 10, y0 - 20 - 18 * len(self.stats), h - 10, (0, 0, 0, 180))
+        update, draw, frame = [], [], []
+        for i, f in enumerate(self.frames):
+            x = x0 + i * 2
+            u = min(f.get("update", 0) * scale, 110)
+            d = min(f.get("draw", 0) * scale, 110 - u)
+            update += [(x, y0), (x, y0 + u)]
+            draw += [(x, y0 + u), (x, y0 + u + d)]
+            frame.append((x, y0 + min(f["frame"] * scale, 110)))
+        if update:
+            arcade.draw_lines(update, (255, 160, 0), 2)
+            arcade.draw_lines(draw, (0, 160, 255), 2)
+        if len(frame) > 1:
+            arcade.draw_line_strip(frame, (255, 255, 255), 1)
+        arcade.draw_line(x0, y0 + 50, x0 + 480, y0 + 50, (255, 0, 0, 160), 1)
+        lines = [f"{'фаза':<15}{'p50':>7}{'p95':>7}{'p99':>7} мс"]
+        lines += [f"{phase:<15}{p50:>7.2f}{p95:>7.2f}{p99:>7.2f}" for phase, p50, p95, p99 in self.stats]
+        if self.text is None:
+            self.text = arcade.Text("", x0, y0 - 10, (255, 255, 255), 11, width=480, multiline=True, anchor_y="top",
+                                    font_name=("Courier New", "DejaVu Sans Mono", "monospace"))
+        self.text.position = (x0, y0 - 10)
+        text = "\n".join(lines)
+        if self.text.text != text:
+            self.text.text = text
+        self.text.draw()
+
+class ReplayRecorder:
+    MAGIC = b"RPL1"
+    FIRE = 0
+    RESTART = 1
+    WEAPON = 2
+
+    def __init__(self, seed, level):
+        self.seed = seed
+        self.level = level
+        self.body = bytearray()
+        self.events = []
+        self.mouse = None
+        self.ticks = 0
+
+    @staticmethod
+    def checksum(sim):
+        player = sim.player
+        return zlib.crc32(struct.pack("<ddiii", player.x, player.y, player.health, sim.kills, sim.alive_count))
+
+    def event(self, kind, *args):
+        self.events.append((kind, args))
+
+    def tick(self, sim):
+        flags = sum(1 << i for i, pressed in enumerate(sim.keys) if pressed)
+        mouse = (int(sim.mouse_x), int(sim.mouse_y))
+        if mouse != self.mouse:
+            flags |= 16
+        if self.events:
+            flags |= 32
+        if self.ticks % REPLAY_CHECK == 0:
+            flags |= 64
+        body = self.body
+        body.append(flags)
+        if flags & 16:
+            body += struct.pack("<hh", *mouse)
+            self.mouse = mouse
+        if flags & 32:
+            body.append(len(self.events))
+            for kind, args in self.events:
+                body.append(kind)
+                if kind == ReplayRecorder.FIRE:
+                    body += struct.pack("<dd", *args)
+                elif kind == ReplayRecorder.WEAPON:
+                    body.append(args[0])
+            self.events = []
+        if flags & 64:
+            body += struct.pack("<I", ReplayRecorder.checksum(sim))
+        self.ticks += 1
+
+    def save(self, directory=REPLAY_DIR):
+        path = os.path.join(directory, time.strftime("replay_%Y%m%d_%H%M%S.rpl"))
+        level = str(self.level).encode()
+        head = ReplayRecorder.MAGIC + struct.pack("<QHH", self.seed, TICK_RATE, len(level)) + level
+        SaveWriter.write(path, lambda body=bytes(self.body): head + zlib.compress(body, 9))
+        return path
+
+class ReplayPlayer:
+    def __init__(self, data):
+        if data[:4] != ReplayRecorder.MAGIC:
+            raise ValueError("not a replay")
+        self.seed, rate, size = struct.unpack_from("<QHH", data, 4)
+        if rate != TICK_RATE:
+            raise ValueError(f"replay recorded at {rate} ticks/s")
+        level = data[16:16 + size].decode()
+        self.level = int(level) if level.isdigit() else level
+        self.body = zlib.decompress(data[16 + size:])
+        self.pos = 0
+        self.tick = 0
+        self.desync = None
+        self.accumulator = 0
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return ReplayPlayer(f.read())
+
+    @staticmethod
+    def latest(directory=REPLAY_DIR):
+        if not os.path.isdir(directory):
+            return None
+        paths = sorted(name for name in os.listdir(directory) if name.endswith(".rpl"))
+        return os.path.join(directory, paths[-1]) if paths else None
+
+    def start(self, sim):
+        sim.level = self.level
+        sim.reseed(self.seed)
+        sim.replay = self
+
+    def stop(self, sim):
+        sim.replay = None
+        sim.keys = [False, False, False, False]
+        sim.scheduler.budget = AI_BUDGET
+
+    def done(self):
+        return self.pos >= len(self.body)
+
+    def apply(self, sim):
+        body = self.body
+        flags = body[self.pos]
+        self.pos += 1
+        if flags & 16:
+            sim.mouse_x, sim.mouse_y = struct.unpack_from("<hh", body, self.pos)
+            self.pos += 4
+        if flags & 32:
+            count = body[self.pos]
+            self.pos += 1
+            for _ in range(count):
+                kind = body[self.pos]
+                self.pos += 1
+                if kind == ReplayRecorder.FIRE:
+                    sim.fire(*struct.unpack_from("<dd", body, self.pos))
+                    self.pos += 16
+                elif kind == ReplayRecorder.RESTART:
+                    sim.restart()
+                elif kind == ReplayRecorder.WEAPON:
+                    sim.switch(body[self.pos])
+                    self.pos += 1
+        sim.keys = [bool(flags & (1 << i)) for i in range(4)]
+        if flags & 64:
+            if struct.unpack_from("<I", body, self.pos)[0] != ReplayRecorder.checksum(sim) and self.desync is None:
+                self.desync = self.tick
+            self.pos += 4
+        self.tick += 1
+
+    def advance(self, sim, dt):
+        self.accumulator += dt
+        ticks = 0
+        while self.accumulator >= TICK and ticks < MAX_TICKS_PER_FRAME:
+            if self.done():
+                self.stop(sim)
+                return
+            self.accumulator -= TICK
+            self.apply(sim)
+            sim.step()
+            ticks += 1
+        self.accumulator %= TICK
+        sim.alpha = self.accumulator / TICK
+
+    def run(self, sim):
+        while not self.done():
+            self.apply(sim)
+            sim.step()
+        self.stop(sim)
+
+class Snapshot:
+    MAGIC = b"SNAP"
+    VERSION = 1
+    STATE = ["score", "kills", "game_over", "win", "shoot_timer", "damage_cooldown", "alive_count", "weapon"]
+    POOL = ["x", "y", "px", "py", "dx", "dy", "speed", "damage", "size", "owner", "seq", "active", "used", "free"]
+    PARTICLES = ["x", "y", "vx", "vy", "size", "color", "life"]
+    TUPLES = ["color", "move_dir", "last_player_pos"]
+
+    def __init__(self, sim=None):
+        if sim is None:
+            return
+        if sim.enemy_system and sim.enemy_system.source is sim.enemies:
+            sim.enemy_system.store(sim.enemies)
+        self.level = sim.level
+        self.state = {name: getattr(sim, name) for name in Snapshot.STATE}
+        self.player = dict(vars(sim.player))
+        self.enemies = []
+        for enemy in sim.enemies:
+            fields = dict(vars(enemy))
+            fields["patrol_points"] = list(fields["patrol_points"])
+            self.enemies.append(fields)
+        self.blood = [dict(vars(blood)) for blood in sim.blood_effects]
+        self.tracers = [list(tracer) for tracer in sim.tracers]
+        self.where = dict(sim.chunks.where)
+        self.awake = list(sim.awake)
+        scheduler = sim.scheduler
+        self.scheduler = (scheduler.tick, dict(scheduler.last), scheduler.cost)
+        self.random = random.getstate()
+        pool = sim.projectiles
+        self.pool = {name: getattr(pool, name).copy() for name in Snapshot.POOL}
+        self.pool_counts = (pool.free_count, pool.next_seq)
+        particles = sim.particles
+        self.particle_idx = np.flatnonzero(particles.life > 0)
+        self.particles = {name: getattr(particles, name)[self.particle_idx] for name in Snapshot.PARTICLES}
+        self.particle_head = particles.head
+        self.particle_rng = particles.rng.bit_generator.state
+        self.horde = sim.horde.state() if sim.horde else None
+
+    def restore(self, sim):
+        if sim.level != self.level:
+            sim.level = self.level
+            sim.setup_level()
+        for name, value in self.state.items():
+            setattr(sim, name, value)
+        player = sim.player or Player.__new__(Player)
+        player.__dict__.clear()
+        player.__dict__.update(self.player)
+        sim.player = player
+        enemies = []
+        for fields in self.enemies:
+            enemy = Enemy.__new__(Enemy)
+            enemy.__dict__.update(fields)
+            enemy.patrol_points = list(enemy.patrol_points)
+            enemies.append(enemy)
+        sim.enemies = enemies
+        blood_effects = []
+        for fields in self.blood:
+            blood = BloodEffect.__new__(BloodEffect)
+            blood.__dict__.update(fields)
+            blood_effects.append(blood)
+        sim.blood_effects = blood_effects
+        sim.tracers = [list(tracer) for tracer in self.tracers]
+        chunks = ChunkMap(sim.world_width, sim.world_height)
+        for i, key in self.where.items():
+            chunks.where[i] = key
+            chunks.members.setdefault(key, set()).add(i)
+        sim.chunks = chunks
+        sim.awake = list(self.awake)
+        scheduler = AIScheduler(budget=sim.scheduler.budget)
+        scheduler.tick, scheduler.last, scheduler.cost = self.scheduler[0], dict(self.scheduler[1]), self.scheduler[2]
+        sim.scheduler = scheduler
+        random.setstate(self.random)
+        pool = sim.projectiles
+        for name, arr in self.pool.items():
+            getattr(pool, name)[:] = arr
+        pool.free_count, pool.next_seq = self.pool_counts
+        particles = sim.particles
+        particles.life[:] = 0
+        for name, arr in self.particles.items():
+            getattr(particles, name)[self.particle_idx] = arr
+        particles.head = self.particle_head
+        particles.count = len(self.particle_idx)
+        particles.rng.bit_generator.state = self.particle_rng
+        if sim.horde and self.horde:
+            sim.horde.load(self.horde)
+        sim.nav.target = None
+
+    def arrays(self):
+        arrays = {"pool_" + name: arr for name, arr in self.pool.items()}
+        arrays.update({"particle_" + name: arr for name, arr in self.particles.items()})
+        arrays["particle_idx"] = self.particle_idx
+        return arrays
+
+    def to_bytes(self):
+        meta = {}
+        blobs = []
+        offset = 0
+        for name, arr in self.arrays().items():
+            meta[name] = [arr.dtype.str, list(arr.shape), offset]
+            blobs.append(np.ascontiguousarray(arr).tobytes())
+            offset += arr.nbytes
+        head = json.dumps({
+            "level": self.level, "state": self.state, "player": self.player, "enemies": self.enemies,
+            "blood": self.blood, "tracers": self.tracers, "where": [[i, *key] for i, key in self.where.items()], "awake": self.awake,
+            "scheduler": [self.scheduler[0], list(self.scheduler[1].items()), self.scheduler[2]],
+            "random": self.random, "pool_counts": self.pool_counts, "particle_head": self.particle_head,
+            "particle_rng": self.particle_rng, "horde": self.horde, "arrays": meta,
+        }, default=lambda value: value.item()).encode()
+        return Snapshot.MAGIC + struct.pack("<HI", Snapshot.VERSION, len(head)) + head + zlib.compress(b"".join(blobs))
+
+    @staticmethod
+    def from_bytes(data):
+        if data[:4] != Snapshot.MAGIC:
+            raise ValueError("not a snapshot")
+        version, size = struct.unpack_from("<HI", data, 4)
+        if version != Snapshot.VERSION:
+            raise ValueError(f"snapshot version {version}, expected {Snapshot.VERSION}")
+        head = json.loads(data[10:10 + size])
+        blob = zlib.decompress(data[10 + size:])
+        arrays = {name: np.frombuffer(blob, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape).copy()
+                  for name, (dtype, shape, offset) in head["arrays"].items()}
+        snapshot = Snapshot()
+        snapshot.level = head["level"]
+        snapshot.state = head["state"]
+        snapshot.player = head["player"]
+        snapshot.enemies = head["enemies"]
+        for fields in snapshot.enemies:
+            for name in Snapshot.TUPLES:
+                fields[name] = tuple(fields[name])
+            fields["patrol_points"] = [tuple(p) for p in fields["patrol_points"]]
+        snapshot.blood = head["blood"]
+        snapshot.tracers = head.get("tracers", [])
+        snapshot.where = {i: (kx, ky) for i, kx, ky in head["where"]}
+        snapshot.awake = head["awake"]
+        tick, last, cost = head["scheduler"]
+        snapshot.scheduler = (tick, dict(last), cost)
+        version, state, gauss = head["random"]
+        snapshot.random = (version, tuple(state), gauss)
+        snapshot.pool = {name: arrays["pool_" + name] for name in Snapshot.POOL}
+        snapshot.pool_counts = tuple(head["pool_counts"])
+        snapshot.particle_idx = arrays["particle_idx"]
+        snapshot.particles = {name: arrays["particle_" + name] for name in Snapshot.PARTICLES}
+        snapshot.particle_head = head["particle_head"]
+        snapshot.particle_rng = head["particle_rng"]
+        snapshot.horde = head.get("horde")
+        return snapshot
+
+    def save(self, path=QUICK_SAVE):
+        SaveWriter.write(path, self.to_bytes)
+        return path
+
+    @staticmethod
+    def load(path=QUICK_SAVE):
+        with open(path, "rb") as f:
+            return Snapshot.from_bytes(f.read())
+
+class Simulation:
+    PROJECTILES = 8192
+    PARTICLES = 65536
+    NAV_EVERY = 1
+    BLASTER = 0
+    RAIL = 1
+    
+    def __init__(self, level_num, menu=None):
+        self.level = level_num
+        self.menu = menu
+        self.player = None
+        self.enemies = []
+        self.projectiles = ProjectilePool(self.PROJECTILES)
+        self.walls = []
+        self.world_width = SCREEN_WIDTH
+        self.world_height = SCREEN_HEIGHT
+        self.background = (0, 0, 0)
+        self.wall_grid = WallGrid([])
+        self.nav = None
+        self.los = None
+        self.enemy_hash = SpatialHash()
+        self.chunks = ChunkMap(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.awake = []
+        self.alive_count = 0
+        self.scheduler = AIScheduler()
+        self.enemy_system = EnemySystem() if BATCHED_AI else None
+        self.particles = ParticleSystem(self.PARTICLES)
+        self.blood_effects = []
+        self.tracers = []
+        self.score = 0
+        self.kills = 0
+        self.game_over = False
+        self.win = False
+        self.keys = [False, False, False, False]
+        self.mouse_x = 0
+        self.mouse_y = 0
+        self.shoot_timer = 0
+        self.shoot_delay = 10
+        self.weapon = Simulation.BLASTER
+        self.damage_cooldown = 0
+        self.show_message = False
+        self.message_timer = 0
+        self.accumulator = 0
+        self.alpha = 1.0
+        self.timer = None
+        self.recorder = None
+        self.replay = None
+        self.guests = []
+        self.net = None
+        self.horde = None
         
-        for enemy in self.enemies:
-            enemy.draw()
+        self.setup_level()
+    
+    def is_valid_spawn(self, x, y, w, h, walls, check_enemies=True):
+        if walls is self.walls:
+            if self.wall_grid.collide(x, y, w, h):
+                return False
+        else:
+            for wall in walls:
+                if wall.check_collide(x, y, w, h):
+                    return False
         
-        for bullet in self.enemy_bullets:
-            bullet.draw()
+        if check_enemies:
+            for key in self.chunks.covering(x - 50, x + 50, y - 50, y + 50):
+                for i in self.chunks.members.get(key, ()):
+                    enemy = self.enemies[i]
+                    if abs(enemy.x - x) < 50 and abs(enemy.y - y) < 50:
+                        return False
         
-        for bullet in self.bullets:
-            bullet.draw()
+        return True
+    
+    def try_spawn_enemy(self, x, y, etype):
+        if self.is_valid_spawn(x, y, 32, 32, self.walls, True):
+            self.chunks.add(len(self.enemies), x, y)
+            self.enemies.append(Enemy(x, y, COLORS[len(self.enemies)%len(COLORS)], etype))
+            self.alive_count += 1
+            return True
+        return False
+    
+    def spawn_enemies(self, spots):
+        enemies = self.enemies
+        free = [i for i, e in enumerate(enemies) if not e.alive][:len(spots)]
+        reused = []
+        for x, y, etype, home_x, home_y in spots:
+            slot = free.pop(0) if free else len(enemies)
+            enemy = Enemy(x, y, COLORS[slot % len(COLORS)], etype)
+            enemy.spawn_x, enemy.spawn_y = home_x, home_y
+            if slot < len(enemies):
+                enemies[slot] = enemy
+                reused.append(slot)
+            else:
+                enemies.append(enemy)
+            self.chunks.add(slot, x, y)
+            self.alive_count += 1
+        if self.enemy_system:
+            self.enemy_system.refresh(enemies, reused)
+    
+    def setup_level(self):
+        self.enemies = []
+        self.tracers = []
+        self.game_over = False
+        self.win = False
+        self.show_message = False
         
-        if self.player:
-            self.player.draw()
-            arcade.draw_line(self.player.x, self.player.y, self.mouse_x, self.mouse_y, COLORS[0], 1)
+        level = LevelCache.load(self.level)
+        self.title = f"УРОВЕНЬ {self.level}" if isinstance(self.level, int) else level.name.upper()
+        self.world_width = level.width
+        self.world_height = level.height
+        self.background = level.background
+        self.walls = list(level.walls)
+        self.spawn = level.player
+        self.player = Player(*level.player)
+        self.chunks = ChunkMap(level.width, level.height)
+        self.awake = []
+        self.alive_count = 0
+        self.scheduler = AIScheduler(budget=self.scheduler.budget)
         
-        alive_enemies = len([e for e in self.enemies if e.alive])
-        arcade.draw_text(f"УРОВЕНЬ {self.level}", 100, h-50, COLORS[self.level-1], 24, bold=True)
-        arcade.draw_text(f"ВРАГОВ: {alive_enemies}", 100, h-80, (255,255,255), 18)
-        arcade.draw_text(f"УБИТО: {self.kills}", 100, h-110, (255,255,255), 18)
+        self.wall_grid = level.grid
+        self.nav = NavGrid(level.grid, level.width, level.height, LevelCache.nav_cell, LevelCache.agent, level.blocked, level.links, level.fields)
+        self.los = level.los
         
-        if self.game_over:
-            arcade.draw_text("ТЫ УМЕР", w//2, h//2, (255,0,0), 72, anchor_x="center", anchor_y="center", bold=True)
-            arcade.draw_text("R - заново | ESC - меню", w//2, h//2-70, (255,255,255), 24, anchor_x="center")
-        elif self.win:
-            arcade.draw_text("УРОВЕНЬ ПРОЙДЕН!", w//2, h//2, (0,255,0), 72, anchor_x="center", anchor_y="center", bold=True)
-            arcade.draw_text("ПРОБЕЛ - дальше | ESC - меню", w//2, h//2-70, (255,255,255), 24, anchor_x="center")
+        for x, y, etype in level.enemies:
+            self.try_spawn_enemy(x, y, etype)
+        self.horde = Horde(level.horde, level, level.grid, random.getrandbits(32)) if level.horde else None
+        self.place_guests()
+        self.initial = Snapshot(self)
     
-    def on_update(self, dt):
+    def advance(self, dt):
         if self.game_over or self.win:
+            self.accumulator = 0
+            self.alpha = 1.0
             return
         
-        if self.player:
-            self.player.update_animation(dt)
+        self.accumulator += dt
+        ticks = 0
+        while self.accumulator >= TICK and ticks < MAX_TICKS_PER_FRAME and not (self.game_over or self.win):
+            self.accumulator -= TICK
+            self.step()
+            ticks += 1
+        self.accumulator %= TICK
+        self.alpha = 1.0 if self.game_over or self.win else self.accumulator / TICK
+    
+    def step(self):
+        if self.recorder:
+            self.recorder.tick(self)
+        if self.net:
+            self.net.tick(self)
+        timer = self.timer
+        if timer:
+            timer.start()
+        begun = time.perf_counter() if self.horde else 0
         
-        for enemy in self.enemies:
-            if enemy.alive:
-                enemy.update_animation(dt)
+        for player in self.team():
+            player.prev_x, player.prev_y = player.x, player.y
+            player.update_animation(TICK)
+        
+        enemies = self.enemies
+        guests = self.guests
+        if self.player:
+            awake = self.chunks.awake(self.player.x, self.player.y)
+            if guests:
+                awake = sorted(set(awake).union(*(self.chunks.awake(guest.x, guest.y) for guest in guests)))
+            for i in set(self.awake).difference(awake):
+                enemies[i].prev_x, enemies[i].prev_y = enemies[i].x, enemies[i].y
+                self.scheduler.forget(i)
+            self.awake = awake
+            run, scales = self.scheduler.plan(enemies, awake, self.player.x, self.player.y, [(guest.x, guest.y) for guest in guests])
+        else:
+            run, scales = [], []
+        for i in self.awake:
+            enemies[i].age += 1
+        for i, scale in zip(run, scales):
+            enemy = enemies[i]
+            enemy.prev_x, enemy.prev_y = enemy.x, enemy.y
+            enemy.span = scale
+            enemy.age = 0
+            enemy.update_animation(TICK * scale)
         
         for blood in self.blood_effects[:]:
-            blood.update(dt)
+            blood.update(TICK)
             if not blood.active:
                 self.blood_effects.remove(blood)
+        self.tracers = [[*line, ttl - 1] for *line, ttl in self.tracers if ttl > 1]
+        if timer:
+            timer.mark("animation")
             
         self.shoot_timer += 1
         self.damage_cooldown -= 1
+        self.walk(self.player, self.keys)
+        for guest in guests:
+            guest.shoot_timer += 1
+            guest.damage_cooldown -= 1
+            self.walk(guest, guest.keys)
+        if timer:
+            timer.mark("player")
+        
+        region = self.chunks.region(self.player.x, self.player.y, AWAKE_RADIUS)
+        for guest in guests:
+            left, right, bottom, top = self.chunks.region(guest.x, guest.y, AWAKE_RADIUS)
+            region = (min(region[0], left), max(region[1], right), min(region[2], bottom), max(region[3], top))
+        if self.nav.target is None or self.scheduler.tick % self.NAV_EVERY == 0:
+            self.update_nav(region)
+        if timer:
+            timer.mark("nav")
         
+        awake = self.awake
+        started = time.perf_counter()
+        goals = [self.nearest(enemies[i].x, enemies[i].y) for i in run] if guests else [self.player] * len(run)
+        if self.enemy_system and len(enemies) >= BATCHED_AI_MIN:
+            if guests:
+                goal_x, goal_y = [goal.x for goal in goals], [goal.y for goal in goals]
+            else:
+                goal_x, goal_y = self.player.x, self.player.y
+            attackers = self.enemy_system.update(enemies, goal_x, goal_y, self.wall_grid, self.projectiles, self.nav, self.los, run, scales)
+            goal_of = dict(zip(run, goals))
+            hits = [(100, goal_of[i]) for i in attackers]
+        else:
+            hits = []
+            for i, scale, goal in zip(run, scales, goals):
+                enemy = enemies[i]
+                if enemy.alive:
+                    damage = enemy.update(goal.x, goal.y, self.wall_grid, self.projectiles, self.nav, self.los, scale)
+                    if damage > 0:
+                        hits.append((damage, goal))
+        self.scheduler.record(len(run), time.perf_counter() - started)
+        for i in run:
+            self.chunks.move(i, enemies[i].x, enemies[i].y)
+        for damage, goal in hits:
+            if self.hurt(goal, damage):
+                return
+        
+        if timer:
+            timer.mark("enemies")
+        
+        pool = self.projectiles
+        moved = pool.step(self.wall_grid, region)
+        if timer:
+            timer.mark("projectiles")
+        
+        shots = moved[pool.owner[moved] == ProjectilePool.ENEMY]
+        for player in self.team():
+            px1, px2, py1, py2 = player.get_hitbox()
+            hit = pool.crossing(shots, px1, px2, py1, py2)
+            for i in hit:
+                if self.hurt(player, int(pool.damage[i])):
+                    return
+                pool.active[i] = False
+            if guests:
+                shots = shots[~np.isin(shots, hit)]
+        if timer:
+            timer.mark("enemy_bullets")
+        
+        target_ids = [i for i in awake if enemies[i].alive]
+        targets = [enemies[i] for i in target_ids]
+        self.enemy_hash.build(targets)
+        shots = moved[pool.owner[moved] == ProjectilePool.PLAYER]
+        if len(shots) and targets:
+            half = pool.size[shots] // 2
+            x0, y0, x1, y1 = pool.px[shots], pool.py[shots], pool.x[shots], pool.y[shots]
+            boxes = zip((np.minimum(x0, x1) - half).tolist(), (np.maximum(x0, x1) + half).tolist(),
+                        (np.minimum(y0, y1) - half).tolist(), (np.maximum(y0, y1) + half).tolist())
+            pairs = [(n, j) for n, box in enumerate(boxes) for j in self.enemy_hash.query(*box)]
+            if pairs:
+                owner, found = np.array(pairs).T
+                left, right, bottom, top = np.array([targets[j].get_hitbox() for j in found.tolist()], dtype=float).T
+                h = half[owner]
+                t = WallGrid.entry(x0[owner], y0[owner], (x1 - x0)[owner], (y1 - y0)[owner], left - h, right + h, bottom - h, top + h)
+                order = np.lexsort((found, t, owner))
+                order = order[t[order] <= 1]
+                spent = set()
+                for n, j in zip(owner[order].tolist(), found[order].tolist()):
+                    if n not in spent and targets[j].alive:
+                        spent.add(n)
+                        self.strike(target_ids[j], int(pool.damage[shots[n]]))
+                        pool.active[shots[n]] = False
+        
+        pool.retire()
+        if timer:
+            timer.mark("player_bullets")
+        
+        self.particles.update()
+        if timer:
+            timer.mark("particles")
+        
+        if self.horde:
+            self.horde.update(self)
+            self.horde.measure(time.perf_counter() - begun, self.alive_count)
+            if timer:
+                timer.mark("horde")
+        elif self.alive_count == 0 and len(self.enemies) > 0:
+            self.win = True
+            if self.menu and isinstance(self.level, int):
+                self.menu.save(self.level)
+            
+            self.splash(self.player.x, self.player.y, (0,255,0,255), 30)
+    
+    def team(self):
+        return [self.player] + self.guests if self.player else []
+    
+    def nearest(self, x, y):
+        return min(self.team(), key=lambda player: (player.x - x) ** 2 + (player.y - y) ** 2)
+    
+    def walk(self, player, keys):
         dx, dy = 0, 0
-        if self.keys[0]: dy = 1
-        if self.keys[1]: dy = -1
-        if self.keys[2]: dx = -1
-        if self.keys[3]: dx = 1
+        if keys[0]: dy = 1
+        if keys[1]: dy = -1
+        if keys[2]: dx = -1
+        if keys[3]: dx = 1
         
         if dx != 0 or dy != 0:
             if dx != 0 and dy != 0:
                 dx *= 0.7
                 dy *= 0.7
-            self.player.move(dx, dy, self.walls)
+            player.move(dx, dy, self.wall_grid)
+    
+    def hurt(self, player, damage):
+        host = player is self.player
+        if (self.damage_cooldown if host else player.damage_cooldown) > 0:
+            return False
+        if player.take_damage(damage):
+            self.game_over = True
+            return True
+        if host:
+            self.damage_cooldown = 20
+        else:
+            player.damage_cooldown = 20
+        self.splash(player.x, player.y, (255,0,0,255), 5)
+        return False
+    
+    def strike(self, i, damage):
+        enemy = self.enemies[i]
+        if not enemy.take_damage(damage):
+            return False
+        self.chunks.remove(i)
+        self.scheduler.forget(i)
+        self.alive_count -= 1
+        self.kills += 1
+        self.score += 100
+        self.bleed(enemy.x, enemy.y)
+        return True
+    
+    def splash(self, x, y, color, count):
+        self.particles.emit(x, y, color, count)
+        if self.net:
+            self.net.event(NetHost.SPLASH, x, y, color, count)
+    
+    def bleed(self, x, y):
+        self.blood_effects.append(BloodEffect(x, y))
+        self.play_sound("hit")
+        if self.net:
+            self.net.event(NetHost.BLOOD, x, y)
+    
+    def join(self):
+        guest = Player(*self.spawn)
+        guest.keys = [False, False, False, False]
+        guest.weapon = Simulation.BLASTER
+        self.guests.append(guest)
+        self.place_guests()
+        return guest
+    
+    def leave(self, guest):
+        if guest in self.guests:
+            self.guests.remove(guest)
+    
+    def place_guests(self):
+        x, y = self.spawn
+        spots = [(x + ox, y + oy) for ox, oy in ((48, 0), (-48, 0), (0, 48), (0, -48))]
+        spots = [spot for spot in spots if not self.wall_grid.collide(*spot, 32, 32)] or [(x, y)]
+        for n, guest in enumerate(self.guests):
+            guest.x, guest.y = spots[n % len(spots)]
+            guest.prev_x, guest.prev_y = guest.x, guest.y
+            guest.health = guest.max_health
+            guest.is_moving = False
+            guest.shoot_timer = 0
+            guest.damage_cooldown = 0
+    
+    def update_nav(self, region):
+        others = [(guest.x, guest.y) for guest in self.guests]
+        if region == (0, self.world_width, 0, self.world_height):
+            self.nav.update(self.player.x, self.player.y, others=others)
+        else:
+            xs = [self.player.x] + [x for x, y in others]
+            ys = [self.player.y] + [y for x, y in others]
+            left, right, bottom, top = region
+            self.nav.update(self.player.x, self.player.y,
+                            (max(left, min(xs) - NAV_RADIUS), min(right, max(xs) + NAV_RADIUS),
+                             max(bottom, min(ys) - NAV_RADIUS), min(top, max(ys) + NAV_RADIUS)), others)
+    
+    def enemies_in(self, left, right, bottom, top):
+        found = []
+        for key in self.chunks.covering(left, right, bottom, top):
+            found.extend(self.chunks.members.get(key, ()))
+        found.sort()
+        enemies = [self.enemies[i] for i in found]
+        return [e for e in enemies if e.alive and left < e.x < right and bottom < e.y < top]
+    
+    def fire(self, x, y):
+        if self.game_over or self.win or self.shoot_timer < self.reload(self.weapon):
+            return False
+        self.shoot(self.player, self.weapon, x, y)
+        self.shoot_timer = 0
+        if self.recorder:
+            self.recorder.event(ReplayRecorder.FIRE, x, y)
+        self.play_sound("shot")
+        return True
+    
+    def fire_guest(self, guest, x, y):
+        if self.game_over or self.win or guest.shoot_timer < self.reload(guest.weapon):
+            return False
+        self.shoot(guest, guest.weapon, x, y)
+        guest.shoot_timer = 0
+        return True
+    
+    def reload(self, weapon):
+        return RAIL_DELAY if weapon == Simulation.RAIL else self.shoot_delay
+    
+    def switch(self, weapon):
+        if weapon == self.weapon:
+            return
+        self.weapon = weapon
+        if self.recorder:
+            self.recorder.event(ReplayRecorder.WEAPON, weapon)
+    
+    def shoot(self, player, weapon, x, y):
+        if weapon == Simulation.RAIL:
+            self.rail(player, x, y)
+        else:
+            self.projectiles.fire_player(player.x, player.y, x, y)
+    
+    def beam(self, x, y, target_x, target_y):
+        dx, dy = target_x - x, target_y - y
+        dist = math.sqrt(dx*dx + dy*dy) or 1
+        dx, dy = dx / dist * RAIL_RANGE, dy / dist * RAIL_RANGE
+        t = float(self.wall_grid.sweep_many(np.array([x]), np.array([y]), np.array([dx]), np.array([dy]), np.array([RAIL_WIDTH]))[0])
+        return dx * min(t, 1.0), dy * min(t, 1.0), t <= 1
+    
+    def rail(self, player, target_x, target_y):
+        x, y = player.x, player.y
+        dx, dy, blocked = self.beam(x, y, target_x, target_y)
+        reach = 16 + RAIL_WIDTH // 2
+        found = []
+        for key in self.chunks.covering(min(x, x + dx) - reach, max(x, x + dx) + reach, min(y, y + dy) - reach, max(y, y + dy) + reach):
+            found.extend(self.chunks.members.get(key, ()))
+        found = sorted(i for i in found if self.enemies[i].alive)
+        hit = None
+        if found:
+            half = RAIL_WIDTH // 2
+            left, right, bottom, top = np.array([self.enemies[i].get_hitbox() for i in found], dtype=float).T
+            t = WallGrid.entry(x, y, dx, dy, left - half, right + half, bottom - half, top + half).tolist()
+            n = t.index(min(t))
+            if t[n] <= 1:
+                hit = found[n]
+                dx, dy = dx * t[n], dy * t[n]
+        self.tracers.append([x, y, x + dx, y + dy, RAIL_TRACE])
+        if hit is not None:
+            self.strike(hit, RAIL_DAMAGE)
+        elif blocked:
+            self.splash(x + dx, y + dy, (255,255,255,255), 6)
+    
+    def restart(self):
+        if self.recorder:
+            self.recorder.event(ReplayRecorder.RESTART)
+        weapon = self.weapon
+        self.initial.restore(self)
+        self.weapon = weapon
+        self.place_guests()
+    
+    def reseed(self, seed):
+        random.seed(seed)
+        self.particles = ParticleSystem(self.PARTICLES, seed=seed)
+        self.projectiles = ProjectilePool(self.PROJECTILES)
+        self.blood_effects = []
+        self.score = 0
+        self.kills = 0
+        self.shoot_timer = 0
+        self.weapon = Simulation.BLASTER
+        self.damage_cooldown = 0
+        self.accumulator = 0
+        self.scheduler.budget = None
+        self.setup_level()
+    
+    def start_recording(self):
+        self.recorder = None
+        weapon = self.weapon
+        seed = random.randrange(2 ** 32)
+        self.reseed(seed)
+        self.recorder = ReplayRecorder(seed, self.level)
+        self.switch(weapon)
+    
+    def stop_recording(self):
+        path = self.recorder.save()
+        self.recorder = None
+        self.scheduler.budget = AI_BUDGET
+        return path
+    
+    def play_sound(self, name):
+        pass
+
+class NetLink:
+    def __init__(self, port=0, host="0.0.0.0", lag=0.0, jitter=0.0, loss=0.0, seed=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.lag = lag
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.queue = []
+        self.order = 0
+        self.sent = 0
+        self.received = 0
+        self.largest = 0
+    
+    @property
+    def address(self):
+        return self.sock.getsockname()
+    
+    def send(self, data, address):
+        self.sent += len(data)
+        self.largest = max(self.largest, len(data))
+        if self.loss and self.rng.random() < self.loss:
+            return
+        if self.lag or self.jitter:
+            self.order += 1
+            due = time.perf_counter() + self.lag + self.rng.uniform(0, self.jitter)
+            heapq.heappush(self.queue, (due, self.order, data, address))
+        else:
+            self.deliver(data, address)
+    
+    def deliver(self, data, address):
+        try:
+            self.sock.sendto(data, address)
+        except OSError:
+            pass
+    
+    def flush(self):
+        now = time.perf_counter()
+        while self.queue and self.queue[0][0] <= now:
+            due, order, data, address = heapq.heappop(self.queue)
+            self.deliver(data, address)
+    
+    def receive(self):
+        packets = []
+        if self.sock.fileno() == -1:
+            return packets
+        self.flush()
+        while True:
+            try:
+                data, address = self.sock.recvfrom(65536)
+            except ConnectionResetError:
+                continue
+            except OSError:
+                break
+            self.received += len(data)
+            if data:
+                packets.append((data, address))
+        return packets
+    
+    def close(self):
+        for due, order, data, address in sorted(self.queue):
+            self.deliver(data, address)
+        self.queue = []
+        self.sock.close()
+
+class NetPeer:
+    def __init__(self, address, guest):
+        self.address = address
+        self.inputs = deque()
+        self.received = 0
+        self.applied = 0
+        self.seen = time.perf_counter()
+        self.reset(guest)
+    
+    def reset(self, guest):
+        self.guest = guest
+        self.acked = 0
+        self.views = {}
+        self.stale = np.zeros(0)
+
+class NetHost:
+    HELLO, STATE, INPUT, BYE = range(4)
+    SPLASH, BLOOD = range(2)
+    VERSION = 2
+    GREETING = struct.Struct("<BHH")
+    HEADER = struct.Struct("<BIIIHBBHHB")
+    PLAYER = struct.Struct("<ddhB")
+    EVENT = struct.Struct("<BHHBBBBB")
+    GONE = struct.Struct("<I")
+    ENEMY = struct.Struct("<HHHhB")
+    SHOT = struct.Struct("<IHHhhBB")
+    INPUT_HEAD = struct.Struct("<BIIB")
+    INPUT_KEYS = struct.Struct("<Bff")
+    
+    def __init__(self, link, players=NET_PLAYERS, rate=NET_RATE, budget=NET_BUDGET, dedicated=False):
+        self.link = link
+        self.dedicated = dedicated
+        self.seats = players if dedicated else players - 1
+        self.period = 1 / rate
+        self.budget = budget
+        self.clients = {}
+        self.events = []
+        self.sim = None
+        self.stage = 0
+        self.snap = 0
+        self.due = 0
+    
+    def attach(self, sim):
+        if self.sim is not None and self.sim is not sim:
+            self.sim.net = None
+        self.sim = sim
+        sim.net = self
+        self.stage += 1
+        self.events = []
+        for peer in self.clients.values():
+            peer.reset(self.seat(sim))
+        return sim
+    
+    def seat(self, sim):
+        if self.dedicated and all(peer.guest is not sim.player for peer in self.clients.values()):
+            return sim.player
+        return sim.join()
+    
+    def promote(self, sim, peer):
+        guest, player = peer.guest, sim.player
+        player.x, player.y, player.prev_x, player.prev_y = guest.x, guest.y, guest.prev_x, guest.prev_y
+        player.health, player.direction, player.is_moving = guest.health, guest.direction, guest.is_moving
+        sim.keys, sim.shoot_timer, sim.damage_cooldown = guest.keys, guest.shoot_timer, guest.damage_cooldown
+        sim.leave(guest)
+        peer.guest = player
+    
+    def close(self):
+        for address in list(self.clients):
+            for _ in range(3):
+                self.link.send(bytes([NetHost.BYE]), address)
+            self.drop(address)
+        self.link.close()
+        if self.sim is not None:
+            self.sim.net = None
+    
+    def drop(self, address):
+        peer = self.clients.pop(address, None)
+        if peer and self.sim is not None:
+            if peer.guest is not self.sim.player:
+                self.sim.leave(peer.guest)
+            elif self.clients:
+                self.promote(self.sim, next(iter(self.clients.values())))
+    
+    def event(self, kind, x, y, color=(0, 0, 0, 0), count=0):
+        if self.clients and len(self.events) < 255:
+            self.events.append(NetHost.EVENT.pack(kind, *NetHost.quantize_point(x, y), *color, min(count, 255)))
+    
+    @staticmethod
+    def quantize_point(x, y):
+        return min(65535, max(0, round(x * 2))), min(65535, max(0, round(y * 2)))
+    
+    @staticmethod
+    def quantize(enemies):
+        q = np.zeros((len(enemies), 4), dtype=np.int64)
+        if enemies:
+            rows = np.array([(e.x, e.y, e.health, e.alive | e.is_moving << 1 | (e.etype == "shooter") << 2) for e in enemies], dtype=float)
+            q[:, :2] = np.clip(np.rint(rows[:, :2] * 2), 0, 65535)
+            q[:, 2] = np.clip(rows[:, 2], -32768, 32767)
+            q[:, 3] = rows[:, 3]
+        return q
+    
+    def poll(self, sim):
+        now = time.perf_counter()
+        for data, address in self.link.receive():
+            try:
+                self.receive(sim, data, address, now)
+            except (struct.error, IndexError):
+                continue
+        for address, peer in list(self.clients.items()):
+            if now - peer.seen > NET_TIMEOUT:
+                self.drop(address)
+        if now >= self.due:
+            self.due = max(self.due + self.period, now)
+            self.broadcast(sim)
+        self.link.flush()
+    
+    def receive(self, sim, data, address, now):
+        kind = data[0]
+        peer = self.clients.get(address)
+        if kind == NetHost.HELLO:
+            if peer is None:
+                kind, version, room = NetHost.GREETING.unpack_from(data)
+                if version != NetHost.VERSION or len(self.clients) >= self.seats:
+                    self.link.send(bytes([NetHost.BYE]), address)
+                    return
+                peer = self.clients[address] = NetPeer(address, self.seat(sim))
+            peer.seen = now
+        elif peer is None:
+            return
+        elif kind == NetHost.INPUT:
+            peer.seen = now
+            self.read_inputs(peer, data)
+        elif kind == NetHost.BYE:
+            self.drop(address)
+    
+    def read_inputs(self, peer, data):
+        kind, acked, newest, count = NetHost.INPUT_HEAD.unpack_from(data)
+        if acked > peer.acked and acked in peer.views:
+            peer.acked = acked
+            for snap in [snap for snap in peer.views if snap < acked]:
+                del peer.views[snap]
+        offset = NetHost.INPUT_HEAD.size
+        for seq in range(newest - count + 1, newest + 1):
+            flags, fx, fy = NetHost.INPUT_KEYS.unpack_from(data, offset)
+            offset += NetHost.INPUT_KEYS.size
+            if seq > peer.received:
+                peer.received = seq
+                peer.inputs.append((seq, flags, fx, fy))
+        while len(peer.inputs) > NET_HISTORY:
+            peer.inputs.popleft()
+    
+    def tick(self, sim):
+        for peer in self.clients.values():
+            while peer.inputs:
+                seq, flags, fx, fy = peer.inputs.popleft()
+                peer.applied = seq
+                keys = [bool(flags >> n & 1) for n in range(4)]
+                weapon = Simulation.RAIL if flags & 32 else Simulation.BLASTER
+                if peer.guest is sim.player:
+                    sim.keys = keys
+                    sim.switch(weapon)
+                    if flags & 16:
+                        sim.fire(fx, fy)
+                else:
+                    peer.guest.keys = keys
+                    peer.guest.weapon = weapon
+                    if flags & 16:
+                        sim.fire_guest(peer.guest, fx, fy)
+                if len(peer.inputs) < NET_INPUT_BUFFER:
+                    break
+    
+    def broadcast(self, sim):
+        if self.clients:
+            self.snap += 1
+            team = sim.team()
+            state = NetHost.quantize(sim.enemies)
+            pool = sim.projectiles
+            shots = pool.live()
+            for peer in list(self.clients.values()):
+                if peer.guest in team:
+                    self.link.send(self.encode(sim, peer, team, state, pool, shots), peer.address)
+        self.events = []
+    
+    def encode(self, sim, peer, team, state, pool, shots):
+        base = peer.views.get(peer.acked)
+        if base is None:
+            base_id, known, known_seqs = 0, np.full((0, 4), -1, dtype=np.int64), frozenset()
+        else:
+            base_id, (known, known_seqs) = peer.acked, base
+        n = len(state)
+        if len(known) < n:
+            known = np.vstack([known, np.full((n - len(known), 4), -1, dtype=np.int64)])
+        known = known[:n]
+        guest = peer.guest
+        level = str(sim.level).encode()[:255]
+        parts = [NetHost.HEADER.pack(NetHost.STATE, self.snap, base_id, peer.applied, self.stage % 65536, team.index(guest),
+                                     sim.game_over | sim.win << 1, min(sim.kills, 65535), min(sim.alive_count, 65535), len(level)),
+                 level, bytes([len(team)])]
+        parts.extend(NetHost.PLAYER.pack(p.x, p.y, max(-32768, min(32767, p.health)), p.direction | p.is_moving << 2) for p in team)
+        room = self.budget - sum(len(part) for part in parts) - 7
+        
+        events = self.events[:max(0, room // 4) // NetHost.EVENT.size]
+        parts.append(bytes([len(events)]))
+        parts.extend(events)
+        room -= len(events) * NetHost.EVENT.size
         
-        for enemy in self.enemies[:]:
+        seqs = pool.seq[shots].tolist()
+        gone = sorted(known_seqs.difference(seqs))[:max(0, room // 4) // NetHost.GONE.size]
+        room -= len(gone) * NetHost.GONE.size
+        fresh = shots[[seq not in known_seqs for seq in seqs]] if seqs else shots
+        shot_room = min(len(fresh) * NetHost.SHOT.size, room // 3)
+        
+        changed = np.flatnonzero((state != known).any(axis=1))
+        if len(peer.stale) != n:
+            peer.stale = np.concatenate([peer.stale, np.zeros(n)])[:n]
+        limit = max(0, room - shot_room) // NetHost.ENEMY.size
+        if len(changed) > limit:
+            d2 = (state[changed, 0] / 2 - guest.x) ** 2 + (state[changed, 1] / 2 - guest.y) ** 2
+            peer.stale[changed] += 1
+            changed = np.sort(changed[np.argsort(d2 / peer.stale[changed] ** 2, kind="stable")[:limit]])
+        peer.stale[changed] = 0
+        room -= len(changed) * NetHost.ENEMY.size
+        
+        limit = max(0, room) // NetHost.SHOT.size
+        if len(fresh) > limit:
+            d2 = (pool.x[fresh] - guest.x) ** 2 + (pool.y[fresh] - guest.y) ** 2
+            fresh = fresh[np.sort(np.argsort(d2, kind="stable")[:limit])]
+        
+        parts.append(struct.pack("<H", len(gone)))
+        parts.extend(NetHost.GONE.pack(seq & 0xFFFFFFFF) for seq in gone)
+        parts.append(struct.pack("<H", len(changed)))
+        parts.extend(NetHost.ENEMY.pack(i, *row) for i, row in zip(changed.tolist(), state[changed].tolist()))
+        parts.append(struct.pack("<H", len(fresh)))
+        for i in fresh.tolist():
+            parts.append(NetHost.SHOT.pack(int(pool.seq[i]) & 0xFFFFFFFF, *NetHost.quantize_point(pool.x[i], pool.y[i]),
+                                           round(pool.dx[i] * 32767), round(pool.dy[i] * 32767),
+                                           min(255, round(pool.speed[i])), int(pool.owner[i])))
+        
+        view = known.copy()
+        view[changed] = state[changed]
+        peer.views[self.snap] = (view, known_seqs.difference(gone).union(pool.seq[fresh].tolist()))
+        if len(peer.views) > NET_HISTORY:
+            del peer.views[min(peer.views)]
+        return b"".join(parts)
+
+class NetClient:
+    def __init__(self, link, address, room=0):
+        host, port = address
+        self.link = link
+        self.room = room
+        self.address = (socket.gethostbyname(host), port)
+        self.sim = None
+        self.stage = None
+        self.next = None
+        self.closed = False
+        self.seen = time.perf_counter()
+        self.hello_at = 0
+        self.sent_at = 0
+        self.seq = 0
+        self.latest = 0
+        self.inputs = deque(maxlen=NET_REDUNDANCY)
+        self.history = deque(maxlen=TICK_RATE * 2)
+        self.corrections = 0
+        self.drift = 0.0
+        self.bind(None)
+    
+    def bind(self, sim):
+        self.sim = sim
+        if sim is not None:
+            sim.net = self
+            if self.next:
+                self.stage = self.next[0]
+            self.next = None
+        self.latest = 0
+        self.views = {}
+        self.current = np.full((0, 4), -1, dtype=np.int64)
+        self.known = {}
+        self.glides = {}
+        self.placed = False
+    
+    def close(self):
+        if self.link.sock.fileno() != -1:
+            for _ in range(3):
+                self.link.send(bytes([NetHost.BYE]), self.address)
+            self.link.close()
+        self.closed = True
+    
+    def poll(self, sim=None):
+        now = time.perf_counter()
+        if self.stage is None and self.next is None and now - self.hello_at > 0.25:
+            self.hello_at = now
+            self.link.send(NetHost.GREETING.pack(NetHost.HELLO, NetHost.VERSION, self.room), self.address)
+        for data, address in self.link.receive():
+            if address != self.address:
+                continue
+            self.seen = now
+            if data[0] == NetHost.BYE:
+                self.closed = True
+            elif data[0] == NetHost.STATE:
+                try:
+                    self.receive(data)
+                except (struct.error, IndexError, UnicodeDecodeError):
+                    continue
+        if self.stage is not None and now - self.sent_at > 0.1:
+            self.send()
+        if now - self.seen > NET_TIMEOUT:
+            self.closed = True
+        self.link.flush()
+    
+    def send(self):
+        self.sent_at = time.perf_counter()
+        self.link.send(NetHost.INPUT_HEAD.pack(NetHost.INPUT, self.latest, self.seq, len(self.inputs)) + b"".join(self.inputs), self.address)
+    
+    def send_input(self, keys, aim, weapon=Simulation.BLASTER):
+        self.seq += 1
+        flags = sum(1 << n for n, down in enumerate(keys) if down) | (16 if aim else 0) | (32 if weapon == Simulation.RAIL else 0)
+        self.inputs.append(NetHost.INPUT_KEYS.pack(flags, *(aim or (0, 0))))
+        self.history.append((self.seq, list(keys)))
+        self.send()
+    
+    def receive(self, data):
+        kind, snap, base, ack, stage, slot, flags, kills, alive, size = NetHost.HEADER.unpack_from(data)
+        offset = NetHost.HEADER.size
+        level = data[offset:offset + size].decode()
+        if stage != self.stage or self.sim is None:
+            self.next = (stage, int(level) if level.isdigit() else level)
+            return
+        if snap <= self.latest or (base and base not in self.views):
+            return
+        known, known_seqs = self.views[base] if base else (np.full((0, 4), -1, dtype=np.int64), set())
+        offset += size
+        players = []
+        for n in range(data[offset]):
+            players.append(NetHost.PLAYER.unpack_from(data, offset + 1 + n * NetHost.PLAYER.size))
+        offset += 1 + len(players) * NetHost.PLAYER.size
+        events = [NetHost.EVENT.unpack_from(data, offset + 1 + n * NetHost.EVENT.size) for n in range(data[offset])]
+        offset += 1 + len(events) * NetHost.EVENT.size
+        
+        seqs = set(known_seqs)
+        count, = struct.unpack_from("<H", data, offset)
+        for n in range(count):
+            seqs.discard(NetHost.GONE.unpack_from(data, offset + 2 + n * NetHost.GONE.size)[0])
+        offset += 2 + count * NetHost.GONE.size
+        count, = struct.unpack_from("<H", data, offset)
+        rows = [NetHost.ENEMY.unpack_from(data, offset + 2 + n * NetHost.ENEMY.size) for n in range(count)]
+        offset += 2 + count * NetHost.ENEMY.size
+        count, = struct.unpack_from("<H", data, offset)
+        shots = [NetHost.SHOT.unpack_from(data, offset + 2 + n * NetHost.SHOT.size) for n in range(count)]
+        seqs.update(shot[0] for shot in shots)
+        
+        size = max([len(known)] + [row[0] + 1 for row in rows])
+        view = np.vstack([known, np.full((size - len(known), 4), -1, dtype=np.int64)])
+        for i, qx, qy, health, bits in rows:
+            view[i] = (qx, qy, health, bits)
+        self.views[snap] = (view, seqs)
+        for old in [old for old in self.views if old <= snap - NET_HISTORY]:
+            del self.views[old]
+        self.latest = snap
+        
+        sim = self.sim
+        sim.game_over, sim.win = bool(flags & 1), bool(flags & 2)
+        sim.kills, sim.alive_count = kills, alive
+        self.apply_players(sim, players, slot, ack)
+        self.apply_enemies(sim, view)
+        self.apply_shots(sim, shots, seqs)
+        for kind, qx, qy, r, g, b, a, count in events:
+            if kind == NetHost.SPLASH:
+                sim.particles.emit(qx / 2, qy / 2, (r, g, b, a), count)
+            elif kind == NetHost.BLOOD:
+                sim.blood_effects.append(BloodEffect(qx / 2, qy / 2))
+                sim.play_sound("hit")
+    
+    def apply_players(self, sim, players, slot, ack):
+        others = players[:slot] + players[slot + 1:]
+        while len(sim.guests) < len(others):
+            sim.guests.append(Player(*sim.spawn))
+        del sim.guests[len(others):]
+        for guest, (x, y, health, bits) in zip(sim.guests, others):
+            self.glide(guest, x, y)
+            guest.health, guest.direction, guest.is_moving = health, bits & 3, bool(bits & 4)
+        x, y, health, bits = players[slot]
+        player = sim.player
+        while self.history and self.history[0][0] <= ack:
+            self.history.popleft()
+        predicted = (player.x, player.y)
+        player.x, player.y = x, y
+        for seq, keys in self.history:
+            sim.walk(player, keys)
+        drift = math.hypot(player.x - predicted[0], player.y - predicted[1])
+        if not self.placed:
+            self.placed = True
+            player.prev_x, player.prev_y = player.x, player.y
+        elif drift > 1e-6:
+            self.corrections += 1
+            self.drift = max(self.drift, drift)
+        player.health = health
+    
+    def apply_enemies(self, sim, view):
+        current = self.current
+        if len(current) < len(view):
+            current = np.vstack([current, np.full((len(view) - len(current), 4), -1, dtype=np.int64)])
+        enemies = sim.enemies
+        for i in np.flatnonzero((view != current).any(axis=1) & (view[:, 0] >= 0)).tolist():
+            qx, qy, health, bits = view[i].tolist()
+            x, y, alive = qx / 2, qy / 2, bool(bits & 1)
+            while len(enemies) <= i:
+                enemy = Enemy(x, y, COLORS[len(enemies) % len(COLORS)], "shooter" if bits & 4 else "normal")
+                enemy.alive = False
+                enemies.append(enemy)
+            enemy = enemies[i]
+            if alive and not enemy.alive:
+                self.glides.pop(enemy, None)
+                enemy.x = enemy.prev_x = x
+                enemy.y = enemy.prev_y = y
+                sim.chunks.add(i, x, y)
+            elif alive:
+                self.glide(enemy, x, y)
+                sim.chunks.move(i, x, y)
+            elif enemy.alive:
+                sim.chunks.remove(i)
+            enemy.alive, enemy.health, enemy.is_moving = alive, health, bool(bits & 2)
+        self.current = view
+    
+    def apply_shots(self, sim, shots, seqs):
+        pool = sim.projectiles
+        for seq, qx, qy, qdx, qdy, speed, owner in shots:
+            if seq not in self.known:
+                x, y = qx / 2, qy / 2
+                i = pool.spawn(x, y, x + qdx / 32767, y + qdy / 32767, speed, 0, owner)
+                if i >= 0:
+                    self.known[seq] = (i, int(pool.seq[i]))
+        for seq in [seq for seq in self.known if seq not in seqs]:
+            i, local = self.known.pop(seq)
+            if pool.seq[i] == local:
+                pool.active[i] = False
+    
+    def glide(self, entity, x, y):
+        self.glides[entity] = [x, y, max(1, TICK_RATE // NET_RATE)]
+    
+    def advance(self):
+        for entity, goal in list(self.glides.items()):
+            entity.prev_x, entity.prev_y = entity.x, entity.y
+            x, y, ticks = goal
+            if ticks == 0:
+                del self.glides[entity]
+                continue
+            entity.x += (x - entity.x) / ticks
+            entity.y += (y - entity.y) / ticks
+            goal[2] = ticks - 1
+
+class Replica(Simulation):
+    def connect(self, net):
+        self.aim = None
+        net.bind(self)
+        return self
+    
+    def step(self):
+        player = self.player
+        player.prev_x, player.prev_y = player.x, player.y
+        player.update_animation(TICK)
+        self.shoot_timer += 1
+        self.net.send_input(self.keys, self.aim, self.weapon)
+        self.aim = None
+        self.walk(player, self.keys)
+        
+        self.net.advance()
+        for guest in self.guests:
+            guest.update_animation(TICK)
+        for enemy in self.enemies:
             if enemy.alive:
-                damage = enemy.update(self.player.x, self.player.y, self.walls, self.enemy_bullets)
-                if damage > 0 and self.damage_cooldown <= 0:
-                    if self.player.take_damage(damage):
-                        self.game_over = True
-                        return
-                    self.damage_cooldown = 20
-                    for _ in range(5):
-                        self.particles.append(Particle(self.player.x, self.player.y, (255,0,0,255)))
-        
-        for bullet in self.enemy_bullets[:]:
-            bullet.update(self.walls)
-            
-            if self.player:
-                bx1, bx2, by1, by2 = bullet.get_hitbox()
-                px1, px2, py1, py2 = self.player.get_hitbox()
-                
-                if (bx1 < px2 and bx2 > px1 and by1 < py2 and by2 > py1):
-                    if self.damage_cooldown <= 0:
-                        if self.player.take_damage(bullet.damage):
-                            self.game_over = True
-                            return
-                        self.damage_cooldown = 20
-                        for _ in range(5):
-                            self.particles.append(Particle(self.player.x, self.player.y, (255,0,0,255)))
-                    bullet.active = False
+                enemy.update_animation(TICK)
+        for blood in self.blood_effects[:]:
+            blood.update(TICK)
+            if not blood.active:
+                self.blood_effects.remove(blood)
+        self.tracers = [[*line, ttl - 1] for *line, ttl in self.tracers if ttl > 1]
+        
+        self.projectiles.step(self.wall_grid)
+        self.projectiles.retire()
+        self.particles.update()
+    
+    def fire(self, x, y):
+        if self.game_over or self.win or self.shoot_timer < self.reload(self.weapon):
+            return False
+        self.aim = (x, y)
+        self.shoot_timer = 0
+        if self.weapon == Simulation.RAIL:
+            dx, dy = self.beam(self.player.x, self.player.y, x, y)[:2]
+            self.tracers.append([self.player.x, self.player.y, self.player.x + dx, self.player.y + dy, RAIL_TRACE])
+        self.play_sound("shot")
+        return True
+    
+    def restart(self):
+        pass
+
+class RoomLink:
+    def __init__(self, transport):
+        self.transport = transport
+        self.inbox = deque()
+        self.sent = 0
+        self.received = 0
+        self.largest = 0
+    
+    def send(self, data, address):
+        self.sent += len(data)
+        self.largest = max(self.largest, len(data))
+        self.transport.sendto(data, address)
+    
+    def receive(self):
+        packets = list(self.inbox)
+        self.inbox.clear()
+        self.received += sum(len(data) for data, address in packets)
+        return packets
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.inbox.clear()
+
+class RoomSimulation(Simulation):
+    PROJECTILES = 1024
+    PARTICLES = 256
+    NAV_EVERY = ROOM_NAV_EVERY
+
+class Room:
+    def __init__(self, number, level, transport):
+        self.number = number
+        self.link = RoomLink(transport)
+        self.net = NetHost(self.link, dedicated=True)
+        self.load(level)
+        self.times = deque(maxlen=ROOM_WINDOW)
+        self.ticks = 0
+        self.busy = 0.0
+        self.late = 0
+        self.skipped = 0
+        self.idle = 0
+    
+    def load(self, level):
+        sim = RoomSimulation(level)
+        sim.scheduler.budget = ROOM_AI_BUDGET
+        self.net.attach(sim)
+        self.sim = sim
+    
+    def tick(self):
+        start = time.perf_counter()
+        sim = self.sim
+        if sim.game_over or sim.win:
+            self.idle += 1
+            if self.idle >= ROOM_RESTART:
+                self.idle = 0
+                if sim.win:
+                    level = sim.level
+                    if isinstance(level, int):
+                        level = level + 1 if os.path.exists(LevelData.path_for(level + 1)) else 1
+                    self.load(level)
+                else:
+                    sim.restart()
+        else:
+            sim.step()
+        self.net.poll(self.sim)
+        elapsed = time.perf_counter() - start
+        self.times.append(elapsed)
+        self.ticks += 1
+        self.busy += elapsed
+        return elapsed
+    
+    def stats(self):
+        times = np.array(self.times) * 1e6 if self.times else np.zeros(1)
+        return {"room": self.number, "level": self.sim.level, "clients": len(self.net.clients), "ticks": self.ticks,
+                "late": self.late, "skipped": self.skipped, "busy": self.busy, "sent": self.link.sent, "received": self.link.received,
+                "p50_us": float(np.percentile(times, 50)), "p99_us": float(np.percentile(times, 99)), "max_us": float(times.max())}
+
+class RoomServer(asyncio.DatagramProtocol):
+    STATS = 4
+    
+    def __init__(self, rooms=ROOM_COUNT, level=1, report=ROOM_REPORT):
+        self.count = rooms
+        self.level = level
+        self.report = report
+        self.rooms = []
+        self.routes = {}
+        self.transport = None
+        self.running = False
+        self.started = 0
+        self.cpu = 0
+    
+    def connection_made(self, transport):
+        self.transport = transport
+        self.rooms = [Room(n + 1, self.level, transport) for n in range(self.count)]
+    
+    def datagram_received(self, data, address):
+        if not data:
+            return
+        route = self.routes.get(address)
+        if data[0] == NetHost.HELLO and (route is None or address not in route[0].net.clients):
+            room = self.pick(data)
+            if room is None:
+                self.transport.sendto(bytes([NetHost.BYE]), address)
+                return
+            route = self.routes[address] = (room, time.perf_counter())
+        elif route is None:
+            if data[0] == RoomServer.STATS:
+                self.transport.sendto(json.dumps(self.stats()).encode(), address)
+            return
+        route[0].link.inbox.append((data, address))
+    
+    def pick(self, data):
+        try:
+            kind, version, number = NetHost.GREETING.unpack_from(data)
+        except struct.error:
+            return None
+        if 0 < number <= len(self.rooms):
+            return self.rooms[number - 1]
+        room = min(self.rooms, key=lambda room: len(room.net.clients), default=None)
+        if room is None or len(room.net.clients) >= room.net.seats:
+            return None
+        return room
+    
+    def stats(self, worst=10):
+        rooms = [room.stats() for room in self.rooms]
+        wall = time.perf_counter() - self.started
+        times = np.concatenate([np.array(room.times) for room in self.rooms if room.times] or [np.zeros(1)]) * 1e6
+        return {"rooms": len(rooms), "clients": sum(room["clients"] for room in rooms), "wall": wall,
+                "cpu": time.process_time() - self.cpu, "ticks": sum(room["ticks"] for room in rooms),
+                "busy": sum(room["busy"] for room in rooms), "late": sum(room["late"] for room in rooms),
+                "skipped": sum(room["skipped"] for room in rooms), "sent": sum(room["sent"] for room in rooms),
+                "received": sum(room["received"] for room in rooms),
+                "p50_us": float(np.percentile(times, 50)), "p99_us": float(np.percentile(times, 99)), "max_us": float(times.max()),
+                "worst": sorted(rooms, key=lambda room: -room["p99_us"])[:worst]}
+    
+    def prune(self, now):
+        self.routes = {address: (room, since) for address, (room, since) in self.routes.items()
+                       if address in room.net.clients or now - since < NET_TIMEOUT}
+    
+    def summary(self, last):
+        stats = self.stats(worst=1)
+        wall = stats["wall"] - last["wall"]
+        ticks = stats["ticks"] - last["ticks"]
+        target = len(self.rooms) * TICK_RATE * wall
+        print(f"rooms {stats['rooms']}  clients {stats['clients']}  ticks {ticks / wall:.0f}/s ({ticks / target:.1%})  "
+              f"cpu {(stats['cpu'] - last['cpu']) / wall:.0%}  tick p50 {stats['p50_us']:.0f}us p99 {stats['p99_us']:.0f}us "
+              f"max {stats['max_us'] / 1000:.1f}ms  late {stats['late'] - last['late']}  skipped {stats['skipped'] - last['skipped']}  "
+              f"down {(stats['sent'] - last['sent']) / wall / 1024:.0f} KB/s", flush=True)
+        return stats
+    
+    async def serve(self, host="0.0.0.0", port=NET_PORT):
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        try:
+            await self.run()
+        finally:
+            transport.close()
+    
+    async def run(self):
+        self.running = True
+        self.started = now = time.perf_counter()
+        self.cpu = time.process_time()
+        heap = [(now + n * TICK / len(self.rooms), n, room) for n, room in enumerate(self.rooms)]
+        yielded = now
+        report = now + self.report
+        last = self.stats(worst=0) if self.report else None
+        while self.running and heap:
+            deadline, n, room = heap[0]
+            now = time.perf_counter()
+            if deadline - now > ROOM_EARLY:
+                await asyncio.sleep(deadline - now - ROOM_EARLY)
+                yielded = time.perf_counter()
+                continue
+            if now - deadline > TICK:
+                room.late += 1
+            room.tick()
+            deadline += TICK
+            if now - deadline > ROOM_SLACK:
+                missed = int((now - deadline) / TICK)
+                room.skipped += missed
+                deadline += missed * TICK
+            heapq.heapreplace(heap, (deadline, n, room))
+            if time.perf_counter() - yielded > ROOM_YIELD:
+                await asyncio.sleep(0)
+                yielded = time.perf_counter()
+            if self.report and now >= report:
+                report = now + self.report
+                self.prune(now)
+                last = self.summary(last)
+
+class Level(Simulation, arcade.View):
+    HINTS = ("R - заново | ESC - меню", "ПРОБЕЛ - дальше | ESC - меню")
+    
+    def __init__(self, level_num, menu):
+        arcade.View.__init__(self)
+        self.batched = BATCHED_RENDER
+        self.renderer = EntityRenderer()
+        self.sounds = SoundBank()
+        self.camera = arcade.Camera2D()
+        self.static_chunks = {}
+        self.view = (0, SCREEN_WIDTH, 0, SCREEN_HEIGHT)
+        self.profiler = None
+        self.quick = None
+        self.upcoming = None
+        self.hud = TextLayer()
+        self.message = ""
+        Simulation.__init__(self, level_num, menu)
+
+    def build_chunk(self, key):
+        size = self.chunks.size
+        x1, y1 = key[0] * size, key[1] * size
+        x2, y2 = min(self.world_width, x1 + size), min(self.world_height, y1 + size)
+        layer = arcade.shape_list.ShapeElementList()
+        for i in range(max(0, x1 // 50 * 50 - 50), min(self.world_width, x2 + 50), 50):
+            for j in range(max(0, y1 // 50 * 50 - 50), min(self.world_height, y2 + 50), 50):
+                layer.append(arcade.shape_list.create_rectangle_outline(i, j, 50, 50, (255,255,255,20), 1))
+        for wall in self.wall_grid.in_region(x1 - 4, x2 + 4, y1 - 4, y2 + 4):
+            for shape in wall.shapes():
+                layer.append(shape)
+        return (x1, y1, x2 - x1, y2 - y1), layer
+    
+    def draw_static(self, left, right, bottom, top):
+        ctx = self.window.ctx
+        ratio = self.window.get_pixel_ratio()
+        view_left, view_bottom = self.view[0], self.view[2]
+        keys = self.chunks.covering(left, right, bottom, top)
+        for key in keys:
+            if key not in self.static_chunks:
+                self.static_chunks[key] = self.build_chunk(key)
+            (x, y, w, h), layer = self.static_chunks[key]
+            ctx.scissor = (round((x - view_left) * ratio), round((y - view_bottom) * ratio), round(w * ratio), round(h * ratio))
+            layer.draw()
+        ctx.scissor = None
+        if self.player and len(self.static_chunks) > (2 * LOADED_RADIUS + 1) ** 2:
+            keep = set(self.chunks.around(self.player.x, self.player.y, LOADED_RADIUS)).union(keys)
+            for key in list(self.static_chunks):
+                if key not in keep:
+                    del self.static_chunks[key]
+    
+    def warm(self):
+        self.update_nav(self.chunks.region(self.player.x, self.player.y, AWAKE_RADIUS))
+        yield
+        left, right, bottom, top = self.follow(self.window.width, self.window.height)
+        for key in self.chunks.covering(max(0, left), min(self.world_width, right) - 1, max(0, bottom), min(self.world_height, top) - 1):
+            if key not in self.static_chunks:
+                self.static_chunks[key] = self.build_chunk(key)
+                yield
+                self.static_chunks[key][1].update()
+                yield
+        self.renderer.sync(self, (left - 64, right + 64, bottom - 64, top + 64))
+    
+    def follow(self, w, h):
+        px, py = self.player.lerp(self.alpha) if self.player else (self.world_width / 2, self.world_height / 2)
+        cx = self.world_width / 2 if self.world_width <= w else min(max(px, w / 2), self.world_width - w / 2)
+        cy = self.world_height / 2 if self.world_height <= h else min(max(py, h / 2), self.world_height - h / 2)
+        cx, cy = round(cx - w / 2) + w / 2, round(cy - h / 2) + h / 2
+        self.camera.position = (cx, cy)
+        self.view = (cx - w / 2, cx + w / 2, cy - h / 2, cy + h / 2)
+        return self.view
+    
+    def to_world(self, x, y):
+        left, right, bottom, top = self.view
+        return x + left, y + bottom
+    
+    def setup_level(self):
+        super().setup_level()
+        self.static_chunks = {}
+    
+    def on_resize(self, width, height):
+        self.camera.match_window()
+    
+    def on_show(self):
+        self.window.background_color = (0,0,0)
+        self.game_over = False
+        self.win = False
+        self.show_message = False
+    
+    def on_mouse_motion(self, x, y, dx, dy):
+        if not self.replay:
+            self.mouse_x = x
+            self.mouse_y = y
+    
+    def on_draw(self):
+        timer = self.timer
+        if timer:
+            timer.start(2)
+        self.clear()
+        w, h = self.window.width, self.window.height
+        left, right, bottom, top = self.follow(w, h)
+        view = (left - 64, right + 64, bottom - 64, top + 64)
+        self.camera.use()
+        
+        arcade.draw_lrbt_rectangle_filled(0, self.world_width, 0, self.world_height, self.background)
+        if self.batched:
+            self.draw_static(max(0, left), min(self.world_width, right) - 1, max(0, bottom), min(self.world_height, top) - 1)
+        else:
+            x1, y1 = max(0, int(left + 25) // 50 * 50), max(0, int(bottom + 25) // 50 * 50)
+            for i in range(x1, min(self.world_width, int(right) + 26), 50):
+                for j in range(y1, min(self.world_height, int(top) + 26), 50):
+                    arcade.draw_lrbt_rectangle_outline(i - 25, i + 25, j - 25, j + 25, (255,255,255,20), 1)
             
-            if not bullet.active:
-                self.enemy_bullets.remove(bullet)
+            for wall in self.wall_grid.in_region(*view):
+                wall.draw()
+        if timer:
+            timer.mark("draw_world")
+        
+        if self.batched:
+            self.renderer.sync(self, view)
+            self.renderer.blood.draw()
+        else:
+            for blood in self.blood_effects:
+                if view[0] < blood.x < view[1] and view[2] < blood.y < view[3]:
+                    blood.draw()
+        if timer:
+            timer.mark("draw_blood")
+        
+        if self.batched:
+            self.renderer.draw_particles(self.particles)
+        else:
+            self.particles.draw()
+        if timer:
+            timer.mark("draw_particles")
         
-        for bullet in self.bullets[:]:
-            bullet.update(self.walls)
+        if self.batched:
+            self.renderer.draw()
+        else:
+            for enemy in self.enemies_in(*view):
+                enemy.draw(self.alpha)
             
-            for enemy in self.enemies:
-                if enemy.alive:
-                    bx1, bx2, by1, by2 = bullet.get_hitbox()
-                    ex1, ex2, ey1, ey2 = enemy.get_hitbox()
-                    
-                    if (bx1 < ex2 and bx2 > ex1 and by1 < ey2 and by2 > ey1):
-                        if enemy.take_damage(bullet.damage):
-                            self.kills += 1
-                            self.score += 100
-                            self.blood_effects.append(BloodEffect(enemy.x, enemy.y))
-                            
-                            try:
-                                s = arcade.Sound(":resources:sounds/hit3.wav")
-                                s.play(volume=0.1)
-                            except:
-                                pass
-                        
-                        bullet.active = False
-                        break
+            self.projectiles.draw(self.alpha, view)
             
-            if not bullet.active:
-                self.bullets.remove(bullet)
+            for player in self.team():
+                player.draw(self.alpha)
+        
+        for x1, y1, x2, y2, ttl in self.tracers:
+            arcade.draw_line(x1, y1, x2, y2, (255, 255, 255, 255 * ttl // RAIL_TRACE), 3)
+        if self.player:
+            px, py = self.player.lerp(self.alpha)
+            arcade.draw_line(px, py, *self.to_world(self.mouse_x, self.mouse_y), COLORS[0], 1)
+        if timer:
+            timer.mark("draw_entities")
         
-        for particle in self.particles[:]:
-            if not particle.update():
-                self.particles.remove(particle)
+        self.window.default_camera.use()
+        hud = self.hud
+        if self.horde:
+            hud.text("level", f"ВЫЖИВАНИЕ | ВОЛНА {self.horde.wave}", 100, h-50, COLORS[self.horde.wave % len(COLORS)], 24, bold=True)
+            if self.horde.limit is not None:
+                hud.text("limit", f"ТАКТ НЕ УКЛАДЫВАЕТСЯ С {self.horde.limit} ВРАГОВ", w-100, h-50, (255,255,0), 18, anchor_x="right")
+        else:
+            color = COLORS[(self.level - 1) % len(COLORS)] if isinstance(self.level, int) else COLORS[0]
+            hud.text("level", self.title, 100, h-50, color, 24, bold=True)
+        hud.text("enemies", f"ВРАГОВ: {self.alive_count}", 100, h-80, (255,255,255), 18)
+        hud.text("kills", f"УБИТО: {self.kills}", 100, h-110, (255,255,255), 18)
+        hud.text("weapon", f"ОРУЖИЕ: {WEAPON_NAMES[self.weapon]} | 1/2 - сменить", 100, 40, (255,255,255), 18)
+        if self.recorder:
+            hud.text("status", "● ЗАПИСЬ", 100, h-140, (255,0,0), 18)
+        elif self.replay:
+            desync = "" if self.replay.desync is None else f" | РАССИНХРОН НА ТАКТЕ {self.replay.desync}"
+            hud.text("status", f"▶ ПОВТОР {self.replay.tick}{desync}", 100, h-140, (255,255,0), 18)
         
-        alive_enemies = len([e for e in self.enemies if e.alive])
-        if alive_enemies == 0 and len(self.enemies) > 0:
-            self.win = True
-            self.menu.save(self.level)
-            
-            for _ in range(30):
-                self.particles.append(Particle(self.player.x, self.player.y, (0,255,0,255)))
+        if self.game_over:
+            hud.text("banner", "ТЫ УМЕР", w//2, h//2, (255,0,0), 72, anchor_x="center", anchor_y="center", bold=True)
+            hud.text("hint", self.HINTS[0], w//2, h//2-70, (255,255,255), 24, anchor_x="center")
+        elif self.win:
+            hud.text("banner", "УРОВЕНЬ ПРОЙДЕН!", w//2, h//2, (0,255,0), 72, anchor_x="center", anchor_y="center", bold=True)
+            hud.text("hint", self.HINTS[1], w//2, h//2-70, (255,255,255), 24, anchor_x="center")
+        if self.show_message:
+            hud.text("message", self.message, w//2, 80, (255,255,0), 18, anchor_x="center")
+        hud.draw()
+        
+        if timer:
+            timer.mark("draw_hud")
+            timer.draw(w, h)
+            timer.mark("draw_profiler")
+            timer.frame()
+    
+    def on_update(self, dt):
+        if self.replay:
+            self.replay.advance(self, dt)
+        else:
+            self.advance(dt)
+        for path, error in SaveWriter.report():
+            self.notify(f"НЕ УДАЛОСЬ СОХРАНИТЬ {os.path.basename(path)}")
+        if self.show_message:
+            self.message_timer -= dt
+            self.show_message = self.message_timer > 0
+        if self.win and isinstance(self.level, int) and self.upcoming is None and os.path.exists(LevelData.path_for(self.level + 1)):
+            self.upcoming = LevelLoader(self.level + 1, self.menu, warm=True)
+        if self.upcoming:
+            self.upcoming.poll()
+        if self.net:
+            self.net.poll(self)
+    
+    def on_hide(self):
+        if self.recorder:
+            self.stop_recording()
+    
+    def play_sound(self, name):
+        self.sounds.play(name)
     
     def on_key_press(self, key, mods):
         if key == arcade.key.W:
@@ -734,22 +3887,80 @@ class Level(arcade.View):
             self.keys[2] = True
         elif key == arcade.key.D:
             self.keys[3] = True
+        elif key in (arcade.key.KEY_1, arcade.key.KEY_2) and not self.replay:
+            self.switch(Simulation.BLASTER if key == arcade.key.KEY_1 else Simulation.RAIL)
         
-        elif key == arcade.key.R and self.game_over:
-            self.setup_level()
-            self.game_over = False
-            self.win = False
-            self.kills = 0
-            self.enemy_bullets = []
+        elif key == arcade.key.R and self.game_over and not self.replay:
+            self.restart()
             
         elif key == arcade.key.SPACE and self.win:
-            if self.level < 3:
-                self.window.show_view(Level(self.level + 1, self.menu))
+            if self.upcoming:
+                level = self.upcoming.take()
+                if self.net:
+                    self.net.attach(level)
+                self.window.show_view(level)
             else:
+                self.leave_session()
                 self.window.show_view(self.menu)
                 
         elif key == arcade.key.ESCAPE:
+            self.leave_session()
             self.window.show_view(self.menu)
+        
+        elif key == arcade.key.F3:
+            self.batched = not self.batched
+        elif key == arcade.key.F4:
+            if self.enemy_system:
+                self.enemy_system.store(self.enemies)
+                self.enemy_system = None
+            else:
+                self.enemy_system = EnemySystem()
+        elif key == arcade.key.F5:
+            if self.timer:
+                self.timer = None
+            else:
+                self.profiler = self.profiler or FrameProfiler()
+                self.timer = self.profiler
+        elif key == arcade.key.F6 and self.profiler:
+            self.profiler.export(time.strftime("trace_%Y%m%d_%H%M%S.json"))
+        elif key == arcade.key.F7 and not (self.replay or self.net):
+            if self.recorder:
+                self.stop_recording()
+            else:
+                self.start_recording()
+        elif key == arcade.key.F8 and not (self.recorder or self.net):
+            if self.replay:
+                self.replay.stop(self)
+            else:
+                SaveWriter.flush(REPLAY_DIR)
+                path = ReplayPlayer.latest()
+                if path:
+                    try:
+                        replay = ReplayPlayer.load(path)
+                    except (OSError, ValueError, struct.error, zlib.error):
+                        self.notify(f"ПОВТОР {os.path.basename(path)} ПОВРЕЖДЁН")
+                    else:
+                        replay.start(self)
+        elif key == arcade.key.F9:
+            self.quick = Snapshot(self)
+            self.quick.save()
+        elif key == arcade.key.F10 and not (self.recorder or self.replay or self.net):
+            if self.quick is None and os.path.exists(QUICK_SAVE):
+                try:
+                    self.quick = Snapshot.load()
+                except (OSError, ValueError, KeyError, TypeError, struct.error, zlib.error):
+                    self.notify("БЫСТРОЕ СОХРАНЕНИЕ ПОВРЕЖДЕНО")
+            if self.quick:
+                self.quick.restore(self)
+    
+    def notify(self, text):
+        self.message = text
+        self.message_timer = 3.0
+        self.show_message = True
+    
+    def leave_session(self):
+        if self.net:
+            self.net.close()
     
     def on_key_release(self, key, mods):
         if key == arcade.key.W:
@@ -762,16 +3973,70 @@ class Level(arcade.View):
             self.keys[3] = False
     
     def on_mouse_press(self, x, y, button, mods):
-        if button == arcade.MOUSE_BUTTON_LEFT and not self.game_over and not self.win:
-            if self.shoot_timer >= self.shoot_delay:
-                self.bullets.append(Bullet(self.player.x, self.player.y, x, y))
-                self.shoot_timer = 0
-                
-                try:
-                    s = arcade.Sound(":resources:sounds/laser1.wav")
-                    s.play(volume=0.1)
-                except:
-                    pass
+        if button == arcade.MOUSE_BUTTON_LEFT and not self.replay:
+            self.fire(*self.to_world(x, y))
+
+class ClientLevel(Replica, Level):
+    HINTS = ("ЖДЁМ ХОСТА | ESC - меню", "ЖДЁМ ХОСТА | ESC - меню")
+    
+    def __init__(self, level_num, menu, net):
+        Level.__init__(self, level_num, menu)
+        self.connect(net)
+    
+    def on_update(self, dt):
+        net = self.net
+        net.poll(self)
+        if net.closed:
+            net.close()
+            self.window.show_view(self.menu)
+        elif net.next:
+            self.window.show_view(ClientLevel(net.next[1], self.menu, net))
+        else:
+            self.advance(dt)
+    
+    def on_key_press(self, key, mods):
+        if key not in (arcade.key.R, arcade.key.SPACE, arcade.key.F7, arcade.key.F8, arcade.key.F9, arcade.key.F10):
+            super().on_key_press(key, mods)
+
+class LevelLoader:
+    def __init__(self, level_num, menu, warm=False):
+        self.level_num = level_num
+        self.menu = menu
+        self.warm = warm
+        self.level = None
+        self.steps = None
+        self.ready = False
+        self.error = None
+        self.thread = threading.Thread(target=self.fetch, daemon=True)
+        self.thread.start()
+    
+    def fetch(self):
+        try:
+            level = LevelCache.load(self.level_num)
+            if level.horde:
+                Horde.points(level, level.grid)
+        except Exception as e:
+            self.error = e
+    
+    def poll(self):
+        if self.ready or self.error or self.thread.is_alive():
+            return self.ready
+        if not self.warm:
+            self.ready = True
+        elif self.level is None:
+            self.level = Level(self.level_num, self.menu)
+            self.steps = self.level.warm()
+        elif next(self.steps, StopIteration) is StopIteration:
+            self.ready = True
+        return self.ready
+    
+    def take(self):
+        self.thread.join()
+        if self.error:
+            raise self.error
+        if self.level is None:
+            self.level = Level(self.level_num, self.menu)
+        return self.level
 
 class Menu(arcade.View):
     def __init__(self):
@@ -785,10 +4050,13 @@ class Menu(arcade.View):
         self.my = 0
         self.music = None
         self.current = None
+        self.shuffle = random.Random()
         self.bg = None
+        self.loaders = {}
+        self.ui = TextLayer()
         
-        if os.path.exists("lobby1.jpg"):
-            self.bg = arcade.load_texture("lobby1.jpg")
+        SoundBank.load()
+        self.bg = Assets.first("lobby")
         
         if os.path.exists("save.dat"):
             with open("save.dat", "r") as f:
@@ -813,7 +4081,7 @@ class Menu(arcade.View):
         tracks = ["hotline_miami2.mp3", "hotline_miami3.mp3"]
         avail = [t for t in tracks if t != self.current and os.path.exists(t)]
         if avail:
-            self.current = random.choice(avail)
+            self.current = self.shuffle.choice(avail)
             self.music = arcade.Sound(self.current, streaming=True)
             self.music.play(volume=0.15)
 
@@ -822,12 +4090,25 @@ class Menu(arcade.View):
             self.passed[level-1] = True
             if level == self.max_level and self.max_level < 3:
                 self.max_level += 1
-            with open("save.dat", "w") as f:
-                f.write(f"{self.max_level} " + " ".join(["1" if x else "0" for x in self.passed]))
+            SaveWriter.write("save.dat", (f"{self.max_level} " + " ".join(["1" if x else "0" for x in self.passed])).encode())
     
     def on_show(self):
         self.window.background_color = (0,0,0)
     
+    def on_update(self, dt):
+        for level in [*range(1, self.max_level + 1), HORDE_LEVEL]:
+            loader = self.loaders.get(level)
+            if loader is None:
+                if not os.path.exists(LevelData.path_for(level)):
+                    continue
+                loader = self.loaders[level] = LevelLoader(level, self)
+            if not loader.poll():
+                return
+    
+    def launch(self, level):
+        loader = self.loaders.pop(level, None)
+        return loader.take() if loader else Level(level, self)
+    
     def on_hide(self):
         if self.music:
             self.music.stop()
@@ -851,11 +4132,12 @@ class Menu(arcade.View):
         
         title = "PYLINE MIAMI"
         size = int(min(72, h * 0.09))
-        arcade.draw_text(title, w//2, h*0.8 + math.sin(self.t)*3, 
-                        COLORS[int(self.c)%len(COLORS)], size, anchor_x="center", anchor_y="center", bold=True)
+        ui = self.ui
+        ui.text("title", title, w//2, h*0.8 + math.sin(self.t)*3, 
+                COLORS[int(self.c)%len(COLORS)], size, anchor_x="center", anchor_y="center", bold=True)
         
         if self.show_levels:
-            arcade.draw_text("ВЫБЕРИТЕ УРОВЕНЬ", w//2, h*0.7, (255,255,255), 36, anchor_x="center", anchor_y="center", bold=True)
+            ui.text("choose", "ВЫБЕРИТЕ УРОВЕНЬ", w//2, h*0.7, (255,255,255), 36, anchor_x="center", anchor_y="center", bold=True)
             
             for i in range(3):
                 x = w//2 + (i-1)*250
@@ -884,8 +4166,8 @@ class Menu(arcade.View):
                 arcade.draw_lrbt_rectangle_outline(x - 100*mult, x + 100*mult, y - 30*mult, y + 30*mult, (255,255,255), 2)
                 
                 txt_color = (255,255,255) if unlocked else (100,100,100)
-                arcade.draw_text(f"{i+1}", x, y+5, txt_color, 20, anchor_x="center", anchor_y="center", bold=True)
-                arcade.draw_text(status, x, y-15, txt_color, 12, anchor_x="center", anchor_y="center")
+                ui.text(("level", i), f"{i+1}", x, y+5, txt_color, 20, anchor_x="center", anchor_y="center", bold=True)
+                ui.text(("status", i), status, x, y-15, txt_color, 12, anchor_x="center", anchor_y="center")
             
             back_x, back_y = w//2, 150
             back_hover = (back_x-75 <= self.mx <= back_x+75 and back_y-20 <= self.my <= back_y+20)
@@ -897,7 +4179,7 @@ class Menu(arcade.View):
             
             arcade.draw_lrbt_rectangle_filled(back_x - 75, back_x + 75, back_y - 20, back_y + 20, back_color)
             arcade.draw_lrbt_rectangle_outline(back_x - 75, back_x + 75, back_y - 20, back_y + 20, (255,255,255), 2)
-            arcade.draw_text("НАЗАД", back_x, back_y, (0,0,0) if back_hover else (255,255,255), 20, anchor_x="center", anchor_y="center", bold=True)
+            ui.text("back", "НАЗАД", back_x, back_y, (0,0,0) if back_hover else (255,255,255), 20, anchor_x="center", anchor_y="center", bold=True)
             
         else:
             play_x, play_y = w//2, h//2 + 30
@@ -910,9 +4192,21 @@ class Menu(arcade.View):
             
             arcade.draw_lrbt_rectangle_filled(play_x - 125, play_x + 125, play_y - 25, play_y + 25, play_color)
             arcade.draw_lrbt_rectangle_outline(play_x - 125, play_x + 125, play_y - 25, play_y + 25, (255,255,255), 3)
-            arcade.draw_text("ИГРАТЬ", play_x, play_y, (0,0,0) if play_hover else (255,255,255), 24, anchor_x="center", anchor_y="center", bold=True)
+            ui.text("play", "ИГРАТЬ", play_x, play_y, (0,0,0) if play_hover else (255,255,255), 24, anchor_x="center", anchor_y="center", bold=True)
+            
+            horde_x, horde_y = w//2, h//2 - 50
+            horde_hover = (horde_x-125 <= self.mx <= horde_x+125 and horde_y-25 <= self.my <= horde_y+25)
+            
+            if horde_hover:
+                horde_color = COLORS[int(self.t*2)%len(COLORS)]
+            else:
+                horde_color = (150, 150, 150, 200)
+            
+            arcade.draw_lrbt_rectangle_filled(horde_x - 125, horde_x + 125, horde_y - 25, horde_y + 25, horde_color)
+            arcade.draw_lrbt_rectangle_outline(horde_x - 125, horde_x + 125, horde_y - 25, horde_y + 25, (255,255,255), 3)
+            ui.text("horde", "ВЫЖИВАНИЕ", horde_x, horde_y, (0,0,0) if horde_hover else (255,255,255), 24, anchor_x="center", anchor_y="center", bold=True)
             
-            exit_x, exit_y = w//2, h//2 - 50
+            exit_x, exit_y = w//2, h//2 - 130
             exit_hover = (exit_x-125 <= self.mx <= exit_x+125 and exit_y-25 <= self.my <= exit_y+25)
             
             if exit_hover:
@@ -922,7 +4216,9 @@ class Menu(arcade.View):
             
             arcade.draw_lrbt_rectangle_filled(exit_x - 125, exit_x + 125, exit_y - 25, exit_y + 25, exit_color)
             arcade.draw_lrbt_rectangle_outline(exit_x - 125, exit_x + 125, exit_y - 25, exit_y + 25, (255,255,255), 3)
-            arcade.draw_text("ВЫХОД", exit_x, exit_y, (0,0,0) if exit_hover else (255,255,255), 24, anchor_x="center", anchor_y="center", bold=True)
+            ui.text("exit", "ВЫХОД", exit_x, exit_y, (0,0,0) if exit_hover else (255,255,255), 24, anchor_x="center", anchor_y="center", bold=True)
+        
+        ui.draw()
     
     def on_mouse_press(self, x, y, button, mods):
         if button != arcade.MOUSE_BUTTON_LEFT:
@@ -937,7 +4233,7 @@ class Menu(arcade.View):
                 unlocked = i+1 <= self.max_level
                 
                 if (bx-100 <= x <= bx+100 and by-30 <= y <= by+30 and unlocked):
-                    self.window.show_view(Level(i+1, self))
+                    self.window.show_view(self.launch(i+1))
                     return
             
             if (w//2-75 <= x <= w//2+75 and 150-20 <= y <= 150+20):
@@ -946,6 +4242,8 @@ class Menu(arcade.View):
             if (w//2-125 <= x <= w//2+125 and h//2+30-25 <= y <= h//2+30+25):
                 self.show_levels = True
             elif (w//2-125 <= x <= w//2+125 and h//2-50-25 <= y <= h//2-50+25):
+                self.window.show_view(self.launch(HORDE_LEVEL))
+            elif (w//2-125 <= x <= w//2+125 and h//2-130-25 <= y <= h//2-130+25):
                 arcade.exit()
     
     def on_key_press(self, key, mods):
@@ -957,9 +4255,99 @@ class Menu(arcade.View):
         elif key == arcade.key.F11:
             self.window.set_fullscreen(not self.window.fullscreen)
 
+class JoinView(arcade.View):
+    def __init__(self, menu, net):
+        super().__init__()
+        self.menu = menu
+        self.net = net
+        self.ui = TextLayer()
+    
+    def on_show(self):
+        self.window.background_color = (0,0,0)
+    
+    def on_update(self, dt):
+        self.net.poll()
+        if self.net.closed:
+            self.net.close()
+            self.window.show_view(self.menu)
+        elif self.net.next:
+            self.window.show_view(ClientLevel(self.net.next[1], self.menu, self.net))
+    
+    def on_draw(self):
+        self.clear()
+        w, h = self.window.width, self.window.height
+        host, port = self.net.address
+        self.ui.text("title", "ПОДКЛЮЧЕНИЕ", w//2, h//2 + 50, COLORS[0], 36, anchor_x="center", anchor_y="center", bold=True)
+        self.ui.text("address", f"{host}:{port}", w//2, h//2 - 10, (255,255,255), 18, anchor_x="center", anchor_y="center")
+        self.ui.text("hint", "ESC - меню", w//2, h//2 - 50, (255,255,255), 18, anchor_x="center", anchor_y="center")
+        self.ui.draw()
+    
+    def on_key_press(self, key, mods):
+        if key == arcade.key.ESCAPE:
+            self.net.close()
+            self.window.show_view(self.menu)
+
+class LoadingView(arcade.View):
+    def __init__(self, after=None):
+        super().__init__()
+        self.after = after
+        self.assets = Assets()
+        self.assets.start()
+        self.ui = TextLayer()
+    
+    def on_show(self):
+        self.window.background_color = (0,0,0)
+    
+    def on_update(self, dt):
+        if self.assets.error:
+            raise self.assets.error
+        self.assets.upload(self.window.ctx)
+        if self.assets.done():
+            self.window.show_view(self.after() if self.after else Menu())
+    
+    def on_draw(self):
+        self.clear()
+        w, h = self.window.width, self.window.height
+        progress = self.assets.progress()
+        self.ui.text("title", "ЗАГРУЗКА", w//2, h//2 + 50, COLORS[0], 36, anchor_x="center", anchor_y="center", bold=True)
+        arcade.draw_lrbt_rectangle_filled(w//2 - 200, w//2 - 200 + 400 * progress, h//2 - 10, h//2 + 10, COLORS[3])
+        arcade.draw_lrbt_rectangle_outline(w//2 - 200, w//2 + 200, h//2 - 10, h//2 + 10, (255,255,255), 2)
+        self.ui.text("progress", f"{int(progress * 100)}%", w//2, h//2 - 40, (255,255,255), 18, anchor_x="center", anchor_y="center")
+        self.ui.draw()
+
+def session(args):
+    menu = Menu()
+    if args.host:
+        link = NetLink(args.port, lag=args.lag / 1000, jitter=args.jitter / 1000, loss=args.loss)
+        return NetHost(link).attach(Level(args.level, menu))
+    if args.join:
+        host, _, port = args.join.partition(":")
+        link = NetLink(lag=args.lag / 1000, jitter=args.jitter / 1000, loss=args.loss)
+        return JoinView(menu, NetClient(link, (host, int(port or NET_PORT)), args.room))
+    return menu
+
 def main():
-    window = arcade.Window(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE, resizable=True)
-    window.show_view(Menu())
+    parser = argparse.ArgumentParser(description=SCREEN_TITLE)
+    parser.add_argument("--host", action="store_true", help="открыть кооп по LAN")
+    parser.add_argument("--join", metavar="HOST[:PORT]", help="подключиться к хосту")
+    parser.add_argument("--room", type=int, default=0, help="номер комнаты на выделенном сервере")
+    parser.add_argument("--server", action="store_true", help="выделенный сервер без окна")
+    parser.add_argument("--rooms", type=int, default=ROOM_COUNT)
+    parser.add_argument("--port", type=int, default=NET_PORT)
+    parser.add_argument("--level", type=lambda value: int(value) if value.isdigit() else value, default=1)
+    parser.add_argument("--lag", type=float, default=0, help="задержка исходящих пакетов, мс")
+    parser.add_argument("--jitter", type=float, default=0, help="разброс задержки, мс")
+    parser.add_argument("--loss", type=float, default=0, help="доля теряемых пакетов, 0..1")
+    args = parser.parse_args()
+    if args.server:
+        try:
+            asyncio.run(RoomServer(args.rooms, args.level).serve(port=args.port))
+        except KeyboardInterrupt:
+            pass
+        return
+    window = arcade.Window(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE, resizable=True,
+                           update_rate=1/RENDER_RATE, draw_rate=1/RENDER_RATE)
+    window.show_view(LoadingView(lambda: session(args)))
     arcade.run()
 
 if __name__ == "__main__":